@@ -10,6 +10,7 @@ from app.common.database.repositories import scores
 from app.common.cache import leaderboards
 from app.common.helpers import activity
 from app.common.constants import Mods
+from app.helpers.executors import ExecutorFull
 
 import app
 
@@ -837,13 +838,22 @@ def check(score: DBScore, session: Session, ignore_list: List[Achievement] = [])
         if achievement.filename in ignore_list:
             continue
 
-        results.append((
-            app.session.achievement_executor.submit(
+        try:
+            future = app.session.achievement_executor.submit(
+                achievement.category,
                 achievement.check,
                 score
-            ),
-            achievement
-        ))
+            )
+        except ExecutorFull:
+            # Executor is saturated, check the achievement inside of this thread instead
+            future = Future()
+
+            try:
+                future.set_result(achievement.check(score))
+            except Exception as e:
+                future.set_exception(e)
+
+        results.append((future, achievement))
 
     for future, achievement in results:
         try:
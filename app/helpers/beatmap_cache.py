@@ -0,0 +1,168 @@
+
+from app.common.database import DBBeatmap, beatmaps
+from app.helpers.caching import LRUCache
+from app.helpers import invalidation, metrics
+from app.common import officer
+from sqlalchemy.orm import Session
+from typing import Callable
+
+import threading
+import app
+
+# Beatmaps are resolved by their id, checksum or filename on most requests.
+# Each worker keeps the resolved beatmaps (including their beatmapset) in a
+# detached state, which get merged into the session of a request without
+# querying the database again. Beatmaps that could not be found are cached
+# for a shorter time, since clients keep asking for unsubmitted beatmaps.
+# Uploads & status changes publish the beatmapset id on the
+# "deck:beatmaps:invalidate" channel, or an empty message to reset the cache.
+# Other services don't publish their changes, so every worker periodically
+# compares the status & checksum of its cached beatmaps with the database.
+
+CHANNEL = 'deck:beatmaps:invalidate'
+EXPIRY = 60 * 5
+MISSING_EXPIRY = 60
+CAPACITY = 8192
+VALIDATION_INTERVAL = 30
+VALIDATION_BATCH_SIZE = 1000
+
+validation_thread: threading.Thread | None = None
+shutdown_event = threading.Event()
+
+# Beatmaps that don't exist are stored as "False"
+cache: LRUCache[tuple, DBBeatmap | bool] = LRUCache(CAPACITY, EXPIRY)
+
+def fetch_by_id(beatmap_id: int, session: Session | None = None) -> DBBeatmap | None:
+    return resolve(
+        ('id', beatmap_id),
+        lambda session: beatmaps.fetch_by_id(beatmap_id, session),
+        session
+    )
+
+def fetch_by_checksum(checksum: str, session: Session | None = None) -> DBBeatmap | None:
+    return resolve(
+        ('md5', checksum),
+        lambda session: beatmaps.fetch_by_checksum(checksum, session),
+        session
+    )
+
+def fetch_by_file(filename: str, session: Session | None = None) -> DBBeatmap | None:
+    return resolve(
+        ('file', filename),
+        lambda session: beatmaps.fetch_by_file(filename, session),
+        session
+    )
+
+def resolve(
+    key: tuple,
+    fetch: Callable[[Session], DBBeatmap | None],
+    session: Session | None
+) -> DBBeatmap | None:
+    if (beatmap := cache.get(key)) is not None:
+        metrics.count('beatmaps.hits')
+    else:
+        metrics.count('beatmaps.misses')
+        beatmap = load(key, fetch)
+
+    if beatmap is False:
+        return None
+
+    if session is None:
+        return beatmap
+
+    # Attach a copy of the cached beatmap to the session, without loading it again
+    return session.merge(beatmap, load=False)
+
+def load(key: tuple, fetch: Callable[[Session], DBBeatmap | None]) -> DBBeatmap | bool:
+    with app.session.database.managed_session() as session:
+        beatmap = fetch(session)
+
+        if beatmap is None:
+            cache.set(key, False, ttl=MISSING_EXPIRY)
+            return False
+
+        # Load the beatmapset before detaching the beatmap
+        beatmap.beatmapset
+        session.expunge_all()
+
+    cache.set(key, beatmap)
+    cache.set(('id', beatmap.id), beatmap)
+    cache.set(('md5', beatmap.md5), beatmap)
+    cache.set(('file', beatmap.filename), beatmap)
+    return beatmap
+
+def invalidate(beatmapset_id: int | None = None) -> None:
+    """Remove the beatmaps of a beatmapset, or all beatmaps, from the cache of every deck worker"""
+    invalidation.publish(CHANNEL, beatmapset_id or '')
+
+@invalidation.register(CHANNEL)
+def on_invalidate(message: str | None) -> None:
+    if message is None:
+        return cache.clear()
+
+    set_id = int(message)
+
+    # Uploads may add beatmaps that were cached as missing before
+    cache.remove_items_where(
+        lambda key, beatmap: beatmap is False or beatmap.set_id == set_id
+    )
+
+def start() -> None:
+    global validation_thread
+    shutdown_event.clear()
+    validation_thread = threading.Thread(
+        target=run,
+        name='deck-beatmap-cache',
+        daemon=True
+    )
+    validation_thread.start()
+
+def stop(timeout: float = 10) -> None:
+    shutdown_event.set()
+
+    if validation_thread is not None:
+        validation_thread.join(timeout)
+
+def run() -> None:
+    while not shutdown_event.wait(VALIDATION_INTERVAL):
+        try:
+            validate()
+        except Exception as e:
+            officer.call(f'Failed to validate beatmap cache: "{e}"', exc_info=e)
+
+def validate() -> int:
+    """Remove cached beatmaps, whose status or checksum was changed by other services"""
+    cached = {
+        beatmap.id: (beatmap.status, beatmap.md5)
+        for beatmap in cache.values()
+        if beatmap is not False
+    }
+
+    if not cached:
+        return 0
+
+    beatmap_ids = sorted(cached)
+    current = {}
+
+    with app.session.database.managed_session() as session:
+        for index in range(0, len(beatmap_ids), VALIDATION_BATCH_SIZE):
+            rows = session.query(DBBeatmap.id, DBBeatmap.status, DBBeatmap.md5) \
+                .filter(DBBeatmap.id.in_(beatmap_ids[index:index + VALIDATION_BATCH_SIZE])) \
+                .all()
+
+            current.update({
+                beatmap_id: (status, md5)
+                for beatmap_id, status, md5 in rows
+            })
+
+    stale = {
+        beatmap_id for beatmap_id, state in cached.items()
+        if current.get(beatmap_id) != state
+    }
+
+    if not stale:
+        return 0
+
+    return cache.remove_items_where(
+        lambda key, beatmap: beatmap is not False and beatmap.id in stale
+    )
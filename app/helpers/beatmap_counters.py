@@ -0,0 +1,120 @@
+
+from app.common.database import DBBeatmap
+from app.common import officer
+from sqlalchemy import update as sql_update, bindparam
+from sqlalchemy.orm import Session
+from typing import Dict, Tuple
+
+import threading
+import app
+
+# The play & pass counts of beatmaps are incremented inside of a redis hash,
+# instead of updating the beatmap row inside of every submission transaction,
+# where concurrent submissions on the same beatmap would wait for each other's
+# row lock. Every deck worker periodically takes all pending increments out of
+# the hash, and adds them to the beatmaps inside of a single statement.
+
+KEY = 'deck:beatmap_counters'
+FLUSH_INTERVAL = 5
+
+flusher_thread: threading.Thread | None = None
+shutdown_event = threading.Event()
+
+def increment(beatmap_id: int, passed: bool) -> None:
+    """Record a play on a beatmap, which will be written to the database on the next flush"""
+    pipeline = app.session.redis.pipeline()
+    pipeline.hincrby(KEY, f'{beatmap_id}:plays', 1)
+
+    if passed:
+        pipeline.hincrby(KEY, f'{beatmap_id}:passes', 1)
+
+    pipeline.execute()
+
+def fetch(beatmap_id: int, session: Session) -> Tuple[int, int]:
+    """Get the live play & pass count of a beatmap, including pending increments"""
+    playcount, passcount = session.query(DBBeatmap.playcount, DBBeatmap.passcount) \
+        .filter(DBBeatmap.id == beatmap_id) \
+        .one()
+
+    pending_plays, pending_passes = app.session.redis.hmget(
+        KEY,
+        [f'{beatmap_id}:plays', f'{beatmap_id}:passes']
+    )
+
+    return (
+        playcount + int(pending_plays or 0),
+        passcount + int(pending_passes or 0)
+    )
+
+def start() -> None:
+    global flusher_thread
+    shutdown_event.clear()
+    flusher_thread = threading.Thread(
+        target=run,
+        name='deck-beatmap-counters',
+        daemon=True
+    )
+    flusher_thread.start()
+
+def stop(timeout: float = 10) -> None:
+    shutdown_event.set()
+
+    if flusher_thread is not None:
+        flusher_thread.join(timeout)
+
+def run() -> None:
+    while not shutdown_event.wait(FLUSH_INTERVAL):
+        flush()
+
+    # Write remaining increments before shutting down
+    flush()
+
+def flush() -> int:
+    pipeline = app.session.redis.pipeline(transaction=True)
+    pipeline.hgetall(KEY)
+    pipeline.delete(KEY)
+
+    try:
+        entries, _ = pipeline.execute()
+    except Exception as e:
+        officer.call(f'Failed to fetch beatmap counters: "{e}"', exc_info=e)
+        return 0
+
+    if not entries:
+        return 0
+
+    increments: Dict[int, Dict[str, int]] = {}
+
+    for field, value in entries.items():
+        beatmap_id, counter = field.decode().split(':')
+        counters = increments.setdefault(int(beatmap_id), {'plays': 0, 'passes': 0})
+        counters[counter] = int(value)
+
+    try:
+        with app.session.database.managed_session() as session:
+            # Update the beatmaps in a fixed order, to avoid deadlocks between workers
+            session.connection().execute(
+                sql_update(DBBeatmap.__table__)
+                    .where(DBBeatmap.id == bindparam('beatmap_id'))
+                    .values(
+                        playcount=DBBeatmap.playcount + bindparam('plays'),
+                        passcount=DBBeatmap.passcount + bindparam('passes')
+                    ),
+                [
+                    {'beatmap_id': beatmap_id, **counters}
+                    for beatmap_id, counters in sorted(increments.items())
+                ]
+            )
+    except Exception as e:
+        officer.call(f'Failed to update beatmap counters: "{e}"', exc_info=e)
+
+        # Retry on the next flush
+        pipeline = app.session.redis.pipeline()
+
+        for field, value in entries.items():
+            pipeline.hincrby(KEY, field, int(value))
+
+        pipeline.execute()
+        return 0
+
+    return len(increments)
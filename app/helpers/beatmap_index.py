@@ -0,0 +1,411 @@
+
+from app.common.config import config_instance as config
+from app.common.database import DBBeatmap, DBBeatmapset
+from app.common import officer
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, List, Tuple
+
+import threading
+import hashlib
+import numpy
+import fcntl
+import json
+import mmap
+import time
+import app
+import os
+
+# The status requests of clients, e.g. "osu-getstatus.php" & "osu-getbeatmapinfo.php"
+# contain up to 100 beatmaps, which get resolved through a memory-mapped index file
+# inside of the data path, instead of the database. The index contains sorted
+# arrays of the beatmap checksums, filename hashes & ids, which are shared between
+# all workers of a host through the page cache, and searched with binary searches.
+# One worker per host rebuilds the index periodically. Beatmaps that changed since
+# the last build, e.g. through the BSS, are stored inside of a redis hash, which
+# takes precedence over the index file.
+
+INDEX_PATH = f'{config.DATA_PATH}/beatmap_index.bin'
+LOCK_PATH = f'{config.DATA_PATH}/beatmap_index.lock'
+MAGIC = b'DECKIDX1'
+
+DELTA_KEY = 'deck:beatmap_index:delta'
+DELTA_EXPIRY = 60 * 60 * 24
+
+REFRESH_INTERVAL = 60 * 10
+CHECK_INTERVAL = 5
+BUILD_BATCH_SIZE = 10_000
+
+RECORD_DTYPE = numpy.dtype([
+    ('id', '<i8'),
+    ('set_id', '<i8'),
+    ('topic_id', '<i8'),
+    ('status', '<i2'),
+    ('is_ranked', '?')
+])
+
+@dataclass(slots=True)
+class IndexedBeatmap:
+    id: int
+    set_id: int
+    md5: str
+    status: int
+    is_ranked: bool
+    topic_id: int | None
+
+    @classmethod
+    def from_beatmap(cls, beatmap: DBBeatmap) -> "IndexedBeatmap":
+        return cls(
+            id=beatmap.id,
+            set_id=beatmap.set_id,
+            md5=beatmap.md5,
+            status=beatmap.status,
+            is_ranked=beatmap.is_ranked,
+            topic_id=beatmap.beatmapset.topic_id
+        )
+
+class BeatmapIndex:
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.buffer[:8] != MAGIC:
+            raise ValueError('Invalid beatmap index file')
+
+        header_size = int.from_bytes(self.buffer[8:16], 'little')
+        header = json.loads(self.buffer[16:16 + header_size])
+        self.built_at: float = header['built_at']
+        self.arrays: Dict[str, numpy.ndarray] = {
+            name: numpy.frombuffer(
+                self.buffer,
+                dtype=parse_dtype(array['dtype']),
+                count=array['count'],
+                offset=array['offset']
+            )
+            for name, array in header['arrays'].items()
+        }
+
+    def __repr__(self) -> str:
+        return f'<BeatmapIndex ({len(self)} beatmaps)>'
+
+    def __len__(self) -> int:
+        return len(self.arrays['md5'])
+
+    def search(self, keys_name: str, keys: numpy.ndarray) -> numpy.ndarray:
+        """Resolve the record rows of the given keys, or -1 if they don't exist"""
+        sorted_keys = self.arrays[keys_name]
+
+        if not len(sorted_keys):
+            return numpy.full(len(keys), -1)
+
+        positions = numpy.searchsorted(sorted_keys, keys)
+        positions = numpy.minimum(positions, len(sorted_keys) - 1)
+        found = sorted_keys[positions] == keys
+        rows = positions if keys_name == 'md5' else self.arrays[f'{keys_name}_rows'][positions]
+        return numpy.where(found, rows, -1)
+
+    def record(self, row: int) -> IndexedBeatmap:
+        record = self.arrays['records'][row]
+        return IndexedBeatmap(
+            id=int(record['id']),
+            set_id=int(record['set_id']),
+            md5=self.arrays['md5'][row].hex(),
+            status=int(record['status']),
+            is_ranked=bool(record['is_ranked']),
+            topic_id=int(record['topic_id']) or None
+        )
+
+index: BeatmapIndex | None = None
+index_mtime = 0.0
+index_checked_at = 0.0
+index_lock = threading.Lock()
+
+refresh_thread: threading.Thread | None = None
+shutdown_event = threading.Event()
+
+def parse_dtype(descr: str | list) -> numpy.dtype:
+    if isinstance(descr, str):
+        return numpy.dtype(descr)
+
+    # Structured dtypes are stored as a list of fields
+    return numpy.dtype([tuple(field) for field in descr])
+
+def filename_hash(filename: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(filename.encode(), digest_size=8).digest(),
+        'little'
+    )
+
+def checksum_digest(checksum: str) -> bytes | None:
+    try:
+        digest = bytes.fromhex(checksum)
+    except ValueError:
+        return None
+
+    return digest if len(digest) == 16 else None
+
+def current_index() -> BeatmapIndex | None:
+    """Get the current index, and reopen it if it was rebuilt in the meantime"""
+    global index, index_mtime, index_checked_at
+
+    if time.monotonic() - index_checked_at < CHECK_INTERVAL:
+        return index
+
+    with index_lock:
+        index_checked_at = time.monotonic()
+
+        try:
+            mtime = os.stat(INDEX_PATH).st_mtime
+        except FileNotFoundError:
+            return index
+
+        if mtime == index_mtime:
+            return index
+
+        try:
+            index = BeatmapIndex(INDEX_PATH)
+            index_mtime = mtime
+        except Exception as e:
+            officer.call(f'Failed to open beatmap index: "{e}"', exc_info=e)
+
+        return index
+
+def fetch_by_checksums(checksums: Iterable[str]) -> Dict[str, IndexedBeatmap] | None:
+    """Resolve beatmaps by their checksum, or None if the index is not available"""
+    keys = {
+        checksum: digest
+        for checksum in checksums
+        if (digest := checksum_digest(checksum)) is not None
+    }
+    return lookup('md5', keys, numpy.dtype('S16'))
+
+def fetch_by_filenames(filenames: Iterable[str]) -> Dict[str, IndexedBeatmap] | None:
+    keys = {filename: filename_hash(filename) for filename in filenames}
+    return lookup('filename', keys, numpy.dtype('<u8'))
+
+def fetch_by_ids(ids: Iterable[int]) -> Dict[int, IndexedBeatmap] | None:
+    keys = {beatmap_id: beatmap_id for beatmap_id in ids}
+    return lookup('id', keys, numpy.dtype('<i8'))
+
+def lookup(keys_name: str, keys: dict, dtype: numpy.dtype) -> dict | None:
+    if (current := current_index()) is None:
+        return None
+
+    if not keys:
+        return {}
+
+    results = {}
+    remaining = []
+
+    for key, delta in zip(keys, fetch_delta(keys_name, keys)):
+        if delta is None or delta['updated_at'] < current.built_at:
+            remaining.append(key)
+            continue
+
+        if not delta.get('deleted'):
+            del delta['updated_at']
+            results[key] = IndexedBeatmap(**delta)
+
+    if not remaining:
+        return results
+
+    search_keys = numpy.array([keys[key] for key in remaining], dtype=dtype)
+    rows = current.search(keys_name, search_keys)
+
+    for key, row in zip(remaining, rows):
+        if row >= 0:
+            results[key] = current.record(int(row))
+
+    return results
+
+def fetch_delta(keys_name: str, keys: Iterable) -> List[dict | None]:
+    values = app.session.redis.hmget(
+        DELTA_KEY,
+        [f'{keys_name}:{key}' for key in keys]
+    )
+    return [json.loads(value) if value else None for value in values]
+
+def delta_records(beatmaps: Iterable[DBBeatmap], removed: Iterable[Tuple[str, str, int]] = ()) -> Dict[str, dict]:
+    """Resolve the delta records of changed beatmaps, which are stored until the next index build
+
+    Removed beatmaps are given as (checksum, filename, id), e.g. for old checksums of
+    updated beatmaps, or beatmaps that got deleted. The records get resolved inside of
+    the transaction, and written with "write_delta" once it was committed.
+    """
+    records: Dict[str, dict] = {}
+
+    for checksum, filename, beatmap_id in removed:
+        if checksum:
+            records[f'md5:{checksum}'] = {'deleted': True}
+
+        if filename:
+            records[f'filename:{filename}'] = {'deleted': True}
+
+        if beatmap_id:
+            records[f'id:{beatmap_id}'] = {'deleted': True}
+
+    for beatmap in beatmaps:
+        record = asdict(IndexedBeatmap.from_beatmap(beatmap))
+        records[f'md5:{beatmap.md5}'] = record
+        records[f'filename:{beatmap.filename}'] = record
+        records[f'id:{beatmap.id}'] = record
+
+    return records
+
+def write_delta(records: Dict[str, dict]) -> None:
+    if not records:
+        return
+
+    # Records are timestamped on write, since index builds
+    # that started before the commit must not discard them
+    now = time.time()
+
+    fields = {
+        field: json.dumps({**record, 'updated_at': now})
+        for field, record in records.items()
+    }
+
+    pipeline = app.session.redis.pipeline()
+    pipeline.hset(DELTA_KEY, mapping=fields)
+    pipeline.expire(DELTA_KEY, DELTA_EXPIRY)
+    pipeline.execute()
+
+def start() -> None:
+    global refresh_thread
+    shutdown_event.clear()
+    refresh_thread = threading.Thread(
+        target=run,
+        name='deck-beatmap-index',
+        daemon=True
+    )
+    refresh_thread.start()
+
+def stop(timeout: float = 5) -> None:
+    shutdown_event.set()
+
+    if refresh_thread is not None:
+        refresh_thread.join(timeout)
+
+def run() -> None:
+    while not shutdown_event.is_set():
+        try:
+            refresh()
+        except Exception as e:
+            officer.call(f'Failed to refresh beatmap index: "{e}"', exc_info=e)
+
+        shutdown_event.wait(60)
+
+def refresh() -> None:
+    """Rebuild the index, if it's outdated and no other worker is building it"""
+    try:
+        age = time.time() - os.stat(INDEX_PATH).st_mtime
+    except FileNotFoundError:
+        age = float('inf')
+
+    if age < REFRESH_INTERVAL:
+        return
+
+    with open(LOCK_PATH, 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another worker is already building the index
+            return
+
+        build()
+
+def build() -> None:
+    app.session.logger.info('Building beatmap index...')
+    built_at = time.time()
+    is_ranked_lookup: Dict[int, bool] = {}
+    rows: List[tuple] = []
+
+    with app.session.database.managed_session() as session:
+        query = session.query(
+                DBBeatmap.id,
+                DBBeatmap.set_id,
+                DBBeatmap.md5,
+                DBBeatmap.filename,
+                DBBeatmap.status,
+                DBBeatmapset.topic_id
+            ) \
+            .join(DBBeatmapset, DBBeatmapset.id == DBBeatmap.set_id) \
+            .yield_per(BUILD_BATCH_SIZE)
+
+        for beatmap_id, set_id, md5, filename, status, topic_id in query:
+            if not (digest := checksum_digest(md5 or '')):
+                continue
+
+            if status not in is_ranked_lookup:
+                # Resolve the ranked state through the model, to stay consistent with it
+                is_ranked_lookup[status] = bool(DBBeatmap(status=status).is_ranked)
+
+            rows.append((
+                digest,
+                filename_hash(filename or ''),
+                beatmap_id, set_id,
+                topic_id or 0, status,
+                is_ranked_lookup[status]
+            ))
+
+    rows.sort(key=lambda row: row[0])
+    md5s = numpy.array([row[0] for row in rows], dtype='S16')
+    filenames = numpy.array([row[1] for row in rows], dtype='<u8')
+    records = numpy.array([row[2:] for row in rows], dtype=RECORD_DTYPE)
+
+    filename_rows = numpy.argsort(filenames, kind='stable').astype('<i4')
+    id_rows = numpy.argsort(records['id'], kind='stable').astype('<i4')
+
+    write({
+        'md5': md5s,
+        'records': records,
+        'filename': filenames[filename_rows],
+        'filename_rows': filename_rows,
+        'id': numpy.ascontiguousarray(records['id'][id_rows]),
+        'id_rows': id_rows
+    }, built_at)
+
+    cleanup_delta(built_at)
+    app.session.logger.info(f'Beatmap index was built with {len(rows)} beatmaps.')
+
+def write(arrays: Dict[str, numpy.ndarray], built_at: float) -> None:
+    header = {'built_at': built_at, 'arrays': {}}
+    header_size = 4096
+    offset = 16 + header_size
+
+    for name, array in arrays.items():
+        # Align every array to 64 bytes
+        offset += -offset % 64
+        header['arrays'][name] = {
+            'dtype': array.dtype.descr if array.dtype.names else array.dtype.str,
+            'count': len(array),
+            'offset': offset
+        }
+        offset += array.nbytes
+
+    header_data = json.dumps(header).encode()
+    assert len(header_data) <= header_size, 'Beatmap index header is too large'
+
+    temporary_path = f'{INDEX_PATH}.{os.getpid()}.tmp'
+
+    with open(temporary_path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(len(header_data).to_bytes(8, 'little'))
+        file.write(header_data)
+
+        for name, array in arrays.items():
+            file.seek(header['arrays'][name]['offset'])
+            file.write(array.tobytes())
+
+    # Workers that still use the previous index keep their mapping
+    os.replace(temporary_path, INDEX_PATH)
+
+def cleanup_delta(built_at: float) -> None:
+    """Remove delta entries, which are now part of the index"""
+    outdated = [
+        field
+        for field, value in app.session.redis.hscan_iter(DELTA_KEY, count=1000)
+        if json.loads(value)['updated_at'] < built_at
+    ]
+
+    for offset in range(0, len(outdated), 1000):
+        app.session.redis.hdel(DELTA_KEY, *outdated[offset:offset + 1000])
@@ -1,12 +1,12 @@
 
-from typing import Dict, List, Tuple, Iterable
+from typing import Callable, Dict, List, Tuple, Iterable
 from zipfile import ZipFile, ZipInfo
 from slider.events import EventType
 from sqlalchemy.orm import Session
 from collections import Counter
 from datetime import datetime
 from fastapi import Response
-from sqlalchemy import func
+from sqlalchemy import event, func
 from slider import Beatmap
 from osz2 import *
 
@@ -14,14 +14,14 @@ from .bss_decorators import *
 from .bss_tickets import *
 from .bss_osz2 import *
 
-from app.common.helpers import activity, performance, permissions as permissions_helper
+from app.common.helpers import activity, performance
 from app.common.constants import UserActivity, BeatmapGenre, BeatmapLanguage
 from app.common.database.repositories import *
 from app.common.database.objects import *
 from app.common.config import config_instance as config
 from app.common.cache import status
 from app.common import officer
-from app.helpers import bss
+from app.helpers import beatmap_cache, beatmap_index, bss, performance_cache, permission_cache, rank_index
 from app import utils
 
 import urllib.parse
@@ -84,7 +84,7 @@ def authenticate_user(
         app.session.logger.warning(f'Failed to authenticate user: User is not connected to bancho')
         return error_response(5, 'You are not connected to bancho, please try again!', legacy), None
 
-    if not permissions_helper.has_permission("beatmaps.upload", player.id):
+    if not permission_cache.has_permission("beatmaps.upload", player.id):
         app.session.logger.warning(f'Failed to authenticate user: User lacks beatmap upload permission')
         return error_response(5, 'You do not have permission to upload beatmaps.', legacy), None
 
@@ -122,6 +122,29 @@ def bancho_message(message: str, user: DBUser) -> Response:
     )
     return Response(message, 400)
 
+def after_commit(session: Session, callback: Callable, *args) -> None:
+    """Run a side effect once the transaction of the session was committed, and drop it on rollback"""
+    finished = False
+
+    @event.listens_for(session, 'after_commit', once=True)
+    def on_commit(session: Session) -> None:
+        nonlocal finished
+
+        if finished:
+            return
+
+        finished = True
+
+        try:
+            callback(*args)
+        except Exception as e:
+            officer.call(f'Failed to run "{callback.__name__}" after commit: "{e}"', exc_info=e)
+
+    @event.listens_for(session, 'after_rollback', once=True)
+    def on_rollback(session: Session) -> None:
+        nonlocal finished
+        finished = True
+
 def is_full_submit(set_id: int, osz2_hash: str) -> bool:
     """Determine if the client should upload the full osz2 or a patch file"""
     if not config.BEATMAP_SUBMISSION_STORE_OSZ2:
@@ -270,6 +293,17 @@ def update_beatmap_metadata(
     ])
     assert len(beatmap_ids) >= len(beatmap_data), "More beatmaps provided than expected"
 
+    # Checksums of the current beatmaps, to clear
+    # the cached performance results on changes
+    previous_checksums = {
+        beatmap.id: beatmap.md5
+        for beatmap in beatmapset.beatmaps
+    }
+    previous_filenames = {
+        beatmap.id: beatmap.filename
+        for beatmap in beatmapset.beatmaps
+    }
+
     # Before updating the beatmap metadata, we first have to
     # assign all beatmap IDs, such that the IDs won't be shuffled
     pre_assigned_ids = []
@@ -308,6 +342,7 @@ def update_beatmap_metadata(
         count_spinner = len(beatmap.hit_objects(spinners=True, circles=False, sliders=False))
 
         assert beatmap.beatmap_id is not None, "Beatmap ID is None" # should never happen, we pre-assigned all IDs above
+        beatmap_checksum = hashlib.md5(beatmap_files[filename].content).hexdigest()
 
         beatmaps.update(
             beatmap.beatmap_id,
@@ -315,7 +350,7 @@ def update_beatmap_metadata(
                 'status': status,
                 'filename': filename,
                 'last_update': datetime.now(),
-                'md5': hashlib.md5(beatmap_files[filename].content).hexdigest(),
+                'md5': beatmap_checksum,
                 'bpm': bss.calculate_beatmap_median_bpm(beatmap),
                 'drain_length': round(bss.calculate_beatmap_drain_length(beatmap) / 1000),
                 'total_length': round(bss.calculate_beatmap_total_length(beatmap) / 1000),
@@ -335,13 +370,30 @@ def update_beatmap_metadata(
             session=session
         )
 
+        if (previous_checksum := previous_checksums.get(beatmap.beatmap_id)) not in (None, beatmap_checksum):
+            performance_cache.invalidate(previous_checksum)
+
     # Refresh beatmapset object & check for
     # remaining inactive beatmaps
     session.refresh(beatmapset)
+    active_beatmaps = []
+
+    # Old checksums & filenames should not resolve to the updated beatmaps anymore
+    removed_beatmaps = [
+        (previous_checksums[beatmap_id], previous_filenames[beatmap_id], 0)
+        for beatmap_id in previous_checksums
+    ]
 
     for beatmap in beatmapset.beatmaps:
         if beatmap.status == -3:
             # Remove inactive beatmap
+            removed_beatmaps.append((beatmap.md5, beatmap.filename, beatmap.id))
+
+            if beatmap.md5:
+                performance_cache.invalidate(beatmap.md5)
+
+            rank_index.remove(beatmap.id)
+
             plays.delete_by_beatmap_id(beatmap.id, session=session)
             beatmaps.delete_by_id(beatmap.id, session=session)
             continue
@@ -356,12 +408,17 @@ def update_beatmap_metadata(
         eyup_difficulty = round(eyup_difficulty, 4)
         eyup_difficulty = float(eyup_difficulty)
         beatmaps.update(beatmap.id, {'diff_eyup': eyup_difficulty}, session=session)
+        active_beatmaps.append(beatmap)
 
     if is_bubbled(beatmapset, session):
         # Bubble should be popped when the beatmap
         # gets updated. It will re-gain 5 star priority
         pop_bubble(beatmapset, session)
 
+    # Remove outdated beatmaps from the cache of all workers, once the update is visible to them
+    after_commit(session, beatmap_cache.invalidate, beatmapset.id)
+    after_commit(session, beatmap_index.write_delta, beatmap_index.delta_records(active_beatmaps, removed_beatmaps))
+
 def update_beatmap_thumbnail(
     beatmapset: DBBeatmapset,
     beatmaps: Dict[str, Beatmap],
@@ -629,6 +686,12 @@ def delete_inactive_beatmaps(user: DBUser, session: Session) -> None:
             f'Found {len(inactive_sets)} inactive beatmapsets'
         )
 
+        removed_beatmaps = [
+            (beatmap.md5, beatmap.filename, beatmap.id)
+            for set in inactive_sets
+            for beatmap in set.beatmaps
+        ]
+
         # Remove assets from storage
         for set in inactive_sets:
             app.session.storage.remove_osz2(set.id)
@@ -658,6 +721,11 @@ def delete_inactive_beatmaps(user: DBUser, session: Session) -> None:
             session=session
         )
 
+        for set in inactive_sets:
+            after_commit(session, beatmap_cache.invalidate, set.id)
+
+        after_commit(session, beatmap_index.write_delta, beatmap_index.delta_records((), removed_beatmaps))
+
         # Hide beatmap topic
         for set in inactive_sets:
             if set.topic_id is None:
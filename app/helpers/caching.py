@@ -0,0 +1,91 @@
+
+from typing import Callable, Generic, Hashable, TypeVar
+from collections import OrderedDict
+from threading import Lock
+
+import time
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+class LRUCache(Generic[K, V]):
+    """Thread-safe in-process cache, that evicts the least recently used entries
+
+    Entries can optionally expire after `ttl` seconds, which is useful for
+    values that may be changed by other services or other deck workers.
+    """
+
+    def __init__(self, capacity: int, ttl: float | None = None) -> None:
+        self.capacity = capacity
+        self.ttl = ttl
+        self.entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        with self.lock:
+            if (entry := self.entries.get(key)) is None:
+                return default
+
+            expires_at, value = entry
+
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return default
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else float('inf')
+
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def values(self) -> list[V]:
+        """Get a snapshot of all entries that didn't expire yet"""
+        now = time.monotonic()
+
+        with self.lock:
+            return [value for expires_at, value in self.entries.values() if expires_at >= now]
+
+    def pop(self, key: K) -> V | None:
+        with self.lock:
+            if (entry := self.entries.pop(key, None)) is None:
+                return None
+
+            return entry[1]
+
+    def remove_where(self, predicate: Callable[[K], bool]) -> int:
+        """Remove all entries with a key matching the predicate"""
+        with self.lock:
+            keys = [key for key in self.entries if predicate(key)]
+
+            for key in keys:
+                del self.entries[key]
+
+            return len(keys)
+
+    def remove_items_where(self, predicate: Callable[[K, V], bool]) -> int:
+        """Remove all entries with a key & value matching the predicate"""
+        with self.lock:
+            keys = [key for key, (_, value) in self.entries.items() if predicate(key, value)]
+
+            for key in keys:
+                del self.entries[key]
+
+            return len(keys)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
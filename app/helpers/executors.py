@@ -0,0 +1,239 @@
+
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from redis.client import Pipeline
+from typing import Callable, List
+
+from app.helpers import metrics
+
+import threading
+import queue
+import time
+import app
+
+# Executors with a bounded queue, which record the wait & run time of every
+# task type, as well as the queue depth at submission.
+# Tasks that don't fit into the queue are either rejected with "ExecutorFull",
+# or handed to the "spill" callback of the submission, e.g. to move them back
+# into the redis task stream. On shutdown, the executor will stop accepting
+# tasks and drain its queue until the deadline, after which the remaining
+# tasks get spilled or cancelled.
+
+# Queue depth buckets
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Metrics are buffered inside of a pipeline, to
+# avoid a redis roundtrip for every single task
+METRICS_BATCH_SIZE = 1000
+METRICS_INTERVAL = 5
+
+DRAIN_TIMEOUT = 10
+
+class ExecutorFull(Exception):
+    """Raised when a task was rejected by the executor"""
+
+@dataclass
+class Task:
+    task_type: str
+    function: Callable
+    args: tuple
+    spill: Callable | None
+    future: Future = field(default_factory=Future)
+    queued_at: float = field(default_factory=time.monotonic)
+
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, max_queue: int) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self.queue: queue.Queue[Task] = queue.Queue(max_queue)
+        self.workers: List[threading.Thread] = []
+        self.lock = threading.Lock()
+        self.closed = False
+
+        self.metrics_lock = threading.Lock()
+        self.metrics_buffer: Pipeline | None = None
+        self.metrics_flushed_at = time.monotonic()
+
+    def __repr__(self) -> str:
+        return f'<BoundedExecutor "{self.name}" ({self.depth}/{self.queue.maxsize})>'
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def submit(
+        self,
+        task_type: str,
+        function: Callable,
+        *args,
+        spill: Callable | None = None
+    ) -> Future:
+        """Submit a task to the executor
+
+        If the queue is full, the arguments of the task are passed to "spill",
+        and the returned future resolves to None. Without a spill callback,
+        "ExecutorFull" will be raised instead.
+        """
+        task = Task(task_type, function, args, spill)
+        self.record_depth()
+
+        if self.closed:
+            return self.reject(task, 'executor is shutting down')
+
+        self.start_workers()
+
+        try:
+            self.queue.put_nowait(task)
+        except queue.Full:
+            return self.reject(task, 'queue is full')
+
+        return task.future
+
+    def reject(self, task: Task, reason: str) -> Future:
+        if task.spill is None:
+            self.record(task.task_type, 'rejected')
+            raise ExecutorFull(f'Executor "{self.name}" rejected "{task.task_type}" task: {reason}')
+
+        task.spill(*task.args)
+        task.future.set_result(None)
+        self.record(task.task_type, 'spilled')
+        self.flush_metrics(force=False)
+        return task.future
+
+    def start_workers(self) -> None:
+        if len(self.workers) >= self.max_workers:
+            return
+
+        with self.lock:
+            while len(self.workers) < self.max_workers:
+                worker = threading.Thread(
+                    target=self.work,
+                    name=f'deck-{self.name}-{len(self.workers)}',
+                    daemon=True
+                )
+                worker.start()
+                self.workers.append(worker)
+
+    def work(self) -> None:
+        while True:
+            try:
+                task = self.queue.get(timeout=1)
+            except queue.Empty:
+                if self.closed:
+                    return
+                continue
+
+            try:
+                self.run(task)
+            finally:
+                self.queue.task_done()
+
+    def run(self, task: Task) -> None:
+        if not task.future.set_running_or_notify_cancel():
+            return
+
+        started_at = time.monotonic()
+
+        try:
+            result = task.function(*task.args)
+        except BaseException as e:
+            task.future.set_exception(e)
+            self.record(task.task_type, 'failed')
+        else:
+            task.future.set_result(result)
+            self.record(task.task_type, 'completed')
+
+        finished_at = time.monotonic()
+        self.observe(f'{task.task_type}.wait.milliseconds', (started_at - task.queued_at) * 1000)
+        self.observe(f'{task.task_type}.run.milliseconds', (finished_at - started_at) * 1000)
+        self.flush_metrics(force=False)
+
+    def drain(self, timeout: float = DRAIN_TIMEOUT) -> None:
+        """Stop accepting tasks, and wait for the queue to finish until the deadline"""
+        self.closed = True
+        deadline = time.monotonic() + timeout
+
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        remaining: List[Task] = []
+
+        while True:
+            try:
+                task = self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+            self.queue.task_done()
+            remaining.append(task)
+
+        for task in remaining:
+            if task.spill is None:
+                task.future.cancel()
+                self.record(task.task_type, 'cancelled')
+                continue
+
+            try:
+                self.reject(task, 'executor is shutting down')
+            except Exception as e:
+                task.future.set_exception(e)
+
+        if remaining:
+            app.session.logger.warning(
+                f'Executor "{self.name}" did not finish {len(remaining)} tasks in time'
+            )
+
+        # Workers will exit after their current task
+        for worker in self.workers:
+            worker.join(max(0, deadline - time.monotonic()))
+
+        self.flush_metrics()
+
+    @property
+    def metrics_pipeline(self) -> Pipeline:
+        if self.metrics_buffer is None:
+            self.metrics_buffer = app.session.redis.pipeline(transaction=False)
+
+        return self.metrics_buffer
+
+    def record(self, task_type: str, outcome: str) -> None:
+        with self.metrics_lock:
+            metrics.increment(
+                f'executors.{self.name}.{task_type}.{outcome}',
+                pipeline=self.metrics_pipeline
+            )
+
+    def record_depth(self) -> None:
+        with self.metrics_lock:
+            metrics.observe(
+                f'executors.{self.name}.queue_depth',
+                self.depth,
+                self.metrics_pipeline,
+                DEPTH_BUCKETS
+            )
+
+    def observe(self, name: str, value: float) -> None:
+        with self.metrics_lock:
+            metrics.observe(
+                f'executors.{self.name}.{name}',
+                value,
+                self.metrics_pipeline
+            )
+
+    def flush_metrics(self, force: bool = True) -> None:
+        with self.metrics_lock:
+            is_due = (
+                len(self.metrics_pipeline) >= METRICS_BATCH_SIZE or
+                time.monotonic() - self.metrics_flushed_at >= METRICS_INTERVAL
+            )
+
+            if not force and not is_due:
+                return
+
+            try:
+                self.metrics_pipeline.execute()
+            except Exception as e:
+                app.session.logger.warning(f'Failed to record executor metrics: {e}')
+                self.metrics_pipeline.reset()
+
+            self.metrics_flushed_at = time.monotonic()
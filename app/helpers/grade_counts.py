@@ -0,0 +1,102 @@
+
+from app.common.database import DBStats, DBScore
+from app.common.database.repositories import scores
+from app.common.constants import Grade
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from typing import Dict
+
+import app
+
+# The grade counts of a player are the grades of their personal bests. Instead
+# of grouping over all personal bests after every submission, the counts are
+# updated with the grade of the new personal best, and the grade of the one it
+# replaced. The "reconcile-grade-counts" command recounts the grades of every
+# player from their scores, to repair any drift, e.g. from hidden scores.
+
+BATCH_SIZE = 1000
+
+COLUMNS = [
+    f'{grade.name.lower()}_count'
+    for grade in Grade
+    if hasattr(DBStats, f'{grade.name.lower()}_count')
+]
+
+def column(grade: str) -> str | None:
+    name = f'{grade.lower()}_count'
+    return name if name in COLUMNS else None
+
+def update(stats: DBStats, new_best: DBScore, previous_best: DBScore | None) -> None:
+    """Move a personal best from the grade of the previous personal best to its new grade"""
+    if previous_best is not None and (previous_column := column(previous_best.grade)):
+        setattr(stats, previous_column, max(getattr(stats, previous_column) - 1, 0))
+
+    if new_column := column(new_best.grade):
+        setattr(stats, new_column, getattr(stats, new_column) + 1)
+
+def transition(
+    user_id: int,
+    mode: int,
+    new_grade: str,
+    previous_grade: str | None,
+    session: Session
+) -> None:
+    """Same as "update", for stats that aren't locked by the current transaction"""
+    previous_column = column(previous_grade) if previous_grade is not None else None
+    new_column = column(new_grade)
+    updates = {}
+
+    if previous_column == new_column:
+        return
+
+    if previous_column:
+        updates[previous_column] = func.greatest(getattr(DBStats, previous_column) - 1, 0)
+
+    if new_column:
+        updates[new_column] = getattr(DBStats, new_column) + 1
+
+    session.query(DBStats) \
+        .filter(DBStats.user_id == user_id) \
+        .filter(DBStats.mode == mode) \
+        .update(updates, synchronize_session=False)
+
+def reconcile(session: Session) -> int:
+    """Recount the grades of every player and repair the stats that drifted"""
+    query = session.query(DBStats) \
+        .order_by(DBStats.user_id, DBStats.mode) \
+        .yield_per(BATCH_SIZE)
+
+    repaired = 0
+
+    for stats in query:
+        grades: Dict[str, int] = {
+            name.lower(): count
+            for name, count in scores.fetch_grades(
+                stats.user_id,
+                stats.mode,
+                session=session
+            ).items()
+        }
+
+        updates = {
+            name: grades.get(name.removesuffix('_count'), 0)
+            for name in COLUMNS
+            if getattr(stats, name) != grades.get(name.removesuffix('_count'), 0)
+        }
+
+        if not updates:
+            continue
+
+        app.session.logger.info(
+            f'Repairing grade counts of user {stats.user_id} in mode {stats.mode}: {updates}'
+        )
+
+        session.query(DBStats) \
+            .filter(DBStats.user_id == stats.user_id) \
+            .filter(DBStats.mode == stats.mode) \
+            .update(updates, synchronize_session=False)
+
+        repaired += 1
+
+    session.commit()
+    return repaired
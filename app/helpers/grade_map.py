@@ -0,0 +1,98 @@
+
+from app.common.constants import Grade, ScoreStatus
+from app.common.database import DBScore
+from sqlalchemy.orm import Session
+from typing import Dict, List
+
+import app
+
+# The grades of a player's personal bests are stored inside of a redis hash
+# per user, with one field per beatmap & mode, e.g. "123:0" -> "A". Clients
+# request the grades of up to 100 beatmaps at once while browsing the song
+# select, which results in a single "HMGET". Maps are built from the database
+# on first use, and only updated afterwards, if they exist. They expire after
+# a day to correct any drift, e.g. from scores that were hidden by other services.
+
+EXPIRY = 60 * 60 * 24
+READY_FIELD = 'ready'
+MODES = range(4)
+
+update_script = app.session.redis.register_script("""
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('hset', KEYS[1], ARGV[1], ARGV[2])
+return 1
+""")
+
+def grades_key(user_id: int) -> str:
+    return f'deck:grades:{user_id}'
+
+def default_grades() -> Dict[int, Grade]:
+    return {mode: Grade.N for mode in MODES}
+
+def fetch(
+    user_id: int,
+    beatmap_ids: List[int],
+    session: Session
+) -> Dict[int, Dict[int, Grade]]:
+    """Get the grades of a player's personal bests on the given beatmaps, per mode"""
+    if not beatmap_ids:
+        return {}
+
+    fields = [
+        f'{beatmap_id}:{mode}'
+        for beatmap_id in beatmap_ids
+        for mode in MODES
+    ]
+    values = app.session.redis.hmget(grades_key(user_id), [READY_FIELD, *fields])
+
+    if values[0] is None:
+        build(user_id, session)
+        values = app.session.redis.hmget(grades_key(user_id), [READY_FIELD, *fields])
+
+    grade_lookup = {}
+
+    for field, grade in zip(fields, values[1:]):
+        if grade is None:
+            continue
+
+        beatmap_id, mode = map(int, field.split(':'))
+        grades = grade_lookup.setdefault(beatmap_id, default_grades())
+        grades[mode] = Grade[grade.decode()]
+
+    return grade_lookup
+
+def update(user_id: int, beatmap_id: int, mode: int, grade: str) -> None:
+    """Set the grade of a new personal best"""
+    update_script(
+        keys=[grades_key(user_id)],
+        args=[f'{beatmap_id}:{mode}', grade]
+    )
+
+def remove(user_id: int) -> None:
+    """Remove the map of a player, which will be rebuilt on the next lookup"""
+    app.session.redis.delete(grades_key(user_id))
+
+def build(user_id: int, session: Session) -> None:
+    rows = session.query(
+        DBScore.beatmap_id,
+        DBScore.mode,
+        DBScore.grade
+    ) \
+        .filter(DBScore.user_id == user_id) \
+        .filter(DBScore.mode.in_(MODES)) \
+        .filter(DBScore.status_pp == ScoreStatus.Best.value) \
+        .filter(DBScore.hidden == False) \
+        .all()
+
+    entries = {
+        f'{beatmap_id}:{mode}': grade
+        for beatmap_id, mode, grade in rows
+    }
+
+    pipeline = app.session.redis.pipeline()
+    pipeline.delete(grades_key(user_id))
+    pipeline.hset(grades_key(user_id), mapping={READY_FIELD: 1, **entries})
+    pipeline.expire(grades_key(user_id), EXPIRY)
+    pipeline.execute()
@@ -0,0 +1,86 @@
+
+import secrets
+import time
+import app
+
+# Clients resend their score submission, when they don't receive a response
+# in time or when they get a 503 error. Submissions are identified by the user
+# and the score checksum, and the response of a successful submission will be
+# stored for a short time, such that retries receive the same response again.
+# Retries that arrive while the submission is still being processed will wait
+# for it to finish, instead of processing the same score in parallel.
+
+RESPONSE_EXPIRY = 60 * 5
+LOCK_TIMEOUT = 60
+WAIT_TIMEOUT = 30
+POLL_INTERVAL = 0.1
+
+# Only delete the lock, if it's still owned by this submission
+release_script = app.session.redis.register_script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+""")
+
+class Submission:
+    def __init__(self, user_id: int, score_checksum: str) -> None:
+        self.key = f'deck:submissions:{user_id}:{score_checksum}'
+        self.lock_key = f'{self.key}:lock'
+        self.token = secrets.token_hex(16)
+        self.response: str | None = None
+        self.locked = False
+
+    def __repr__(self) -> str:
+        return f'<Submission {self.key}>'
+
+    def acquire(self, timeout: float = WAIT_TIMEOUT) -> bool:
+        """Wait for the submission lock, or the response of a previous request
+
+        Returns False, if the submission is still being processed by another request.
+        """
+        deadline = time.monotonic() + timeout
+
+        while True:
+            if self.fetch_response():
+                return True
+
+            self.locked = bool(app.session.redis.set(
+                self.lock_key, self.token,
+                nx=True, ex=LOCK_TIMEOUT
+            ))
+
+            if self.locked:
+                # The previous request may have completed in the meantime
+                if self.fetch_response():
+                    self.release()
+
+                return True
+
+            if time.monotonic() >= deadline:
+                return False
+
+            time.sleep(POLL_INTERVAL)
+
+    def fetch_response(self) -> bool:
+        if (response := app.session.redis.get(self.key)) is None:
+            return False
+
+        self.response = response.decode()
+        return True
+
+    def complete(self, response: str) -> None:
+        """Store the response, which will be sent to retries of this submission"""
+        if response.startswith('error:'):
+            # Rejected submissions are checked again on retries,
+            # since they could succeed after e.g. a beatmap update
+            return
+
+        app.session.redis.set(self.key, response, ex=RESPONSE_EXPIRY)
+
+    def release(self) -> None:
+        if not self.locked:
+            return
+
+        release_script(keys=[self.lock_key], args=[self.token])
+        self.locked = False
@@ -0,0 +1,90 @@
+
+from typing import Callable, Dict, List
+from app.common import officer
+
+import threading
+import app
+
+# In-process caches of all deck workers are kept in sync through redis pub/sub.
+# Caches register a handler for their channel, which will be called with the
+# message that was published, e.g. the id of an updated object. Since messages
+# can get lost while the connection is down, every handler will be called with
+# None after (re)subscribing, which means that the whole cache has to be reset.
+
+Handler = Callable[[str | None], None]
+handlers: Dict[str, List[Handler]] = {}
+
+listener_thread: threading.Thread | None = None
+shutdown_event = threading.Event()
+
+def register(channel: str) -> Callable:
+    """Register a handler for invalidation messages on a channel"""
+
+    def wrapper(handler: Handler) -> Handler:
+        handlers.setdefault(channel, []).append(handler)
+        return handler
+
+    return wrapper
+
+def publish(channel: str, message: str | int = '') -> None:
+    app.session.redis.publish(channel, message)
+
+def start() -> None:
+    global listener_thread
+
+    if not handlers:
+        return
+
+    shutdown_event.clear()
+    listener_thread = threading.Thread(
+        target=listen,
+        name='deck-invalidation',
+        daemon=True
+    )
+    listener_thread.start()
+
+def stop(timeout: float = 5) -> None:
+    shutdown_event.set()
+
+    if listener_thread is not None:
+        listener_thread.join(timeout)
+
+def listen() -> None:
+    while not shutdown_event.is_set():
+        try:
+            pubsub = app.session.redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(*handlers)
+            dispatch_all(None)
+
+            while not shutdown_event.is_set():
+                message = pubsub.get_message(timeout=1)
+
+                if message is None:
+                    continue
+
+                dispatch(
+                    message['channel'].decode(),
+                    message['data'].decode() or None
+                )
+
+            pubsub.close()
+        except Exception as e:
+            officer.call(
+                f'Failed to listen for cache invalidations: "{e}"',
+                exc_info=e
+            )
+            shutdown_event.wait(5)
+
+def dispatch(channel: str, message: str | None) -> None:
+    for handler in handlers.get(channel, []):
+        try:
+            handler(message)
+        except Exception as e:
+            officer.call(
+                f'Failed to invalidate cache on "{channel}": "{e}"',
+                exc_info=e
+            )
+
+def dispatch_all(message: str | None) -> None:
+    for channel in handlers:
+        dispatch(channel, message)
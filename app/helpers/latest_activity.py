@@ -0,0 +1,84 @@
+
+from app.common.database import DBUser
+from app.common import officer
+from app.helpers import metrics
+from sqlalchemy import update as sql_update
+from datetime import datetime
+
+import threading
+import time
+import app
+
+# The latest activity of users is tracked inside of a redis sorted set, instead
+# of updating the users table on every request. Every deck worker periodically
+# takes all pending timestamps out of the set, and writes them to the database
+# inside of a single statement, so that active players only cause one update
+# per flush interval.
+
+KEY = 'deck:latest_activity'
+FLUSH_INTERVAL = 5
+
+flusher_thread: threading.Thread | None = None
+shutdown_event = threading.Event()
+
+def update(user_id: int) -> None:
+    """Record the activity of a user, which will be written to the database on the next flush"""
+    app.session.redis.zadd(KEY, {user_id: time.time()}, gt=True)
+
+def start() -> None:
+    global flusher_thread
+    shutdown_event.clear()
+    flusher_thread = threading.Thread(
+        target=run,
+        name='deck-latest-activity',
+        daemon=True
+    )
+    flusher_thread.start()
+
+def stop(timeout: float = 10) -> None:
+    shutdown_event.set()
+
+    if flusher_thread is not None:
+        flusher_thread.join(timeout)
+
+def run() -> None:
+    while not shutdown_event.wait(FLUSH_INTERVAL):
+        flush()
+        # In-process counters are written on the same interval
+        metrics.flush()
+
+    # Write remaining updates before shutting down
+    flush()
+    metrics.flush()
+
+def flush() -> int:
+    pipeline = app.session.redis.pipeline(transaction=True)
+    pipeline.zrange(KEY, 0, -1, withscores=True)
+    pipeline.delete(KEY)
+
+    try:
+        entries, _ = pipeline.execute()
+    except Exception as e:
+        officer.call(f'Failed to fetch latest activity updates: "{e}"', exc_info=e)
+        return 0
+
+    if not entries:
+        return 0
+
+    try:
+        with app.session.database.managed_session() as session:
+            session.execute(
+                sql_update(DBUser),
+                [
+                    {'id': int(user_id), 'latest_activity': datetime.fromtimestamp(timestamp)}
+                    for user_id, timestamp in entries
+                ]
+            )
+    except Exception as e:
+        officer.call(f'Failed to update latest activity: "{e}"', exc_info=e)
+
+        # Retry on the next flush, unless a newer activity was recorded
+        app.session.redis.zadd(KEY, dict(entries), gt=True)
+        return 0
+
+    return len(entries)
@@ -0,0 +1,103 @@
+
+from app.common.database import DBScore
+from app.common.constants import ScoreStatus
+from app.helpers import invalidation, metrics, rank_index
+from sqlalchemy.orm import Session
+from typing import Callable, List
+
+import app
+
+# The formatted top scores of beatmap leaderboards are cached inside of a redis
+# hash per beatmap, with one field per response variant, e.g. mode, ranking
+# type & client version. Every field is prefixed with the current generation
+# of the beatmap, which gets incremented when a new score was submitted.
+# This way, blocks that were rendered before an invalidation won't ever be
+# served, even if they were stored after it.
+# Services that hide or delete scores publish the beatmap id on the
+# "deck:leaderboards:invalidate" channel, and "user:<id>" after a player was
+# renamed. Restrictions invalidate the leaderboards of the restricted player.
+# Changes that are not published will be visible once the blocks expire.
+
+CHANNEL = 'deck:leaderboards:invalidate'
+EXPIRY = 60 * 5
+
+# Generations have to outlive the blocks that were rendered with them,
+# since a generation that expires early would be reused by stale blocks
+GENERATION_EXPIRY = EXPIRY * 2
+
+fetch_script = app.session.redis.register_script("""
+local generation = redis.call('get', KEYS[1]) or '0'
+return {generation, redis.call('hget', KEYS[2], generation .. ':' .. ARGV[1])}
+""")
+
+def generation_key(beatmap_id: int) -> str:
+    return f'deck:leaderboards:{beatmap_id}:generation'
+
+def blocks_key(beatmap_id: int) -> str:
+    return f'deck:leaderboards:{beatmap_id}'
+
+def fetch(beatmap_id: int, variant: str, render: Callable[[], List[str]]) -> List[str]:
+    """Get the score lines of a leaderboard, and render them if they are not cached"""
+    generation, block = fetch_script(
+        keys=[generation_key(beatmap_id), blocks_key(beatmap_id)],
+        args=[variant]
+    )
+
+    if block is not None:
+        metrics.count('leaderboards.hits')
+        return block.decode().split('\n') if block else []
+
+    metrics.count('leaderboards.misses')
+    lines = render()
+
+    pipeline = app.session.redis.pipeline()
+    pipeline.hset(blocks_key(beatmap_id), f'{generation.decode()}:{variant}', '\n'.join(lines))
+    pipeline.expire(blocks_key(beatmap_id), EXPIRY)
+    pipeline.expire(generation_key(beatmap_id), GENERATION_EXPIRY)
+    pipeline.execute()
+    return lines
+
+def invalidate(*beatmap_ids: int) -> None:
+    pipeline = app.session.redis.pipeline()
+
+    for beatmap_id in beatmap_ids:
+        pipeline.incr(generation_key(beatmap_id))
+        pipeline.expire(generation_key(beatmap_id), GENERATION_EXPIRY)
+        pipeline.delete(blocks_key(beatmap_id))
+
+    pipeline.execute()
+
+def invalidate_user(user_id: int, session: Session) -> None:
+    """Invalidate all leaderboards that show a best score of a player"""
+    rows = session.query(DBScore.beatmap_id) \
+        .filter(DBScore.user_id == user_id) \
+        .filter(DBScore.status_score == ScoreStatus.Best.value) \
+        .distinct() \
+        .all()
+
+    if rows:
+        invalidate(*(beatmap_id for beatmap_id, in rows))
+
+def publish_user(user_id: int) -> None:
+    """Invalidate the leaderboards of a player, e.g. after they were renamed"""
+    invalidation.publish(CHANNEL, f'user:{user_id}')
+
+@invalidation.register(CHANNEL)
+def on_invalidate(message: str | None) -> None:
+    if message is None:
+        # Blocks are shared between all workers, and will expire
+        return
+
+    if not message.startswith('user:'):
+        return invalidate(int(message))
+
+    with app.session.database.managed_session() as session:
+        invalidate_user(int(message.removeprefix('user:')), session)
+
+@invalidation.register(rank_index.CHANNEL)
+def on_restriction(message: str | None) -> None:
+    if message is None:
+        return
+
+    with app.session.database.managed_session() as session:
+        invalidate_user(int(message), session)
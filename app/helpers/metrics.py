@@ -0,0 +1,127 @@
+
+from redis.client import Pipeline
+from typing import Dict, List, Sequence
+
+import threading
+import re
+import app
+
+# Counters & histograms are shared between all deck workers, by storing them
+# inside of redis hashes. They are exported in the prometheus text format
+# through the "/metrics" route.
+
+METRICS_KEY = 'deck:metrics'
+HISTOGRAMS_KEY = 'deck:metrics:histograms'
+
+# Default histogram buckets, for durations in milliseconds
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Counters of hot paths, e.g. the hits of in-process caches, are collected
+# inside of the worker, and written to redis periodically through "flush"
+pending_counters: Dict[str, int] = {}
+pending_lock = threading.Lock()
+
+def count(name: str, amount: int = 1) -> None:
+    """Increment a counter without a redis roundtrip, until the next flush"""
+    with pending_lock:
+        pending_counters[name] = pending_counters.get(name, 0) + amount
+
+def flush() -> None:
+    with pending_lock:
+        counters = pending_counters.copy()
+        pending_counters.clear()
+
+    if not counters:
+        return
+
+    pipeline = app.session.redis.pipeline(transaction=False)
+
+    for name, amount in counters.items():
+        pipeline.hincrby(METRICS_KEY, name, amount)
+
+    try:
+        pipeline.execute()
+    except Exception as e:
+        app.session.logger.warning(f'Failed to flush metrics: {e}')
+
+        # Retry on the next flush
+        for name, amount in counters.items():
+            count(name, amount)
+
+def increment(name: str, amount: int = 1, pipeline: Pipeline | None = None) -> None:
+    client = pipeline if pipeline is not None else app.session.redis
+    client.hincrby(METRICS_KEY, name, amount)
+
+def observe(
+    name: str,
+    value: float,
+    pipeline: Pipeline | None = None,
+    buckets: Sequence[float] = BUCKETS
+) -> None:
+    """Record a value inside of a histogram"""
+    bucket = next((str(bucket) for bucket in buckets if value <= bucket), '+Inf')
+    client = pipeline if pipeline is not None else app.session.redis.pipeline()
+    client.hincrby(HISTOGRAMS_KEY, f'{name}:{bucket}', 1)
+    client.hincrby(HISTOGRAMS_KEY, f'{name}:count', 1)
+    client.hincrbyfloat(HISTOGRAMS_KEY, f'{name}:sum', value)
+
+    if pipeline is None:
+        client.execute()
+
+def fetch() -> Dict[str, int]:
+    return {
+        name.decode(): int(value)
+        for name, value in app.session.redis.hgetall(METRICS_KEY).items()
+    }
+
+def hit_rate(name: str) -> float:
+    """Calculate the hit rate of a cache, using the "<name>.hits" & "<name>.misses" counters"""
+    hits, misses = app.session.redis.hmget(
+        METRICS_KEY,
+        f'{name}.hits',
+        f'{name}.misses'
+    )
+    hits, misses = int(hits or 0), int(misses or 0)
+
+    if not hits + misses:
+        return 0.0
+
+    return hits / (hits + misses)
+
+def metric_name(name: str) -> str:
+    return 'deck_' + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+def export() -> str:
+    """Export all counters & histograms in the prometheus text format"""
+    lines: List[str] = []
+
+    for name, value in sorted(fetch().items()):
+        lines.append(f'# TYPE {metric_name(name)} counter')
+        lines.append(f'{metric_name(name)} {value}')
+
+    histograms: Dict[str, Dict[str, float]] = {}
+
+    for field, value in app.session.redis.hgetall(HISTOGRAMS_KEY).items():
+        name, key = field.decode().rsplit(':', 1)
+        histograms.setdefault(name, {})[key] = float(value)
+
+    for name, values in sorted(histograms.items()):
+        family = metric_name(name)
+        lines.append(f'# TYPE {family} histogram')
+        cumulative = 0
+
+        # Buckets are only stored once they received a value
+        buckets = sorted(
+            (key for key in values if key not in ('count', 'sum', '+Inf')),
+            key=float
+        )
+
+        for bucket in buckets:
+            cumulative += int(values[bucket])
+            lines.append(f'{family}_bucket{{le="{bucket}"}} {cumulative}')
+
+        lines.append(f'{family}_bucket{{le="+Inf"}} {int(values.get("count", 0))}')
+        lines.append(f'{family}_sum {values.get("sum", 0.0)}')
+        lines.append(f'{family}_count {int(values.get("count", 0))}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,78 @@
+
+from app.common.constants import Mods
+from app.helpers.caching import LRUCache
+from app.helpers import metrics
+
+import json
+import app
+
+# The difficulty attributes of a beatmap only depend on the beatmap checksum,
+# the mode & the mods that affect the difficulty of a beatmap. Calculating them
+# is the expensive part of a pp calculation, so they get cached per difficulty,
+# and the performance of each play is calculated from the cached attributes.
+# Since the beatmap checksum is part of the key, entries of beatmaps that got
+# updated through the BSS will never be hit again, and get removed on update.
+
+EXPIRY = 60 * 60 * 24
+LOCAL_EXPIRY = 60 * 10
+LOCAL_CAPACITY = 512
+
+DIFFICULTY_MODS = (
+    Mods.Easy |
+    Mods.HardRock |
+    Mods.DoubleTime |
+    Mods.Nightcore |
+    Mods.HalfTime |
+    Mods.Hidden |
+    Mods.Flashlight |
+    Mods.Relax |
+    Mods.Autopilot |
+    Mods.SpunOut |
+    Mods.Key1 |
+    Mods.Key2 |
+    Mods.Key3 |
+    Mods.Key4 |
+    Mods.Key5 |
+    Mods.Key6 |
+    Mods.Key7 |
+    Mods.Key8 |
+    Mods.Key9
+)
+
+local_cache: LRUCache[str, dict] = LRUCache(LOCAL_CAPACITY, LOCAL_EXPIRY)
+
+def difficulty_key(beatmap_md5: str, mode: int, mods: int, touchscreen: bool) -> str:
+    # Touch devices reduce the aim difficulty of a beatmap
+    return f'deck:difficulty:{beatmap_md5}:{mode}:{mods & DIFFICULTY_MODS.value}:{int(touchscreen)}'
+
+def fetch(beatmap_md5: str, mode: int, mods: int, touchscreen: bool) -> dict | None:
+    """Get the cached difficulty attributes of a beatmap, if they were calculated before"""
+    key = difficulty_key(beatmap_md5, mode, mods, touchscreen)
+
+    if (attributes := local_cache.get(key)) is not None:
+        metrics.count('pp_cache.hits')
+        return attributes
+
+    if (attributes := app.session.redis.get(key)) is None:
+        metrics.count('pp_cache.misses')
+        return None
+
+    metrics.count('pp_cache.hits')
+    attributes = json.loads(attributes)
+    local_cache.set(key, attributes)
+    return attributes
+
+def store(beatmap_md5: str, mode: int, mods: int, touchscreen: bool, attributes: dict) -> None:
+    key = difficulty_key(beatmap_md5, mode, mods, touchscreen)
+    local_cache.set(key, attributes)
+    app.session.redis.set(key, json.dumps(attributes), ex=EXPIRY)
+
+def invalidate(beatmap_md5: str) -> None:
+    """Remove all cached attributes of a beatmap checksum, e.g. after it was updated"""
+    prefix = f'deck:difficulty:{beatmap_md5}:'
+    local_cache.remove_where(lambda key: key.startswith(prefix))
+
+    keys = list(app.session.redis.scan_iter(f'{prefix}*', count=100))
+
+    if keys:
+        app.session.redis.delete(*keys)
@@ -0,0 +1,237 @@
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from app.common.helpers import performance
+from app.common.database import DBScore
+from app.helpers import performance_cache
+from threading import BoundedSemaphore, Event
+from typing import Any, Callable
+from sqlalchemy import inspect
+
+import performance_worker
+import multiprocessing
+import queue
+import app
+
+# ppv2 calculations run inside of separate processes, such that a pathological
+# beatmap can't block the request threads of a deck worker. The processes only
+# import "performance_worker", instead of the whole app.
+# Every process handles one calculation at a time. The timeout of a calculation
+# starts once it was sent to a process, and only the process that exceeded it
+# gets killed. Processes are also replaced after a number of calculations.
+# Callers are expected to fall back to 0pp when a calculation is unavailable,
+# and schedule a recalculation through the "recalculate_pp" task stage.
+# ppv2 is calculated from the difficulty attributes inside of the performance
+# cache, such that only the first play of a difficulty has to calculate them.
+
+MAX_WORKERS = 2
+MAX_PENDING = 8
+MAX_TASKS_PER_WORKER = 250
+QUEUE_TIMEOUT = 2
+STOP_TIMEOUT = 5
+TIMEOUT = 10
+RECALCULATION_TIMEOUT = 60
+
+class CalculationUnavailable(Exception):
+    """Raised when a calculation could not be completed in time"""
+
+class Worker:
+    """A calculation process, which is started on first use"""
+
+    def __init__(self) -> None:
+        self.process: multiprocessing.Process | None = None
+        self.connection = None
+        self.tasks = 0
+
+    def __repr__(self) -> str:
+        pid = self.process.pid if self.process is not None else None
+        return f'<Worker {pid}>'
+
+    def start(self) -> None:
+        connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=performance_worker.serve,
+            args=(child_connection,),
+            name='deck-pp-worker',
+            daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.connection = connection
+        self.tasks = 0
+
+    def stop(self) -> None:
+        """Let the process exit after its current calculation"""
+        if self.process is None:
+            return
+
+        # The process exits once its connection is closed
+        self.connection.close()
+        self.process.join(STOP_TIMEOUT)
+
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+        self.process = None
+        self.connection = None
+
+    def kill(self) -> None:
+        if self.process is None:
+            return
+
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+        self.process = None
+        self.connection = None
+
+    def calculate(self, function: str, args: tuple, timeout: float) -> Any:
+        if self.process is not None and (self.tasks >= MAX_TASKS_PER_WORKER or not self.process.is_alive()):
+            self.stop()
+
+        if self.process is None:
+            self.start()
+
+        self.tasks += 1
+
+        try:
+            self.connection.send((function, args))
+
+            if not self.connection.poll(timeout):
+                app.session.logger.warning(f'Replacing pp calculation process {self}...')
+                self.kill()
+                raise CalculationUnavailable(f'Calculation exceeded {timeout} seconds')
+
+            success, result = self.connection.recv()
+        except (EOFError, OSError):
+            self.kill()
+            raise CalculationUnavailable('Calculation process exited unexpectedly')
+
+        if not success:
+            raise RuntimeError(result)
+
+        return result
+
+context = multiprocessing.get_context('spawn')
+pending = BoundedSemaphore(MAX_PENDING)
+idle_workers: queue.Queue[Worker] = queue.Queue()
+
+for _ in range(MAX_WORKERS):
+    idle_workers.put(Worker())
+
+# ppv1 requires the database, which isn't available inside of the calculation processes
+ppv1_executor = ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix='deck-ppv1')
+
+def calculate_ppv2(
+    score: DBScore,
+    beatmap_md5: str,
+    timeout: float = TIMEOUT
+) -> float | None:
+    beatmap_file = app.session.storage.get_beatmap(score.beatmap_id)
+
+    if not beatmap_file:
+        return None
+
+    attributes = performance_cache.fetch(
+        beatmap_md5,
+        score.mode,
+        score.mods,
+        score.touchscreen or False
+    )
+
+    pp, calculated_attributes = submit(
+        'ppv2', timeout,
+        serialize_ppv2(score),
+        beatmap_file,
+        attributes
+    )
+
+    if attributes is None:
+        performance_cache.store(
+            beatmap_md5,
+            score.mode,
+            score.mods,
+            score.touchscreen or False,
+            calculated_attributes
+        )
+
+    return pp
+
+def calculate_ppv1(score: DBScore, timeout: float = TIMEOUT) -> float | None:
+    if not pending.acquire(timeout=QUEUE_TIMEOUT):
+        raise CalculationUnavailable('Too many pending calculations')
+
+    try:
+        started = Event()
+        future = ppv1_executor.submit(run_started, started, run_ppv1, serialize(score))
+
+        # The timeout only applies to the calculation itself
+        if not started.wait(QUEUE_TIMEOUT) and future.cancel():
+            raise CalculationUnavailable('No calculation thread available')
+
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            raise CalculationUnavailable(f'Calculation exceeded {timeout} seconds')
+    finally:
+        pending.release()
+
+def submit(function: str, timeout: float, *args) -> Any:
+    if not pending.acquire(timeout=QUEUE_TIMEOUT):
+        raise CalculationUnavailable('Too many pending calculations')
+
+    try:
+        try:
+            worker = idle_workers.get(timeout=QUEUE_TIMEOUT)
+        except queue.Empty:
+            raise CalculationUnavailable('No calculation process available')
+
+        try:
+            return worker.calculate(function, args, timeout)
+        finally:
+            idle_workers.put(worker)
+    finally:
+        pending.release()
+
+def shutdown() -> None:
+    # Workers that are still calculating will be
+    # stopped by the exit of the parent process
+    while True:
+        try:
+            idle_workers.get_nowait().stop()
+        except queue.Empty:
+            break
+
+    ppv1_executor.shutdown(wait=True, cancel_futures=True)
+
+def run_started(started: Event, function: Callable, *args) -> Any:
+    started.set()
+    return function(*args)
+
+def serialize(score: DBScore) -> dict:
+    # Only the column values are passed on, since
+    # sqlalchemy objects may be bound to a session
+    return {
+        attribute.key: getattr(score, attribute.key)
+        for attribute in inspect(DBScore).column_attrs
+    }
+
+def serialize_ppv2(score: DBScore) -> dict:
+    return {
+        'mode': score.mode,
+        'mods': score.mods,
+        'touchscreen': score.touchscreen or False,
+        'acc': score.acc,
+        'max_combo': score.max_combo,
+        'total_score': score.total_score,
+        'n300': score.n300,
+        'n100': score.n100,
+        'n50': score.n50,
+        'nGeki': score.nGeki,
+        'nKatu': score.nKatu,
+        'nMiss': score.nMiss
+    }
+
+def run_ppv1(columns: dict) -> float | None:
+    with app.session.database.managed_session() as session:
+        return performance.calculate_ppv1(DBScore(**columns), session)
@@ -0,0 +1,37 @@
+
+from app.common.helpers import permissions
+from app.helpers.caching import LRUCache
+from app.helpers import invalidation, metrics
+
+# Permission checks of authenticated hot paths, e.g. score submission & beatmap
+# uploads, are cached per worker for a short time. Services that change the
+# roles or permissions of a user publish the user id on the
+# "deck:permissions:invalidate" channel, or an empty message to reset the cache.
+
+CHANNEL = 'deck:permissions:invalidate'
+EXPIRY = 60
+CAPACITY = 16384
+
+cache: LRUCache[tuple[int, str], bool] = LRUCache(CAPACITY, EXPIRY)
+
+def has_permission(permission: str, user_id: int) -> bool:
+    if (is_allowed := cache.get((user_id, permission))) is not None:
+        metrics.count('permissions.hits')
+        return is_allowed
+
+    metrics.count('permissions.misses')
+    is_allowed = bool(permissions.has_permission(permission, user_id))
+    cache.set((user_id, permission), is_allowed)
+    return is_allowed
+
+def invalidate(user_id: int | None = None) -> None:
+    """Reset the cached permissions of a user, or of all users, on every deck worker"""
+    invalidation.publish(CHANNEL, user_id or '')
+
+@invalidation.register(CHANNEL)
+def on_invalidate(message: str | None) -> None:
+    if message is None:
+        return cache.clear()
+
+    user_id = int(message)
+    cache.remove_where(lambda key: key[0] == user_id)
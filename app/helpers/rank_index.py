@@ -0,0 +1,229 @@
+
+from app.common.database import DBScore, DBUser
+from app.common.constants import ScoreStatus
+from app.helpers import invalidation
+from sqlalchemy.orm import Session
+from typing import Iterable, Tuple
+
+import app
+
+# The best scores of every beatmap leaderboard are indexed inside of a redis
+# sorted set per beatmap & mode, using the user id as the member and the
+# total score as the score. Ranks are resolved by counting the members with
+# a higher score, which matches the "rank()" of the database leaderboard.
+# Indexes are built from the database on first use, and expire after a day
+# to correct any drift, e.g. from scores that were hidden by other services.
+# Services that restrict or unrestrict a player publish the user id on the
+# "deck:users:restrictions" channel, which removes or re-adds their scores.
+
+CHANNEL = 'deck:users:restrictions'
+EXPIRY = 60 * 60 * 24
+BUILD_TIMEOUT = 60
+BUILD_BATCH_SIZE = 5000
+
+rank_script = app.session.redis.register_script("""
+if redis.call('exists', KEYS[2]) == 0 then
+    return -1
+end
+local score = redis.call('zscore', KEYS[1], ARGV[1])
+if not score then
+    return 0
+end
+return redis.call('zcount', KEYS[1], '(' .. score, '+inf') + 1
+""")
+
+# Personal bests are only added to indexes that were built, or are being built,
+# since the index would be incomplete otherwise. The index expires together
+# with its ready marker, so that it will be rebuilt from the database.
+update_script = app.session.redis.register_script("""
+local ttl = redis.call('pttl', KEYS[2])
+if ttl < 0 then
+    if redis.call('exists', KEYS[3]) == 0 then
+        return 0
+    end
+    ttl = ARGV[3] * 1000
+end
+redis.call('zadd', KEYS[1], 'GT', ARGV[2], ARGV[1])
+redis.call('pexpire', KEYS[1], ttl)
+return 1
+""")
+
+def index_key(beatmap_id: int, mode: int) -> str:
+    return f'deck:ranks:{beatmap_id}:{mode}'
+
+def ready_key(beatmap_id: int, mode: int) -> str:
+    return f'deck:ranks:{beatmap_id}:{mode}:ready'
+
+def building_key(beatmap_id: int, mode: int) -> str:
+    return f'deck:ranks:{beatmap_id}:{mode}:building'
+
+def fetch_rank(beatmap_id: int, mode: int, user_id: int, session: Session) -> int | None:
+    """Get the rank of a player's best score on a beatmap, or None if they have no score"""
+    keys = [index_key(beatmap_id, mode), ready_key(beatmap_id, mode)]
+    rank = rank_script(keys=keys, args=[user_id])
+
+    if rank < 0:
+        if not build(beatmap_id, mode, session):
+            # Index is being built by another request, which
+            # has to be resolved by the database in the meantime
+            return None
+
+        rank = rank_script(keys=keys, args=[user_id])
+
+    return rank or None
+
+def update(
+    beatmap_id: int,
+    mode: int,
+    user_id: int,
+    total_score: int,
+    client=None
+) -> None:
+    """Add a new personal best to the index"""
+    # Only raise the score, in case an older personal best was written
+    # by a concurrent build of this index
+    update_script(
+        keys=[
+            index_key(beatmap_id, mode),
+            ready_key(beatmap_id, mode),
+            building_key(beatmap_id, mode)
+        ],
+        args=[user_id, total_score, EXPIRY],
+        client=client
+    )
+
+def remove(beatmap_id: int, mode: int | None = None) -> None:
+    """Remove the indexes of a beatmap, which will be rebuilt on the next lookup"""
+    modes = range(4) if mode is None else (mode,)
+    app.session.redis.delete(*(
+        key
+        for mode in modes
+        for key in (
+            index_key(beatmap_id, mode),
+            ready_key(beatmap_id, mode),
+            building_key(beatmap_id, mode)
+        )
+    ))
+
+def remove_user(user_id: int, session: Session) -> None:
+    """Remove the personal bests of a player from all indexes, e.g. after a restriction"""
+    rows = session.query(DBScore.beatmap_id, DBScore.mode) \
+        .filter(DBScore.user_id == user_id) \
+        .filter(DBScore.status_score == ScoreStatus.Best.value) \
+        .all()
+
+    pipeline = app.session.redis.pipeline()
+
+    for beatmap_id, mode in rows:
+        pipeline.zrem(index_key(beatmap_id, mode), user_id)
+
+    pipeline.execute()
+
+def restore_user(user_id: int, session: Session) -> None:
+    """Add the personal bests of a player to all built indexes, e.g. after an unrestriction"""
+    rows = session.query(DBScore.beatmap_id, DBScore.mode, DBScore.total_score) \
+        .filter(DBScore.user_id == user_id) \
+        .filter(DBScore.status_score == ScoreStatus.Best.value) \
+        .filter(DBScore.hidden == False) \
+        .all()
+
+    pipeline = app.session.redis.pipeline()
+
+    for beatmap_id, mode, total_score in rows:
+        update(beatmap_id, mode, user_id, total_score, client=pipeline)
+
+    pipeline.execute()
+
+def publish_restriction(user_id: int) -> None:
+    """Update the indexes after the restriction of a player was changed"""
+    invalidation.publish(CHANNEL, user_id)
+
+@invalidation.register(CHANNEL)
+def on_restriction(message: str | None) -> None:
+    if message is None:
+        # Indexes are shared between all workers, and
+        # will be rebuilt once they expire
+        return
+
+    user_id = int(message)
+
+    with app.session.database.managed_session() as session:
+        restricted = session.query(DBUser.restricted) \
+            .filter(DBUser.id == user_id) \
+            .scalar()
+
+        if restricted:
+            remove_user(user_id, session)
+        else:
+            restore_user(user_id, session)
+
+def build(beatmap_id: int, mode: int, session: Session) -> bool:
+    """Build the index of a beatmap, unless it's already being built by another request"""
+    # The marker also allows personal bests that are submitted during the build to be added
+    if not app.session.redis.set(building_key(beatmap_id, mode), 1, nx=True, ex=BUILD_TIMEOUT):
+        return False
+
+    rows = session.query(DBScore.user_id, DBScore.total_score) \
+        .join(DBUser, DBUser.id == DBScore.user_id) \
+        .filter(DBScore.beatmap_id == beatmap_id) \
+        .filter(DBScore.mode == mode) \
+        .filter(DBScore.status_score == ScoreStatus.Best.value) \
+        .filter(DBScore.hidden == False) \
+        .filter(DBUser.restricted == False) \
+        .all()
+
+    write(beatmap_id, mode, rows, replace=False)
+    return True
+
+def write(
+    beatmap_id: int,
+    mode: int,
+    rows: Iterable[Tuple[int, int]],
+    replace: bool = True
+) -> None:
+    pipeline = app.session.redis.pipeline()
+
+    if replace:
+        pipeline.delete(index_key(beatmap_id, mode))
+
+    entries = {user_id: total_score for user_id, total_score in rows}
+
+    if entries:
+        # Merge with personal bests that were submitted during the build
+        pipeline.zadd(index_key(beatmap_id, mode), entries, gt=not replace)
+        pipeline.expire(index_key(beatmap_id, mode), EXPIRY)
+
+    pipeline.set(ready_key(beatmap_id, mode), 1, ex=EXPIRY)
+    pipeline.delete(building_key(beatmap_id, mode))
+    pipeline.execute()
+
+def rebuild(session: Session) -> int:
+    """Regenerate the indexes of all beatmaps from the database"""
+    query = session.query(DBScore.beatmap_id, DBScore.mode, DBScore.user_id, DBScore.total_score) \
+        .join(DBUser, DBUser.id == DBScore.user_id) \
+        .filter(DBScore.status_score == ScoreStatus.Best.value) \
+        .filter(DBScore.hidden == False) \
+        .filter(DBUser.restricted == False) \
+        .order_by(DBScore.beatmap_id, DBScore.mode) \
+        .yield_per(BUILD_BATCH_SIZE)
+
+    current: Tuple[int, int] | None = None
+    rows: list = []
+    count = 0
+
+    for beatmap_id, mode, user_id, total_score in query:
+        if current != (beatmap_id, mode):
+            if current is not None:
+                write(*current, rows)
+                count += 1
+
+            current = (beatmap_id, mode)
+            rows = []
+
+        rows.append((user_id, total_score))
+
+    if current is not None:
+        write(*current, rows)
+        count += 1
+
+    return count
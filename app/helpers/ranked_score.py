@@ -0,0 +1,50 @@
+
+from app.common.database import DBStats
+from app.common.database.repositories import scores
+from sqlalchemy.orm import Session
+
+import app
+
+# The ranked score of a player is the sum of the total scores of their best
+# scores. Submissions add the difference to the previous best score, instead
+# of summing up all best scores of a player. The "reconcile-ranked-score"
+# command sums up the best scores of every player again, to repair any drift,
+# e.g. from scores that were hidden or deleted by other services.
+
+BATCH_SIZE = 1000
+
+def reconcile(session: Session) -> int:
+    """Sum up the ranked score of every player and repair the stats that drifted"""
+    query = session.query(DBStats) \
+        .order_by(DBStats.user_id, DBStats.mode) \
+        .yield_per(BATCH_SIZE)
+
+    repaired = 0
+
+    for stats in query:
+        rscore = sum(
+            score.total_score
+            for score in scores.fetch_best_by_score(
+                user_id=stats.user_id,
+                mode=stats.mode,
+                session=session
+            )
+        )
+
+        if stats.rscore == rscore:
+            continue
+
+        app.session.logger.info(
+            f'Repairing ranked score of user {stats.user_id} in mode {stats.mode}: '
+            f'{stats.rscore} -> {rscore}'
+        )
+
+        session.query(DBStats) \
+            .filter(DBStats.user_id == stats.user_id) \
+            .filter(DBStats.mode == stats.mode) \
+            .update({'rscore': rscore}, synchronize_session=False)
+
+        repaired += 1
+
+    session.commit()
+    return repaired
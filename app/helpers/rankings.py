@@ -0,0 +1,104 @@
+
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, and_, or_
+from dataclasses import dataclass
+
+from app.common.database import DBScore
+from app.common.constants import ScoreStatus
+
+@dataclass(slots=True)
+class ScoreRanking:
+    personal_best_pp: DBScore | None = None
+    personal_best_score: DBScore | None = None
+    mods_best_pp: DBScore | None = None
+    mods_best_score: DBScore | None = None
+    score_above: DBScore | None = None
+    old_rank: int = 0
+    new_rank: int = 1
+
+def fetch_score_ranking(
+    beatmap_id: int,
+    user_id: int,
+    mode: int,
+    mods: int,
+    total_score: int,
+    session: Session
+) -> ScoreRanking:
+    """Resolve the personal bests of a player and the beatmap ranks for a new score in one query"""
+    personal_best_status = (ScoreStatus.Best.value, ScoreStatus.Mods.value)
+
+    leaderboard = session.query(
+            DBScore.id,
+            DBScore.total_score,
+            func.rank().over(order_by=DBScore.total_score.desc()).label('rank')
+        ) \
+        .filter(DBScore.beatmap_id == beatmap_id) \
+        .filter(DBScore.mode == mode) \
+        .filter(DBScore.status_score == ScoreStatus.Best.value) \
+        .filter(DBScore.hidden == False) \
+        .cte('leaderboard')
+
+    # The closest score above the new total score
+    score_above_id = session.query(leaderboard.c.id) \
+        .filter(leaderboard.c.total_score > total_score) \
+        .order_by(leaderboard.c.total_score.asc()) \
+        .limit(1) \
+        .scalar_subquery()
+
+    scores_above = session.query(func.count(leaderboard.c.id)) \
+        .filter(leaderboard.c.total_score > total_score) \
+        .scalar_subquery()
+
+    rows = session.query(
+            DBScore,
+            leaderboard.c.rank,
+            score_above_id.label('score_above_id'),
+            scores_above.label('scores_above')
+        ) \
+        .outerjoin(leaderboard, leaderboard.c.id == DBScore.id) \
+        .options(joinedload(DBScore.user)) \
+        .filter(DBScore.beatmap_id == beatmap_id) \
+        .filter(DBScore.mode == mode) \
+        .filter(DBScore.hidden == False) \
+        .filter(or_(
+            and_(
+                DBScore.user_id == user_id,
+                or_(
+                    DBScore.status_pp.in_(personal_best_status),
+                    DBScore.status_score.in_(personal_best_status)
+                )
+            ),
+            DBScore.id == score_above_id
+        )) \
+        .all()
+
+    ranking = ScoreRanking()
+
+    for score, rank, score_above_id, scores_above in rows:
+        ranking.new_rank = scores_above + 1
+
+        if score.id == score_above_id:
+            ranking.score_above = score
+
+        if score.user_id != user_id:
+            continue
+
+        if score.status_pp == ScoreStatus.Best:
+            ranking.personal_best_pp = score
+
+        if score.status_score == ScoreStatus.Best:
+            ranking.personal_best_score = score
+            ranking.old_rank = rank or 0
+
+        if score.mods != mods:
+            continue
+
+        if score.status_pp in personal_best_status:
+            if not ranking.mods_best_pp or score.pp > ranking.mods_best_pp.pp:
+                ranking.mods_best_pp = score
+
+        if score.status_score in personal_best_status:
+            if not ranking.mods_best_score or score.total_score > ranking.mods_best_score.total_score:
+                ranking.mods_best_score = score
+
+    return ranking
@@ -0,0 +1,117 @@
+
+from app.common.database import DBScore
+from app.common import officer
+from typing import List
+
+import threading
+import app
+
+# Checksums of all submitted replays are tracked inside of a bloom filter,
+# which is stored as a redis bitmap. A checksum that is not part of the filter
+# was definitely never submitted before, which lets us skip the database lookup
+# for almost every score. Possible hits still have to be confirmed through the
+# database, since bloom filters can return false positives.
+# Until the filter was warmed up from the database, every lookup will be
+# treated as a possible hit.
+
+FILTER_KEY = 'deck:replay_checksums'
+READY_KEY = 'deck:replay_checksums:ready'
+WARMUP_LOCK_KEY = 'deck:replay_checksums:warmup'
+
+# 32 MB bitmap, resulting in ~0.04% false positives at 15 million replays
+FILTER_BITS = 2**28
+HASH_COUNT = 7
+
+WARMUP_BATCH_SIZE = 10_000
+WARMUP_LOCK_TIMEOUT = 60 * 60
+
+def bit_positions(checksum: str) -> List[int]:
+    # The checksum is already a uniformly distributed hash,
+    # so we can derive all bit positions from it directly
+    digest = bytes.fromhex(checksum)
+    first = int.from_bytes(digest[:8], 'big')
+    second = int.from_bytes(digest[8:], 'big') | 1
+
+    return [
+        (first + index * second) % FILTER_BITS
+        for index in range(HASH_COUNT)
+    ]
+
+def add(*checksums: str) -> None:
+    if not checksums:
+        return
+
+    pipeline = app.session.redis.pipeline(transaction=False)
+
+    for checksum in checksums:
+        for position in bit_positions(checksum):
+            pipeline.setbit(FILTER_KEY, position, 1)
+
+    pipeline.execute()
+
+def might_exist(checksum: str) -> bool:
+    """Check if a replay checksum was possibly submitted before"""
+    pipeline = app.session.redis.pipeline(transaction=False)
+    pipeline.exists(READY_KEY, FILTER_KEY)
+
+    for position in bit_positions(checksum):
+        pipeline.getbit(FILTER_KEY, position)
+
+    ready_keys, *bits = pipeline.execute()
+
+    if ready_keys != 2:
+        # Filter is not warmed up yet, or was evicted
+        return True
+
+    return all(bits)
+
+def start() -> None:
+    thread = threading.Thread(
+        target=warmup,
+        name='deck-replay-checksums',
+        daemon=True
+    )
+    thread.start()
+
+def warmup() -> None:
+    """Fill the bloom filter with all replay checksums inside of the database"""
+    if app.session.redis.exists(READY_KEY, FILTER_KEY) == 2:
+        return
+
+    lock_acquired = app.session.redis.set(
+        WARMUP_LOCK_KEY, 1,
+        nx=True, ex=WARMUP_LOCK_TIMEOUT
+    )
+
+    if not lock_acquired:
+        # Another worker is already warming up the filter
+        return
+
+    app.session.logger.info('Warming up replay checksum filter...')
+
+    try:
+        with app.session.database.managed_session() as session:
+            query = session.query(DBScore.replay_md5) \
+                .filter(DBScore.replay_md5 != None) \
+                .yield_per(WARMUP_BATCH_SIZE)
+
+            batch: List[str] = []
+
+            for checksum, in query:
+                batch.append(checksum)
+
+                if len(batch) >= WARMUP_BATCH_SIZE:
+                    add(*batch)
+                    batch.clear()
+
+            add(*batch)
+
+        app.session.redis.set(READY_KEY, 1)
+        app.session.logger.info('Replay checksum filter is ready.')
+    except Exception as e:
+        officer.call(
+            f'Failed to warm up replay checksum filter: "{e}"',
+            exc_info=e
+        )
+    finally:
+        app.session.redis.delete(WARMUP_LOCK_KEY)
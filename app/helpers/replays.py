@@ -2,20 +2,32 @@
 from app.common import officer
 from app import utils
 
-from math import hypot, ceil, floor
 from dataclasses import dataclass
 
-import itertools
 import numpy
 import app
 
 @dataclass(frozen=True, slots=True)
-class ReplayFrame:
-    delta: int
-    time: int
-    x: float
-    y: float
-    button_state: int
+class ReplayFrames:
+    """Columnar representation of replay frames, with one array per field"""
+    delta: numpy.ndarray
+    time: numpy.ndarray
+    x: numpy.ndarray
+    y: numpy.ndarray
+    button_state: numpy.ndarray
+
+    def __len__(self) -> int:
+        return len(self.delta)
+
+    @classmethod
+    def empty(cls) -> "ReplayFrames":
+        return cls(
+            delta=numpy.empty(0, dtype=numpy.int64),
+            time=numpy.empty(0, dtype=numpy.int64),
+            x=numpy.empty(0, dtype=numpy.float64),
+            y=numpy.empty(0, dtype=numpy.float64),
+            button_state=numpy.empty(0, dtype=numpy.int64)
+        )
 
 GAMEPLAY_BUTTONS = (
     1 | # Left1
@@ -24,14 +36,12 @@ GAMEPLAY_BUTTONS = (
     8   # Right2
 )
 
-def validate(replay_bytes: bytes) -> tuple[bool, int, list[ReplayFrame]]:
+SEED_FRAME_DELTA = -12345
+
+def validate(replay_bytes: bytes) -> tuple[bool, int, ReplayFrames]:
     """Validate a replay's contents"""
     app.session.logger.debug('Validating replay...')
 
-    frames: list[ReplayFrame] = []
-    current_time: int = 0
-    seed: int = 0
-
     try:
         # We use a custom decompression method to avoid memory
         # exhaustion attacks also known as zip bombs :))
@@ -41,68 +51,106 @@ def validate(replay_bytes: bytes) -> tuple[bool, int, list[ReplayFrame]]:
             max_length=1024 * 1024 * 50
         )
         replay = replay_bytes.decode()
-        raw_frames = replay.split(',')
+        frame_count = replay.count(',') + 1
 
-        if len(raw_frames) < 100:
+        if frame_count < 100:
             # This replay is highly likely to be malformed or malicious
             # Hopefully this doesn't lead to false-positivies
             officer.call(
-                f'Replay validation failed: Not enough replay frames ({len(raw_frames)})'
+                f'Replay validation failed: Not enough replay frames ({frame_count})'
             )
-            return False, 0, []
-
-        for frame in raw_frames:
-            # Ignore empty frames due to trailing commas
-            if not frame:
-                continue
-
-            frame_data = frame.split('|')
-
-            if len(frame_data) != 4:
-                officer.call(
-                    f'Replay validation failed: Invalid frame data ({frame_data})'
-                )
-                return False, 0, []
-
-            if frame_data[0] == "-12345":
-                seed = int(frame_data[3])
-                continue
-
-            # Parse the frame data
-            delta = int(frame_data[0])
-            x = float(frame_data[1])
-            y = float(frame_data[2])
-            button_state = int(frame_data[3])
-
-            # Convert delta time into absolute replay time
-            current_time += delta
-
-            frame = ReplayFrame(
-                delta=delta,
-                time=current_time,
-                x=x,
-                y=y,
-                button_state=button_state
+            return False, 0, ReplayFrames.empty()
+
+        if (invalid_frame := find_invalid_frame(replay_bytes)) is not None:
+            frame_data = replay_bytes.split(b',')[invalid_frame].decode().split('|')
+            officer.call(
+                f'Replay validation failed: Invalid frame data ({frame_data})'
             )
-            frames.append(frame)
+            return False, 0, ReplayFrames.empty()
+
+        seed, frames = parse_frames(replay)
     except Exception as e:
         officer.call(
             f'Replay validation failed: {e}',
             exc_info=e
         )
-        return False, 0, []
+        return False, 0, ReplayFrames.empty()
 
     return True, seed, frames
 
-def detect_touchscreen_usage(frames: list[ReplayFrame], decision_threshold: float = 0.8) -> tuple[bool, float]:
-    """Detect touchscreen usage from parsed replay frames"""
-    speed_values: list[float] = []
+def find_invalid_frame(replay_bytes: bytes) -> int | None:
+    """Find the index of the first frame, which doesn't consist of 4 values"""
+    characters = numpy.frombuffer(replay_bytes, dtype=numpy.uint8)
+    frame_separators = numpy.flatnonzero(characters == ord(','))
+    value_separators = numpy.flatnonzero(characters == ord('|'))
+
+    # Frame boundaries, as character positions of the surrounding commas
+    boundaries = numpy.concatenate(([-1], frame_separators, [len(characters)]))
+    starts, ends = boundaries[:-1] + 1, boundaries[1:]
+
+    separator_counts = (
+        numpy.searchsorted(value_separators, ends) -
+        numpy.searchsorted(value_separators, starts)
+    )
+
+    # Empty frames due to trailing commas are ignored
+    invalid = numpy.flatnonzero((ends > starts) & (separator_counts != 3))
+
+    if not invalid.size:
+        return None
+
+    return int(invalid[0])
+
+def parse_frames(replay: str) -> tuple[int, ReplayFrames]:
+    """Parse the values of all frames at once, and split off the seed frame"""
+    replay = replay.strip(',')
+
+    if not replay:
+        return 0, ReplayFrames.empty()
+
+    if ',,' in replay:
+        # Remove empty frames in between
+        replay = ','.join(frame for frame in replay.split(',') if frame)
+
+    values = numpy.array(
+        replay.replace(',', '|').split('|'),
+        dtype=numpy.float64
+    ).reshape(-1, 4)
+
+    delta = values[:, 0]
+    button_state = values[:, 3]
+
+    if not is_integral(delta) or not is_integral(button_state):
+        raise ValueError('Frame delta and button state must be integers')
+
+    delta = delta.astype(numpy.int64)
+    button_state = button_state.astype(numpy.int64)
+
+    seed = 0
+    seed_frames = delta == SEED_FRAME_DELTA
 
-    teleport_count = 0
-    press_count = 0
-    presses_after_teleport = 0
-    last_teleport_time: int | None = None
+    if seed_frames.any():
+        seed = int(button_state[seed_frames][-1])
+        frame_mask = ~seed_frames
+        values = values[frame_mask]
+        delta = delta[frame_mask]
+        button_state = button_state[frame_mask]
 
+    # Convert delta time into absolute replay time
+    return seed, ReplayFrames(
+        delta=delta,
+        time=numpy.cumsum(delta),
+        x=values[:, 1],
+        y=values[:, 2],
+        button_state=button_state
+    )
+
+def is_integral(values: numpy.ndarray) -> bool:
+    # Values above 2^53 can't be represented exactly as floats
+    return bool(numpy.all((values == numpy.trunc(values)) & (numpy.abs(values) <= 2**53)))
+
+def detect_touchscreen_usage(frames: ReplayFrames, decision_threshold: float = 0.8) -> tuple[bool, float]:
+    """Detect touchscreen usage from parsed replay frames"""
     # We check for 3 main signals for analysis:
     # 1. Large fast cursor jumps, i.e. a movement that is considered a "teleport"
     # 2. Presses shortly after a teleport, a sign of touchscreen usage
@@ -111,39 +159,36 @@ def detect_touchscreen_usage(frames: list[ReplayFrame], decision_threshold: floa
     # This method of analysis can still produce false positives, but I think its a good starting point
     # especially when only checking for high decision thresholds (0.8 by default).
 
-    for previous, current in itertools.pairwise(frames):
-        # A movement sample represents a single movement between two
-        # frames, which we can analyze for speed and distance
-        movement_sample = calculate_movement_sample(previous, current)
-
-        if movement_sample is not None:
-            speed, distance = movement_sample
-            speed_values.append(speed)
-
-            if is_teleport_movement(speed, distance):
-                teleport_count += 1
-                last_teleport_time = current.time
+    # Every pair of consecutive frames represents a single movement,
+    # which we can analyze for speed and distance
+    speeds, distances, movements = calculate_movement_samples(frames)
 
-        if is_new_button_press(previous.button_state, current.button_state):
-            press_count += 1
-
-            if is_press_after_teleport(current.time, last_teleport_time):
-                presses_after_teleport += 1
-
-    if not speed_values:
+    if not speeds.size:
         # No usable movement samples were found, likely due to a malformed replay
         return False, 0.0
 
+    teleports = numpy.zeros(len(movements), dtype=bool)
+    teleports[movements] = is_teleport_movement(speeds, distances[movements])
+
+    presses = is_new_button_press(frames.button_state[:-1], frames.button_state[1:])
+    press_count = int(numpy.count_nonzero(presses))
+
     if press_count < 100:
         # Not enough button presses for replay analysis to be reliable
         return False, 0.0
 
+    presses_after_teleport = count_presses_after_teleport(
+        frames.time[1:],
+        teleports,
+        presses
+    )
+
     teleport_ratio, press_teleport_ratio, p95_speed = build_touchscreen_stats(
-        movement_count=len(speed_values),
-        teleport_count=teleport_count,
+        movement_count=len(speeds),
+        teleport_count=int(numpy.count_nonzero(teleports)),
         press_count=press_count,
         presses_after_teleport=presses_after_teleport,
-        speeds=speed_values,
+        speeds=speeds,
     )
     score = calculate_touchscreen_score(
         teleport_ratio=teleport_ratio,
@@ -152,33 +197,54 @@ def detect_touchscreen_usage(frames: list[ReplayFrame], decision_threshold: floa
     )
     return score >= decision_threshold, score
 
-def calculate_movement_sample(previous: ReplayFrame, current: ReplayFrame) -> tuple[float, float] | None:
-    delta = current.time - previous.time
-
-    if delta <= 0:
-        return None
+def calculate_movement_samples(frames: ReplayFrames) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """Calculate the speed of all movements, as well as the distance & validity of each movement"""
+    time_deltas = numpy.diff(frames.time)
 
     # Distance can be calculated using our good old friend pythagoras
     # Then we just use some simple 5th grade physics to calculate speed = distance / time
-    distance = hypot(current.x - previous.x, current.y - previous.y)
-    speed = distance / delta
-    return speed, distance
+    distances = numpy.hypot(numpy.diff(frames.x), numpy.diff(frames.y))
+
+    # Movements without any time passing can't be used
+    movements = time_deltas > 0
+    speeds = distances[movements] / time_deltas[movements]
+    return speeds, distances, movements
 
 def is_teleport_movement(
-    speed: float,
-    distance: float,
+    speed: numpy.ndarray,
+    distance: numpy.ndarray,
     jump_distance_threshold: float = 80.0,
     speed_threshold: float = 5.0,
-) -> bool:
+) -> numpy.ndarray:
     return (
-        distance >= jump_distance_threshold
-        and speed >= speed_threshold
+        (distance >= jump_distance_threshold)
+        & (speed >= speed_threshold)
     )
 
-def is_new_button_press(previous_buttons: int, current_buttons: int) -> bool:
+def is_new_button_press(previous_buttons: numpy.ndarray, current_buttons: numpy.ndarray) -> numpy.ndarray:
     previous_gameplay = previous_buttons & GAMEPLAY_BUTTONS
     current_gameplay = current_buttons & GAMEPLAY_BUTTONS
-    return bool(current_gameplay & ~previous_gameplay)
+    return (current_gameplay & ~previous_gameplay) != 0
+
+def count_presses_after_teleport(
+    times: numpy.ndarray,
+    teleports: numpy.ndarray,
+    presses: numpy.ndarray,
+    press_window_ms: int = 50,
+) -> int:
+    """Count the presses that happened shortly after the most recent teleport"""
+    # Index of the most recent teleport for every movement, or -1 if there was none yet
+    last_teleport = numpy.maximum.accumulate(
+        numpy.where(teleports, numpy.arange(len(teleports)), -1)
+    )
+    time_since_teleport = times - times[numpy.maximum(last_teleport, 0)]
+
+    return int(numpy.count_nonzero(
+        presses
+        & (last_teleport >= 0)
+        & (time_since_teleport >= 0)
+        & (time_since_teleport <= press_window_ms)
+    ))
 
 def calculate_touchscreen_score(
     teleport_ratio: float,
@@ -198,7 +264,7 @@ def build_touchscreen_stats(
     teleport_count: int,
     press_count: int,
     presses_after_teleport: int,
-    speeds: list[float],
+    speeds: numpy.ndarray,
 ) -> tuple[float, float, float]:
     teleport_ratio = teleport_count / movement_count
 
@@ -210,19 +276,8 @@ def build_touchscreen_stats(
 
     return teleport_ratio, press_teleport_ratio, p95_speed
 
-def is_press_after_teleport(
-    press_time: int,
-    last_teleport_time: int | None,
-    press_window_ms: int = 50,
-) -> bool:
-    if last_teleport_time is None:
-        return False
-
-    time_since_teleport = press_time - last_teleport_time
-    return 0 <= time_since_teleport <= press_window_ms
-
-def calculate_percentile(values: list[float], percentile: float) -> float:
-    if not values:
+def calculate_percentile(values: numpy.ndarray, percentile: float) -> float:
+    if not len(values):
         return 0.0
 
     return float(numpy.percentile(values, percentile * 100))
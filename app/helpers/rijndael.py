@@ -0,0 +1,158 @@
+
+from py3rijndael import Rijndael
+from py3rijndael.constants import shifts, Si, T5, T6, T7, T8
+from functools import lru_cache
+from typing import List
+
+import base64
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Score submissions are encrypted with rijndael-256 (32 byte blocks) in cbc mode.
+# All blocks of all fields get decrypted at once, using the lookup tables of
+# py3rijndael as numpy arrays, since cbc decryption does not depend on the output
+# of the previous block. The key schedule is only expanded once for every key.
+# py3rijndael itself is used as a fallback, in case numpy is not available.
+
+BLOCK_SIZE = 32
+DEFAULT_KEY = "h89f2-890h2h89b34g-h80g134n90133"
+
+if numpy is not None:
+    TABLES = tuple(
+        numpy.array(table, dtype=numpy.uint32)
+        for table in (T5, T6, T7, T8)
+    )
+    INVERSE_SBOX = numpy.array(Si, dtype=numpy.uint32)
+
+    # Column offsets of the inverse "ShiftRows" step
+    COLUMNS = numpy.arange(BLOCK_SIZE // 4)
+    SHIFTS = tuple(
+        (COLUMNS + shifts[2][row][1]) % len(COLUMNS)
+        for row in range(1, 4)
+    )
+
+@lru_cache(maxsize=128)
+def key_schedule(key: str) -> Rijndael:
+    """Expand the round keys for a decryption key"""
+    return Rijndael(key.encode(), block_size=BLOCK_SIZE)
+
+@lru_cache(maxsize=128)
+def round_keys(key: str) -> "numpy.ndarray":
+    return numpy.array(key_schedule(key).Kd, dtype=numpy.uint32)
+
+def decrypt_string(b64: str | None, iv: bytes, key: str = DEFAULT_KEY) -> str | None:
+    """Decrypt a rijndael encrypted string"""
+    return decrypt_fields([b64], iv, key)[0]
+
+def decrypt_fields(fields: List[str | None], iv: bytes, key: str = DEFAULT_KEY) -> List[str | None]:
+    """Decrypt multiple rijndael encrypted strings, that share the same iv"""
+    ciphertexts = [
+        base64.b64decode(field) if field is not None else None
+        for field in fields
+    ]
+
+    for ciphertext in ciphertexts:
+        if ciphertext is None:
+            continue
+
+        if not ciphertext or len(ciphertext) % BLOCK_SIZE:
+            raise ValueError(f'Invalid ciphertext length: {len(ciphertext)}')
+
+    if len(iv) != BLOCK_SIZE:
+        raise ValueError(f'Invalid iv length: {len(iv)}')
+
+    decrypt = (
+        decrypt_blocks_numpy
+        if numpy is not None
+        else decrypt_blocks_python
+    )
+
+    return [
+        unpad(plaintext).decode() if plaintext is not None else None
+        for plaintext in decrypt(ciphertexts, iv, key)
+    ]
+
+def decrypt_blocks_numpy(ciphertexts: List[bytes | None], iv: bytes, key: str) -> List[bytes | None]:
+    present = [ciphertext for ciphertext in ciphertexts if ciphertext is not None]
+
+    if not present:
+        return list(ciphertexts)
+
+    # The previous ciphertext block of every block, where
+    # the first block of every field is chained to the iv
+    previous = b''.join(iv + ciphertext[:-BLOCK_SIZE] for ciphertext in present)
+    blocks = b''.join(present)
+
+    state = decrypt_state(
+        numpy.frombuffer(blocks, dtype='>u4').reshape(-1, len(COLUMNS)),
+        round_keys(key)
+    )
+    state ^= numpy.frombuffer(previous, dtype=numpy.uint8).reshape(state.shape)
+    plaintext = state.tobytes()
+
+    results = []
+    offset = 0
+
+    for ciphertext in ciphertexts:
+        if ciphertext is None:
+            results.append(None)
+            continue
+
+        results.append(plaintext[offset:offset + len(ciphertext)])
+        offset += len(ciphertext)
+
+    return results
+
+def decrypt_state(state: "numpy.ndarray", keys: "numpy.ndarray") -> "numpy.ndarray":
+    """Run the inverse cipher over a (blocks, columns) array of big-endian words"""
+    t1, t2, t3, t4 = TABLES
+    s1, s2, s3 = SHIFTS
+
+    state = state.astype(numpy.uint32) ^ keys[0]
+
+    for round_key in keys[1:-1]:
+        state = (
+            t1[state >> 24] ^
+            t2[(state[:, s1] >> 16) & 0xFF] ^
+            t3[(state[:, s2] >> 8) & 0xFF] ^
+            t4[state[:, s3] & 0xFF] ^
+            round_key
+        )
+
+    # The last round only applies the inverse s-box
+    last_key = keys[-1]
+    output = numpy.empty((*state.shape, 4), dtype=numpy.uint8)
+    output[..., 0] = INVERSE_SBOX[state >> 24] ^ (last_key >> 24)
+    output[..., 1] = INVERSE_SBOX[(state[:, s1] >> 16) & 0xFF] ^ (last_key >> 16)
+    output[..., 2] = INVERSE_SBOX[(state[:, s2] >> 8) & 0xFF] ^ (last_key >> 8)
+    output[..., 3] = INVERSE_SBOX[state[:, s3] & 0xFF] ^ last_key
+    return output.reshape(state.shape[0], BLOCK_SIZE)
+
+def decrypt_blocks_python(ciphertexts: List[bytes | None], iv: bytes, key: str) -> List[bytes | None]:
+    rijndael = key_schedule(key)
+    results = []
+
+    for ciphertext in ciphertexts:
+        if ciphertext is None:
+            results.append(None)
+            continue
+
+        plaintext = bytearray()
+        previous = iv
+
+        for offset in range(0, len(ciphertext), BLOCK_SIZE):
+            block = ciphertext[offset:offset + BLOCK_SIZE]
+            decrypted = rijndael.decrypt(block)
+            plaintext += bytes(a ^ b for a, b in zip(decrypted, previous))
+            previous = block
+
+        results.append(bytes(plaintext))
+
+    return results
+
+def unpad(plaintext: bytes) -> bytes:
+    """Remove the pkcs7 padding of a plaintext"""
+    return plaintext[:-plaintext[-1]]
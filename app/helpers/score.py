@@ -1,8 +1,10 @@
 
+from app.helpers.rankings import ScoreRanking
+from app.helpers import performance_pool
+from app.helpers.timing import StageTimer
 from app.helpers.enums import BadFlags
 from app.common.config import config_instance as config
-from app.common.database.repositories import scores
-from app.common.helpers import performance, replays
+from app.common.helpers import replays
 from app.common import officer
 from app.common.database import (
     DBBeatmap,
@@ -16,9 +18,11 @@ from app.common.constants import (
     Mods
 )
 from sqlalchemy.orm import Session
+from functools import cached_property
 from datetime import datetime
 
 import hashlib
+import app
 
 class Score:
     def __init__(
@@ -79,8 +83,14 @@ class Score:
         self.ppv1 = 0.0
         self.pp = 0.0
 
-        self.personal_best_score: DBScore
-        self.personal_best_pp: DBScore
+        # Calculations that didn't finish in time, and
+        # will be run again after the score was submitted
+        self.pending_calculations: set[str] = set()
+
+        # Durations & query counts of the submission stages
+        self.timings = StageTimer()
+
+        self.ranking = ScoreRanking()
         self.beatmap: DBBeatmap
         self.user: DBUser
 
@@ -97,6 +107,14 @@ class Score:
     def __repr__(self) -> str:
         return f'<Score {self.username} ({self.score_checksum})>'
 
+    @property
+    def personal_best_pp(self) -> DBScore | None:
+        return self.ranking.personal_best_pp
+
+    @property
+    def personal_best_score(self) -> DBScore | None:
+        return self.ranking.personal_best_score
+
     @property
     def is_performance_pb(self) -> bool:
         return self.status_pp == ScoreStatus.Best
@@ -109,6 +127,13 @@ class Score:
     def has_pb(self) -> bool:
         return self.is_performance_pb or self.is_score_pb
 
+    @cached_property
+    def replay_checksum(self) -> str | None:
+        if not self.replay:
+            return None
+
+        return hashlib.md5(self.replay).hexdigest()
+
     @property
     def relaxing(self) -> bool:
         return (Mods.Relax in self.enabled_mods) or (Mods.Autopilot in self.enabled_mods)
@@ -198,9 +223,15 @@ class Score:
 
         return True if mods in self.enabled_mods else False
 
-    def calculate_ppv1(self, session: Session) -> float:
+    def calculate_ppv1(self) -> float:
         score = self.to_database()
-        result = performance.calculate_ppv1(score, session)
+
+        try:
+            result = performance_pool.calculate_ppv1(score)
+        except performance_pool.CalculationUnavailable as e:
+            app.session.logger.warning(f'Failed to calculate ppv1 for {self}: {e}')
+            self.pending_calculations.add('ppv1')
+            return 0.0
 
         if result is None:
             officer.call('Failed to calculate ppv1: No result')
@@ -210,7 +241,13 @@ class Score:
 
     def calculate_ppv2(self) -> float:
         score = self.to_database()
-        result = performance.calculate_ppv2(score)
+
+        try:
+            result = performance_pool.calculate_ppv2(score, self.beatmap.md5)
+        except performance_pool.CalculationUnavailable as e:
+            app.session.logger.warning(f'Failed to calculate pp for {self}: {e}')
+            self.pending_calculations.add('ppv2')
+            return 0.0
 
         if result is None:
             officer.call('Failed to calculate pp: No result')
@@ -240,57 +277,20 @@ class Score:
         if not self.passed:
             return ScoreStatus.Exited if self.exited else ScoreStatus.Failed
 
-        if not self.personal_best_pp:
-            return ScoreStatus.Best
-
-        # Use pp to determine the better score, but fallback
-        # to total score, if the pp is the same (spin to win)
-        better_score = (
-            self.pp > self.personal_best_pp.pp
-            if round(self.pp) != round(self.personal_best_pp.pp)
-            else self.total_score > self.personal_best_pp.total_score
+        if 'ppv2' in self.pending_calculations:
+            # The pp of this score is unknown, which means that
+            # the status will be resolved after the recalculation
+            self.pending_calculations.add('status_pp')
+            return ScoreStatus.Submitted
+
+        return resolve_pp_status(
+            self.pp,
+            self.total_score,
+            self.enabled_mods.value,
+            self.ranking,
+            session
         )
 
-        if not better_score:
-            if self.enabled_mods.value == self.personal_best_pp.mods:
-                return ScoreStatus.Submitted
-
-            # Check pb with mods
-            mods_pb = scores.fetch_personal_best(
-                self.beatmap.id,
-                self.user.id,
-                self.mode.value,
-                self.enabled_mods.value,
-                session
-            )
-
-            if not mods_pb:
-                return ScoreStatus.Mods
-
-            if self.total_score < mods_pb.total_score:
-                return ScoreStatus.Submitted
-
-            # Change status for old personal best
-            session.query(DBScore) \
-                .filter(DBScore.id == mods_pb.id) \
-                .update({'status_pp': ScoreStatus.Submitted.value})
-            session.flush()
-            return ScoreStatus.Mods
-
-        # New pb was set
-        status: dict = (
-            {'status_pp': ScoreStatus.Submitted.value}
-            if self.enabled_mods.value == self.personal_best_pp.mods else
-            {'status_pp': ScoreStatus.Mods.value}
-        )
-
-        session.query(DBScore) \
-            .filter(DBScore.id == self.personal_best_pp.id) \
-            .update(status)
-
-        session.flush()
-        return ScoreStatus.Best
-
     def calculate_score_status(self, session: Session) -> ScoreStatus:
         """Set the score status of this score, and the personal best of the user
 
@@ -323,13 +323,7 @@ class Score:
                 return ScoreStatus.Submitted
 
             # Check pb with mods
-            mods_pb = scores.fetch_personal_best_score(
-                self.beatmap.id,
-                self.user.id,
-                self.mode.value,
-                self.enabled_mods.value,
-                session
-            )
+            mods_pb = self.ranking.mods_best_score
 
             if not mods_pb:
                 return ScoreStatus.Mods
@@ -488,8 +482,58 @@ class Score:
             touchscreen=self.touchscreen,
             failtime=self.failtime,
             submitted_at=datetime.now(),
-            replay_md5=(
-                hashlib.md5(self.replay).hexdigest()
-                if self.replay else None
-            )
+            replay_md5=self.replay_checksum
         )
+
+def resolve_pp_status(
+    pp: float,
+    total_score: int,
+    mods: int,
+    ranking: ScoreRanking,
+    session: Session
+) -> ScoreStatus:
+    """Resolve the performance status of a passed score, and demote the previous personal best"""
+    if not ranking.personal_best_pp:
+        return ScoreStatus.Best
+
+    # Use pp to determine the better score, but fallback
+    # to total score, if the pp is the same (spin to win)
+    better_score = (
+        pp > ranking.personal_best_pp.pp
+        if round(pp) != round(ranking.personal_best_pp.pp)
+        else total_score > ranking.personal_best_pp.total_score
+    )
+
+    if not better_score:
+        if mods == ranking.personal_best_pp.mods:
+            return ScoreStatus.Submitted
+
+        # Check pb with mods
+        mods_pb = ranking.mods_best_pp
+
+        if not mods_pb:
+            return ScoreStatus.Mods
+
+        if total_score < mods_pb.total_score:
+            return ScoreStatus.Submitted
+
+        # Change status for old personal best
+        session.query(DBScore) \
+            .filter(DBScore.id == mods_pb.id) \
+            .update({'status_pp': ScoreStatus.Submitted.value})
+        session.flush()
+        return ScoreStatus.Mods
+
+    # New pb was set
+    status: dict = (
+        {'status_pp': ScoreStatus.Submitted.value}
+        if mods == ranking.personal_best_pp.mods else
+        {'status_pp': ScoreStatus.Mods.value}
+    )
+
+    session.query(DBScore) \
+        .filter(DBScore.id == ranking.personal_best_pp.id) \
+        .update(status)
+
+    session.flush()
+    return ScoreStatus.Best
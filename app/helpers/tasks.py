@@ -0,0 +1,224 @@
+
+from concurrent.futures import Future, wait
+from typing import Callable, Dict, List
+from redis.exceptions import ResponseError
+from app.common import officer
+
+import threading
+import secrets
+import socket
+import json
+import time
+import app
+import os
+
+# Jobs are stored inside a redis stream, and every deck worker joins
+# the same consumer group, so that each job is only processed once.
+# Jobs that were claimed by a worker which got recycled will be picked
+# up by another consumer, once they exceed the "STALE_JOB_TIMEOUT".
+
+STREAM = 'deck:tasks'
+GROUP = 'deck:tasks:workers'
+RETRIES = 'deck:tasks:retries'
+FAILED = 'deck:tasks:failed'
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 10
+STALE_JOB_TIMEOUT = 60 * 5
+FAILED_JOB_LIMIT = 1000
+BATCH_SIZE = 5
+
+# Move due jobs from the retry set back into the stream, without
+# losing or duplicating them when a consumer dies in between
+schedule_script = app.session.redis.register_script("""
+local jobs = redis.call('zrangebyscore', KEYS[1], 0, ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(jobs) do
+    redis.call('zrem', KEYS[1], job)
+    redis.call('xadd', KEYS[2], '*', 'job', job)
+end
+return #jobs
+""")
+
+Stage = Callable[[dict], None]
+stages: Dict[str, Stage] = {}
+
+consumer_name = f'{socket.gethostname()}:{os.getpid()}'
+consumer_thread: threading.Thread | None = None
+shutdown_event = threading.Event()
+
+def register(name: str) -> Callable:
+    """Register a task stage, that can be referenced by jobs"""
+
+    def wrapper(stage: Stage) -> Stage:
+        stages[name] = stage
+        return stage
+
+    return wrapper
+
+def submit(*stage_names: str, **data) -> None:
+    """Enqueue a job, which will run the given stages in order"""
+    if not stage_names:
+        return
+
+    for name in stage_names:
+        assert name in stages, f'Unknown task stage "{name}"'
+
+    enqueue({
+        # Identical jobs need to stay separate members of the retry set
+        'id': secrets.token_hex(8),
+        'stages': list(stage_names),
+        'data': data,
+        'attempts': 0
+    })
+
+def enqueue(job: dict) -> None:
+    app.session.redis.xadd(STREAM, {'job': json.dumps(job)})
+
+def setup() -> None:
+    try:
+        app.session.redis.xgroup_create(
+            STREAM, GROUP,
+            id='0', mkstream=True
+        )
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+def start() -> None:
+    global consumer_thread
+    setup()
+
+    shutdown_event.clear()
+    consumer_thread = threading.Thread(
+        target=consume,
+        name='deck-tasks',
+        daemon=True
+    )
+    consumer_thread.start()
+
+def stop(timeout: float = 10) -> None:
+    shutdown_event.set()
+
+    if consumer_thread is not None:
+        consumer_thread.join(timeout)
+
+def consume() -> None:
+    app.session.logger.info(f'Starting task consumer ({consumer_name})...')
+    last_claim = 0.0
+
+    while not shutdown_event.is_set():
+        try:
+            schedule_retries()
+
+            if time.time() - last_claim > STALE_JOB_TIMEOUT / 2:
+                process(claim_stale_jobs())
+                last_claim = time.time()
+
+            response = app.session.redis.xreadgroup(
+                GROUP, consumer_name,
+                {STREAM: '>'},
+                count=BATCH_SIZE,
+                block=1000
+            )
+
+            for _, messages in response or []:
+                process(messages)
+        except Exception as e:
+            officer.call(
+                f'Failed to consume task stream: "{e}"',
+                exc_info=e
+            )
+            shutdown_event.wait(5)
+
+def claim_stale_jobs() -> List[tuple]:
+    """Claim jobs of consumers, that did not acknowledge them in time"""
+    _, messages, *_ = app.session.redis.xautoclaim(
+        STREAM, GROUP, consumer_name,
+        min_idle_time=STALE_JOB_TIMEOUT * 1000,
+        start_id='0-0',
+        count=BATCH_SIZE
+    )
+    return messages
+
+def schedule_retries() -> None:
+    """Move jobs, which are due for a retry, back into the stream"""
+    schedule_script(
+        keys=[RETRIES, STREAM],
+        args=[time.time(), BATCH_SIZE]
+    )
+
+def process(messages: List[tuple]) -> None:
+    if not messages:
+        return
+
+    jobs: Dict[bytes, dict] = {
+        message_id: json.loads(fields[b'job'])
+        for message_id, fields in messages
+        if fields is not None
+    }
+
+    # Jobs that don't fit into the executor are moved back into the stream
+    futures: Dict[bytes, Future] = {
+        message_id: app.session.score_executor.submit(
+            job['stages'][0],
+            execute, job,
+            spill=enqueue
+        )
+        for message_id, job in jobs.items()
+    }
+    wait(futures.values())
+
+    # Jobs that raised outside of their stages stay pending,
+    # and will be claimed again after the stale job timeout
+    message_ids = [
+        message_id
+        for message_id, _ in messages
+        if message_id not in futures
+        or futures[message_id].exception() is None
+    ]
+
+    if not message_ids:
+        return
+
+    pipeline = app.session.redis.pipeline()
+    pipeline.xack(STREAM, GROUP, *message_ids)
+    pipeline.xdel(STREAM, *message_ids)
+    pipeline.execute()
+
+def execute(job: dict) -> None:
+    while job['stages']:
+        name = job['stages'][0]
+
+        try:
+            stages[name](job['data'])
+        except Exception as e:
+            return retry(job, name, e)
+
+        # Completed stages are removed from the
+        # job, so that retries will skip them
+        job['stages'].pop(0)
+
+def retry(job: dict, stage: str, exception: Exception) -> None:
+    # Jobs that were enqueued without an id still need a unique member
+    job.setdefault('id', secrets.token_hex(8))
+    job['attempts'] += 1
+
+    if job['attempts'] >= MAX_ATTEMPTS:
+        officer.call(
+            f'Task stage "{stage}" failed after {job["attempts"]} attempts.',
+            exc_info=exception
+        )
+        pipeline = app.session.redis.pipeline()
+        pipeline.lpush(FAILED, json.dumps(job))
+        pipeline.ltrim(FAILED, 0, FAILED_JOB_LIMIT - 1)
+        pipeline.execute()
+        return
+
+    app.session.logger.warning(
+        f'Task stage "{stage}" failed ({exception}), '
+        f'retrying... ({job["attempts"]}/{MAX_ATTEMPTS})'
+    )
+    app.session.redis.zadd(
+        RETRIES,
+        {json.dumps(job): time.time() + RETRY_DELAY * job['attempts']}
+    )
@@ -0,0 +1,89 @@
+
+from contextvars import ContextVar
+from typing import Dict, Tuple
+from sqlalchemy import event
+from app.helpers import metrics
+
+import time
+import app
+import os
+
+# Score submissions record the duration & the amount of database queries of
+# every stage inside of the submission pipeline, by using a lap timer.
+# Durations are collected inside of histograms, and submissions that exceed
+# the "SLOW_SUBMISSION_THRESHOLD" (in milliseconds) will be logged.
+
+SLOW_SUBMISSION_THRESHOLD = int(os.environ.get('SLOW_SUBMISSION_THRESHOLD', 1000))
+
+current_timer: ContextVar["StageTimer | None"] = ContextVar('current_timer', default=None)
+
+def setup() -> None:
+    event.listen(
+        app.session.database.engine,
+        'before_cursor_execute',
+        count_query
+    )
+
+def count_query(*args, **kwargs) -> None:
+    if (timer := current_timer.get()) is not None:
+        timer.queries += 1
+
+class StageTimer:
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        self.lap_started_at = self.started_at
+        self.queries = 0
+        self.lap_queries = 0
+        self.stages: Dict[str, Tuple[float, int]] = {}
+        self.activate()
+
+    def __repr__(self) -> str:
+        return f'<StageTimer ({self.elapsed:.0f}ms)>'
+
+    @property
+    def elapsed(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def activate(self) -> None:
+        """Count the database queries of the current context towards this timer"""
+        current_timer.set(self)
+
+    def lap(self, stage: str) -> None:
+        """Record everything since the previous lap as the given stage"""
+        now = time.perf_counter()
+        duration, queries = self.stages.get(stage, (0.0, 0))
+
+        self.stages[stage] = (
+            duration + (now - self.lap_started_at) * 1000,
+            queries + self.queries - self.lap_queries
+        )
+        self.lap_started_at = now
+        self.lap_queries = self.queries
+
+    def finish(self, name: str, description: str) -> None:
+        """Record all stages inside of the histograms, and log the submission if it was slow"""
+        total = self.elapsed
+        pipeline = app.session.redis.pipeline(transaction=False)
+        metrics.observe(f'{name}.total.milliseconds', total, pipeline)
+        metrics.increment(f'{name}.queries', self.queries, pipeline)
+
+        for stage, (duration, queries) in self.stages.items():
+            metrics.observe(f'{name}.{stage}.milliseconds', duration, pipeline)
+            metrics.increment(f'{name}.{stage}.queries', queries, pipeline)
+
+        try:
+            pipeline.execute()
+        except Exception as e:
+            app.session.logger.warning(f'Failed to record {name} timings: {e}')
+
+        if total < SLOW_SUBMISSION_THRESHOLD:
+            return
+
+        stages = ' '.join(
+            f'{stage}={duration:.0f}ms/{queries}q'
+            for stage, (duration, queries) in self.stages.items()
+        )
+        app.session.logger.warning(
+            f'Slow {name}: {description} '
+            f'total={total:.0f}ms/{self.queries}q {stages}'
+        )
@@ -0,0 +1,258 @@
+
+from app.common.config import config_instance as config
+from app.common.database.repositories import scores
+from app.helpers import weighting
+from sqlalchemy.orm import Session
+from sqlalchemy import event
+from dataclasses import dataclass
+from typing import Tuple
+
+import app
+
+# The top scores of a player are cached as a sorted set of score ids by pp,
+# next to the accuracy of each score and the current weighted sums.
+# Updating the list will only reweight the part of the list that got shifted,
+# instead of reloading & recalculating all best scores of a player.
+# Entries will expire after a while, to pick up changes from other services
+# and to correct the drift of the reweighted sums. Updates don't extend this.
+
+DECAY = weighting.DECAY
+EXPIRY = 3600
+
+# Scores are removed & inserted inside of a single script, so that concurrent
+# updates of the same player can't reweight the list based on stale totals.
+# The weighted sums of the part that got shifted are either summed up directly,
+# or derived from the totals, depending on which part of the list is shorter.
+update_script = app.session.redis.register_script("""
+local totals = redis.call('hmget', KEYS[3], 'pp', 'acc', 'count')
+if not totals[1] then
+    return false
+end
+
+local decay = tonumber(ARGV[1])
+local total_pp = tonumber(totals[1])
+local total_acc = tonumber(totals[2])
+local count = tonumber(totals[3])
+
+local function weighted_range(start, stop)
+    local entries = redis.call('zrevrange', KEYS[1], start, stop, 'withscores')
+    local weight = decay ^ start
+    local pp, acc = 0, 0
+    for i = 1, #entries, 2 do
+        pp = pp + tonumber(entries[i + 1]) * weight
+        acc = acc + (tonumber(redis.call('hget', KEYS[2], entries[i])) or 0) * weight
+        weight = weight * decay
+    end
+    return pp, acc
+end
+
+local function tail_sums(start)
+    if start >= count then
+        return 0, 0
+    end
+    if start > math.floor(count / 2) then
+        return weighted_range(start, -1)
+    end
+    local head_pp, head_acc = 0, 0
+    if start > 0 then
+        head_pp, head_acc = weighted_range(0, start - 1)
+    end
+    return total_pp - head_pp, total_acc - head_acc
+end
+
+if ARGV[2] ~= '' then
+    local index = redis.call('zrevrank', KEYS[1], ARGV[2])
+    if index then
+        local pp = tonumber(redis.call('zscore', KEYS[1], ARGV[2]))
+        local acc = tonumber(redis.call('hget', KEYS[2], ARGV[2])) or 0
+
+        -- Every score after the removed one moves up by one position
+        local tail_pp, tail_acc = tail_sums(index + 1)
+        local head_pp = total_pp - tail_pp - pp * decay ^ index
+        local head_acc = total_acc - tail_acc - acc * decay ^ index
+        total_pp = head_pp + tail_pp / decay
+        total_acc = head_acc + tail_acc / decay
+        count = count - 1
+
+        redis.call('zrem', KEYS[1], ARGV[2])
+        redis.call('hdel', KEYS[2], ARGV[2])
+    end
+end
+
+if ARGV[3] ~= '' then
+    local pp = tonumber(ARGV[4])
+    local acc = tonumber(ARGV[5])
+    local index = redis.call('zcount', KEYS[1], '(' .. ARGV[4], '+inf')
+
+    -- Every score after the inserted one moves down by one position
+    local tail_pp, tail_acc = tail_sums(index)
+    local head_pp = total_pp - tail_pp
+    local head_acc = total_acc - tail_acc
+    total_pp = head_pp + pp * decay ^ index + tail_pp * decay
+    total_acc = head_acc + acc * decay ^ index + tail_acc * decay
+    count = count + 1
+
+    redis.call('zadd', KEYS[1], ARGV[4], ARGV[3])
+    redis.call('hset', KEYS[2], ARGV[3], ARGV[5])
+end
+
+total_pp = string.format('%.17g', total_pp)
+total_acc = string.format('%.17g', total_acc)
+redis.call('hset', KEYS[3], 'pp', total_pp, 'acc', total_acc, 'count', count)
+
+-- Keys only expire together with the totals, which were set when loading the list
+local ttl = redis.call('pttl', KEYS[3])
+for _, key in ipairs(KEYS) do
+    if ttl > 0 and redis.call('pttl', key) == -1 then
+        redis.call('pexpire', key, ttl)
+    end
+end
+
+return {total_pp, total_acc, count}
+""")
+
+@dataclass(slots=True)
+class TopScores:
+    pp: float
+    acc: float
+    count: int
+
+    @property
+    def weighted_pp(self) -> float:
+        if not self.count:
+            return 0
+
+        return self.pp + weighting.bonus_pp(self.count)
+
+    @property
+    def weighted_acc(self) -> float:
+        if not self.count:
+            return 0
+
+        return (self.acc * weighting.bonus_acc(self.count)) / 100
+
+def scores_key(user_id: int, mode: int) -> str:
+    return f'deck:top_scores:{user_id}:{mode}'
+
+def accuracy_key(user_id: int, mode: int) -> str:
+    return f'deck:top_scores:{user_id}:{mode}:acc'
+
+def totals_key(user_id: int, mode: int) -> str:
+    return f'deck:top_scores:{user_id}:{mode}:totals'
+
+def fetch(user_id: int, mode: int, session: Session) -> TopScores:
+    """Fetch the weighted sums of a player's top scores, and load them if required"""
+    if top_scores := fetch_cached(user_id, mode):
+        return top_scores
+
+    return load(user_id, mode, session)
+
+def fetch_cached(user_id: int, mode: int) -> TopScores | None:
+    totals = app.session.redis.hgetall(totals_key(user_id, mode))
+
+    if not totals:
+        return None
+
+    return TopScores(
+        pp=float(totals[b'pp']),
+        acc=float(totals[b'acc']),
+        count=int(totals[b'count'])
+    )
+
+def load(user_id: int, mode: int, session: Session) -> TopScores:
+    """Load the top scores of a player from the database into the cache"""
+    best_scores = scores.fetch_best(
+        user_id=user_id,
+        mode=mode,
+        exclude_approved=(not config.APPROVED_MAP_REWARDS),
+        session=session
+    )
+
+    top_scores = TopScores(
+        pp=weighting.weighted_sum([score.pp for score in best_scores]),
+        acc=weighting.weighted_sum([score.acc for score in best_scores]),
+        count=len(best_scores)
+    )
+
+    keys = (
+        scores_key(user_id, mode),
+        accuracy_key(user_id, mode),
+        totals_key(user_id, mode)
+    )
+
+    pipeline = app.session.redis.pipeline()
+    pipeline.delete(*keys)
+
+    if best_scores:
+        pipeline.zadd(keys[0], {str(score.id): score.pp for score in best_scores})
+        pipeline.hset(keys[1], mapping={str(score.id): score.acc for score in best_scores})
+
+    pipeline.hset(keys[2], mapping={
+        'pp': top_scores.pp,
+        'acc': top_scores.acc,
+        'count': top_scores.count
+    })
+
+    for key in keys:
+        pipeline.expire(key, EXPIRY)
+
+    pipeline.execute()
+    return top_scores
+
+def update(
+    user_id: int,
+    mode: int,
+    session: Session,
+    insert: Tuple[int, float, float] | None = None,
+    remove: int | None = None
+) -> TopScores:
+    """Insert a new score (id, pp, acc) and/or remove an old score from a player's top scores"""
+    score_id, pp, acc = insert or ('', '', '')
+    result = update_script(
+        keys=[
+            scores_key(user_id, mode),
+            accuracy_key(user_id, mode),
+            totals_key(user_id, mode)
+        ],
+        args=[
+            DECAY,
+            remove if remove is not None else '',
+            score_id, repr(pp), repr(acc)
+        ]
+    )
+
+    # The cached list includes the new score from now on, which
+    # has to be reloaded, if the transaction won't be committed
+    invalidate_on_rollback(user_id, mode, session)
+
+    if result is None:
+        # The new score was already flushed to the database,
+        # so loading the top scores will already include it
+        return load(user_id, mode, session)
+
+    return TopScores(
+        pp=float(result[0]),
+        acc=float(result[1]),
+        count=int(result[2])
+    )
+
+def invalidate(user_id: int, mode: int) -> None:
+    """Remove the top scores of a player, which will be reloaded on the next lookup"""
+    app.session.redis.delete(
+        scores_key(user_id, mode),
+        accuracy_key(user_id, mode),
+        totals_key(user_id, mode)
+    )
+
+def invalidate_on_rollback(user_id: int, mode: int, session: Session) -> None:
+    committed = False
+
+    @event.listens_for(session, 'after_commit', once=True)
+    def on_commit(session: Session) -> None:
+        nonlocal committed
+        committed = True
+
+    @event.listens_for(session, 'after_transaction_end', once=True)
+    def on_transaction_end(session: Session, transaction) -> None:
+        if not committed:
+            invalidate(user_id, mode)
@@ -0,0 +1,56 @@
+
+from numpy.typing import ArrayLike
+from functools import cache
+
+import numpy
+
+DECAY = 0.95
+
+# Precomputed decay weights (0.95^index), which will
+# be extended whenever a longer list gets weighted
+decay_table = numpy.power(DECAY, numpy.arange(1024, dtype=numpy.float64))
+
+def decay_weights(count: int, offset: int = 0) -> numpy.ndarray:
+    """Get the decay weights for the positions offset..offset+count"""
+    global decay_table
+
+    if offset + count > len(decay_table):
+        size = max(offset + count, len(decay_table) * 2)
+        decay_table = numpy.power(DECAY, numpy.arange(size, dtype=numpy.float64))
+
+    return decay_table[offset:offset + count]
+
+def weighted_sum(values: ArrayLike, offset: int = 0) -> float:
+    """Sum up a list of values sorted by importance, starting at the given position"""
+    values = numpy.asarray(values, dtype=numpy.float64)
+
+    if not values.size:
+        return 0.0
+
+    return float(values @ decay_weights(values.size, offset))
+
+@cache
+def bonus_pp(count: int) -> float:
+    return 416.6667 * (1 - 0.9994 ** count)
+
+@cache
+def bonus_acc(count: int) -> float:
+    return 100.0 / (20 * (1 - DECAY ** count))
+
+def weighted_pp(pp_values: ArrayLike) -> float:
+    """Calculate the weighted pp for a list of pp values, sorted by pp"""
+    pp_values = numpy.asarray(pp_values, dtype=numpy.float64)
+
+    if not pp_values.size:
+        return 0
+
+    return weighted_sum(pp_values) + bonus_pp(pp_values.size)
+
+def weighted_acc(acc_values: ArrayLike) -> float:
+    """Calculate the weighted acc for a list of accuracy values, sorted by pp"""
+    acc_values = numpy.asarray(acc_values, dtype=numpy.float64)
+
+    if not acc_values.size:
+        return 0
+
+    return (weighted_sum(acc_values) * bonus_acc(acc_values.size)) / 100
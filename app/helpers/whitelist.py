@@ -0,0 +1,56 @@
+
+from app.common.database.repositories import releases
+from app.common.helpers import clients as client_utils
+from app.helpers.caching import LRUCache
+from app.helpers import invalidation, metrics
+from sqlalchemy.orm import Session
+from typing import Callable
+
+# Client executables are checked against the release tables on every score
+# submission, which only change a few times a month. The result of every
+# lookup (including rejected hashes) is kept in-process, until it expires or
+# a reload is requested through the "deck:whitelist:reload" channel, e.g.
+# after a release was added. Run "python main.py reload-whitelist" to publish
+# a reload, if the service that changed the releases doesn't publish it itself.
+
+CHANNEL = 'deck:whitelist:reload'
+EXPIRY = 60 * 10
+CAPACITY = 8192
+
+cache: LRUCache[tuple, bool] = LRUCache(CAPACITY, EXPIRY)
+
+def is_official_file(executable_hash: str, session: Session) -> bool:
+    return lookup(
+        ('official', executable_hash),
+        lambda: releases.official_file_exists(executable_hash, session=session)
+    )
+
+def is_valid_client_hash(version: int, executable_hash: str, session: Session) -> bool:
+    return lookup(
+        ('client', version, executable_hash),
+        lambda: client_utils.is_valid_client_hash(version, executable_hash, session=session)
+    )
+
+def is_valid_mod(identifier: str, executable_hash: str, session: Session) -> bool:
+    return lookup(
+        ('mod', identifier, executable_hash),
+        lambda: client_utils.is_valid_mod(identifier, executable_hash, session=session)
+    )
+
+def lookup(key: tuple, fetch: Callable[[], bool]) -> bool:
+    if (is_valid := cache.get(key)) is not None:
+        metrics.count('whitelist.hits')
+        return is_valid
+
+    metrics.count('whitelist.misses')
+    is_valid = bool(fetch())
+    cache.set(key, is_valid)
+    return is_valid
+
+def reload() -> None:
+    """Reset the whitelist of all deck workers"""
+    invalidation.publish(CHANNEL)
+
+@invalidation.register(CHANNEL)
+def on_reload(message: str | None) -> None:
+    cache.clear()
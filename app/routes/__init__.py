@@ -3,6 +3,7 @@ from fastapi.responses import PlainTextResponse
 from fastapi import APIRouter
 from app.session import config
 
+from . import metrics
 from . import release
 from . import rating
 from . import static
@@ -13,6 +14,7 @@ router.include_router(release.router, prefix='/release')
 router.include_router(rating.router, prefix='/rating')
 router.include_router(web.router, prefix='/web')
 router.include_router(static.router)
+router.include_router(metrics.router)
 
 @router.get('/')
 def index():
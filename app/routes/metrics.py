@@ -0,0 +1,22 @@
+
+from fastapi import APIRouter, HTTPException, Header
+from app.helpers import metrics
+
+import hmac
+import os
+
+router = APIRouter()
+
+# The metrics are only exported to scrapers that send the "METRICS_TOKEN"
+# as a bearer token, and the endpoint is disabled when no token is set.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+@router.get('/metrics')
+def prometheus_metrics(authorization: str | None = Header(None)) -> str:
+    if not METRICS_TOKEN:
+        raise HTTPException(404)
+
+    if not hmac.compare_digest(authorization or '', f'Bearer {METRICS_TOKEN}'):
+        raise HTTPException(401)
+
+    return metrics.export()
@@ -1,6 +1,5 @@
 
 from sqlalchemy.orm import Session
-from datetime import datetime
 from fastapi import (
     APIRouter,
     Depends,
@@ -11,10 +10,10 @@ from app.common.constants import UserActivity
 from app.common.helpers import activity
 from app.common.cache import status
 from app.common.database import (
-    beatmaps,
     ratings,
     users
 )
+from app.helpers import beatmap_cache, latest_activity
 
 import app.utils as utils
 import app
@@ -38,9 +37,9 @@ def ingame_rate(
     if not status.exists(player.id):
         return 'auth fail'
 
-    users.update(player.id, {'latest_activity': datetime.now()}, session)
+    latest_activity.update(player.id)
 
-    if not (beatmap := beatmaps.fetch_by_checksum(beatmap_md5, session)):
+    if not (beatmap := beatmap_cache.fetch_by_checksum(beatmap_md5, session)):
         return 'no exist'
 
     if beatmap.status <= 0:
@@ -104,9 +103,9 @@ def ingame_rate_with_rating(
     if not status.exists(player.id):
         return 'auth fail'
 
-    users.update(player.id, {'latest_activity': datetime.now()}, session)
+    latest_activity.update(player.id)
 
-    if not (beatmap := beatmaps.fetch_by_checksum(beatmap_md5, session)):
+    if not (beatmap := beatmap_cache.fetch_by_checksum(beatmap_md5, session)):
         return 'no exist'
 
     if beatmap.status <= 0:
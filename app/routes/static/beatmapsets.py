@@ -1,7 +1,8 @@
 
-from app.common.database import beatmapsets, beatmaps
+from app.common.database import beatmapsets
 from app.common.database.objects import DBBeatmap
 from app.utils import sanitize_filename
+from app.helpers import beatmap_cache
 
 from fastapi.responses import StreamingResponse
 from urllib.parse import quote
@@ -138,9 +139,9 @@ def resolve_beatmap(query: str) -> DBBeatmap | None:
     query = query.strip()
 
     if query.isdigit():
-        return beatmaps.fetch_by_id(int(query))
+        return beatmap_cache.fetch_by_id(int(query))
 
     if query.endswith('.osu'):
-        return beatmaps.fetch_by_file(query)
+        return beatmap_cache.fetch_by_file(query)
 
-    return beatmaps.fetch_by_checksum(query)
+    return beatmap_cache.fetch_by_checksum(query)
@@ -4,10 +4,11 @@ from sqlalchemy.orm import Session, load_only, selectinload
 from typing import Dict, List, Tuple
 from pydantic import BaseModel
 
-from app.common.database import DBBeatmap, DBBeatmapset, DBScore
-from app.common.constants import Grade
+from app.common.database import DBBeatmap, DBBeatmapset
+from app.helpers.beatmap_index import IndexedBeatmap
 from app.common.database import users
 from app.common.cache import status
+from app.helpers import beatmap_index, grade_map
 from app import utils
 
 import app
@@ -34,7 +35,7 @@ def get_beatmap_info(
     if not status.exists(player.id):
         raise HTTPException(401)
 
-    maps: List[Tuple[int, DBBeatmap]] = []
+    maps: List[Tuple[int, IndexedBeatmap]] = []
     total_maps = len(info.Filenames) + len(info.Ids)
 
     if total_maps <= 0 or total_maps > 100:
@@ -44,15 +45,11 @@ def get_beatmap_info(
         f'<{player.name} ({player.id})> -> Got {total_maps} beatmap requests.'
     )
 
-    filename_beatmaps = session.query(DBBeatmap) \
-        .options(*beatmap_info_load()) \
-        .filter(DBBeatmap.filename.in_(info.Filenames)) \
-        .all()
+    found_beatmaps = beatmap_index.fetch_by_filenames(info.Filenames)
 
-    found_beatmaps = {
-        beatmap.filename:beatmap
-        for beatmap in filename_beatmaps
-    }
+    if found_beatmaps is None:
+        # Index was not built yet
+        found_beatmaps = fetch_by_filenames(info.Filenames, session)
 
     for index, filename in enumerate(info.Filenames):
         if filename not in found_beatmaps:
@@ -65,12 +62,12 @@ def get_beatmap_info(
             found_beatmaps[filename]
         ))
 
-    id_beatmaps = session.query(DBBeatmap) \
-        .options(*beatmap_info_load()) \
-        .filter(DBBeatmap.id.in_(info.Ids)) \
-        .all()
+    id_beatmaps = beatmap_index.fetch_by_ids(info.Ids)
 
-    for beatmap in id_beatmaps:
+    if id_beatmaps is None:
+        id_beatmaps = fetch_by_ids(info.Ids, session)
+
+    for beatmap in id_beatmaps.values():
         # For the ids, the client doesn't require the index
         # and we can just set it to -1, so that it will lookup
         # the beatmap by its id
@@ -79,7 +76,7 @@ def get_beatmap_info(
             beatmap
         ))
 
-    grade_lookup = fetch_grade_lookup(
+    grade_lookup = grade_map.fetch(
         player.id,
         [beatmap.id for _, beatmap in maps],
         session
@@ -102,14 +99,14 @@ def get_beatmap_info(
 
         grades = grade_lookup.get(
             beatmap.id,
-            default_grades()
+            grade_map.default_grades()
         )
 
         beatmap_infos.append(
             "|".join(map(str, [
                 index,
                 beatmap.id,
-                beatmap.beatmapset.id,
+                beatmap.set_id,
                 beatmap.md5,
                 response_status,
                 *grades.values()
@@ -122,14 +119,6 @@ def get_beatmap_info(
 
     return "\n".join(beatmap_infos).encode()
 
-def default_grades() -> Dict[int, Grade]:
-    return {
-        0: Grade.N,
-        1: Grade.N,
-        2: Grade.N,
-        3: Grade.N
-    }
-
 def beatmap_info_load():
     return (
         load_only(
@@ -140,37 +129,29 @@ def beatmap_info_load():
             DBBeatmap.filename
         ),
         selectinload(DBBeatmap.beatmapset).load_only(
-            DBBeatmapset.id
+            DBBeatmapset.id,
+            DBBeatmapset.topic_id
         )
     )
 
-def fetch_grade_lookup(
-    user_id: int,
-    beatmap_ids: List[int],
-    session: Session
-) -> Dict[int, Dict[int, Grade]]:
-    if not beatmap_ids:
-        return {}
-
-    rows = session.query(
-        DBScore.beatmap_id,
-        DBScore.mode,
-        DBScore.grade
-    ) \
-        .filter(DBScore.beatmap_id.in_(beatmap_ids)) \
-        .filter(DBScore.user_id == user_id) \
-        .filter(DBScore.mode.in_((0, 1, 2, 3))) \
-        .filter(DBScore.status_pp == 3) \
-        .filter(DBScore.hidden == False) \
+def fetch_by_filenames(filenames: List[str], session: Session) -> Dict[str, IndexedBeatmap]:
+    results = session.query(DBBeatmap) \
+        .options(*beatmap_info_load()) \
+        .filter(DBBeatmap.filename.in_(filenames)) \
         .all()
 
-    grade_lookup = {}
+    return {
+        beatmap.filename: IndexedBeatmap.from_beatmap(beatmap)
+        for beatmap in results
+    }
 
-    for beatmap_id, mode, grade in rows:
-        grades = grade_lookup.setdefault(
-            beatmap_id,
-            default_grades()
-        )
-        grades[mode] = Grade[grade]
+def fetch_by_ids(ids: List[int], session: Session) -> Dict[int, IndexedBeatmap]:
+    results = session.query(DBBeatmap) \
+        .options(*beatmap_info_load()) \
+        .filter(DBBeatmap.id.in_(ids)) \
+        .all()
 
-    return grade_lookup
+    return {
+        beatmap.id: IndexedBeatmap.from_beatmap(beatmap)
+        for beatmap in results
+    }
@@ -3,7 +3,6 @@
 #       old benchmark feature.
 
 from sqlalchemy.orm import Session
-from datetime import datetime
 from fastapi import (
     HTTPException,
     APIRouter,
@@ -17,6 +16,7 @@ from app.common.database.repositories import (
     benchmarks,
     users
 )
+from app.helpers import latest_activity
 
 import json
 import app
@@ -165,10 +165,6 @@ def benchmark(
         hardware=hardware_dict
     )
 
-    users.update(
-        player.id,
-        {'latest_activity': datetime.now()},
-        session=session
-    )
+    latest_activity.update(player.id)
 
     return Response(str(benchmark.id))
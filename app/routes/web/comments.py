@@ -8,7 +8,6 @@ from app.common.cache import status
 
 from sqlalchemy.orm import Session
 from contextlib import suppress
-from datetime import datetime
 from typing import List
 from fastapi import (
     HTTPException,
@@ -16,6 +15,7 @@ from fastapi import (
     Depends,
     Form
 )
+from app.helpers import latest_activity
 
 import app
 
@@ -65,7 +65,7 @@ def get_comments(
         app.session.logger.warning("Failed to submit comment: Not logged in")
         raise HTTPException(401, detail='Bancho')
 
-    users.update(user.id, {'latest_activity': datetime.now()}, session)
+    latest_activity.update(user.id)
 
     if action == 'get':
         db_comments: List[DBComment] = []
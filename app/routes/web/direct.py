@@ -3,10 +3,10 @@ from app.common.config import config_instance as config
 from app.common.database import DBBeatmapset, DBUser
 from app.common.constants import DirectDisplayMode
 from app.utils import sanitize_filename
+from app.helpers import beatmap_cache
 from app.common import officer
 from app.common.database import (
     beatmapsets,
-    beatmaps,
     users,
     posts
 )
@@ -169,11 +169,11 @@ def pickup_info(
         beatmapset = beatmapsets.fetch_one(set_id, session)
 
     if beatmap_id:
-        beatmap = beatmaps.fetch_by_id(beatmap_id, session)
+        beatmap = beatmap_cache.fetch_by_id(beatmap_id, session)
         beatmapset = beatmap.beatmapset if beatmap else None
 
     if checksum:
-        beatmap = beatmaps.fetch_by_checksum(checksum, session)
+        beatmap = beatmap_cache.fetch_by_checksum(checksum, session)
         beatmapset = beatmap.beatmapset if beatmap else None
 
     if post_id:
@@ -1,6 +1,5 @@
 
 from sqlalchemy.orm import Session
-from datetime import datetime
 from fastapi import (
     HTTPException,
     APIRouter,
@@ -13,6 +12,7 @@ from app.common.config import config_instance as config
 from app.common.constants import UserActivity
 from app.common.helpers import activity
 from app.common.cache import status
+from app.helpers import latest_activity
 
 import app
 
@@ -34,11 +34,7 @@ def add_favourite(
     if not status.exists(player.id):
         raise HTTPException(401)
 
-    users.update(
-        player.id,
-        {'latest_activity': datetime.now()},
-        session
-    )
+    latest_activity.update(player.id)
 
     count = favourites.fetch_count(
         player.id,
@@ -89,11 +85,7 @@ def get_favourites(
     if not app.utils.check_password(password, player.bcrypt):
         raise HTTPException(401)
 
-    users.update(
-        player.id,
-        {'latest_activity': datetime.now()},
-        session
-    )
+    latest_activity.update(player.id)
 
     player_favourites = favourites.fetch_many(
         player.id,
@@ -1,7 +1,6 @@
 
 from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import Callable
+from typing import Callable, List
 from fastapi import (
     HTTPException,
     APIRouter,
@@ -14,7 +13,6 @@ from fastapi import (
 from app.common.database import DBBeatmap, DBScore, DBUser
 from app.common.database.repositories import (
     relationships,
-    beatmaps,
     scores,
     users
 )
@@ -23,6 +21,7 @@ from app.common.constants import LeaderboardType, GameMode, Mods
 from app.helpers.enums import SubmissionStatus, LegacyStatus
 from app.common.config import config_instance as config
 from app.common.cache import status
+from app.helpers import beatmap_cache, latest_activity, leaderboard_cache, rank_index
 
 import app
 
@@ -33,10 +32,10 @@ def resolve_beatmap(
     beatmap_hash: str,
     session: Session
 ) -> DBBeatmap | None:
-    if beatmap := beatmaps.fetch_by_file(beatmap_file, session):
+    if beatmap := beatmap_cache.fetch_by_file(beatmap_file, session):
         return beatmap
 
-    if beatmap := beatmaps.fetch_by_checksum(beatmap_hash, session):
+    if beatmap := beatmap_cache.fetch_by_checksum(beatmap_hash, session):
         return beatmap
 
 def resolve_player(
@@ -138,6 +137,115 @@ def score_string_legacy(score: DBScore, seperator: str = '|') -> str:
         str(score.submitted_at)
     ])
 
+def personal_best_index(player_id: int, beatmap_id: int, mode: GameMode, session: Session) -> int:
+    if rank := rank_index.fetch_rank(beatmap_id, mode.value, player_id, session):
+        return rank
+
+    return scores.fetch_score_index(
+        player_id,
+        beatmap_id,
+        mode.value,
+        session=session
+    )
+
+def leaderboard_variant(
+    mode: GameMode,
+    ranking_type: LeaderboardType = LeaderboardType.Top,
+    mods: Mods = Mods(0),
+    country: str = '',
+    request_version: int = 1,
+    send_nc: bool = True
+) -> str:
+    return f'{mode.value}:{ranking_type.value}:{mods.value}:{country}:{request_version}:{int(send_nc)}'
+
+def fetch_top_scores(
+    beatmap_id: int,
+    mode: GameMode,
+    ranking_type: LeaderboardType,
+    mods: Mods,
+    country: str,
+    friends: List[int] | None,
+    session: Session
+) -> List[DBScore]:
+    if ranking_type == LeaderboardType.Country:
+        return scores.fetch_range_scores_country(
+            beatmap_id,
+            mode=mode.value,
+            country=country,
+            limit=config.SCORE_RESPONSE_LIMIT,
+            session=session
+        )
+
+    if ranking_type == LeaderboardType.Friends:
+        return scores.fetch_range_scores_friends(
+            beatmap_id,
+            mode=mode.value,
+            friends=friends,
+            limit=config.SCORE_RESPONSE_LIMIT,
+            session=session
+        )
+
+    if ranking_type == LeaderboardType.SelectedMod:
+        return scores.fetch_range_scores_mods(
+            beatmap_id,
+            mode=mode.value,
+            mods=mods,
+            limit=config.SCORE_RESPONSE_LIMIT,
+            session=session
+        )
+
+    return scores.fetch_range_scores(
+        beatmap_id,
+        mode=mode.value,
+        limit=config.SCORE_RESPONSE_LIMIT,
+        session=session
+    )
+
+def top_score_lines(
+    beatmap_id: int,
+    mode: GameMode,
+    session: Session,
+    send_nc: bool = True,
+    request_version: int = 1
+) -> List[str]:
+    """Get the formatted top scores of a beatmap, for the global leaderboard"""
+    def render() -> List[str]:
+        top_scores = fetch_top_scores(
+            beatmap_id, mode,
+            LeaderboardType.Top,
+            Mods(0), '', None,
+            session
+        )
+        return [
+            score_string(score, index+1, send_nc, request_version)
+            for index, score in enumerate(top_scores)
+        ]
+
+    return leaderboard_cache.fetch(
+        beatmap_id,
+        leaderboard_variant(mode, send_nc=send_nc, request_version=request_version),
+        render
+    )
+
+def top_score_lines_legacy(beatmap_id: int, session: Session, seperator: str = '|') -> List[str]:
+    def render() -> List[str]:
+        top_scores = scores.fetch_range_scores(
+            beatmap_id,
+            mode=GameMode.Osu.value,
+            limit=config.SCORE_RESPONSE_LIMIT,
+            session=session
+        )
+        return [
+            score_string_legacy(score, seperator)
+            for score in top_scores
+        ]
+
+    return leaderboard_cache.fetch(
+        beatmap_id,
+        f'legacy:{seperator}',
+        render
+    )
+
 @router.get('/osu-osz2-getscores.php')
 def get_scores(
     session: Session = Depends(app.session.database.yield_session),
@@ -164,11 +272,7 @@ def get_scores(
     if not status.exists(player.id):
         raise HTTPException(401)
 
-    users.update(
-        player.id,
-        {'latest_activity': datetime.now()},
-        session=session
-    )
+    latest_activity.update(player.id)
 
     if not (beatmap := resolve_beatmap(beatmap_file, beatmap_hash, session)):
         return "-1|false" # Not Submitted
@@ -275,14 +379,18 @@ def get_scores(
         return "\n".join(response)
 
     if personal_best:
-        index = scores.fetch_score_index(
-            player.id,
-            beatmap.id,
-            mode.value,
-            mods           if ranking_type == LeaderboardType.SelectedMod else None,
-            friends        if ranking_type == LeaderboardType.Friends     else None,
-            player.country if ranking_type == LeaderboardType.Country     else None,
-            session
+        index = (
+            personal_best_index(player.id, beatmap.id, mode, session)
+            if ranking_type == LeaderboardType.Top else
+            scores.fetch_score_index(
+                player.id,
+                beatmap.id,
+                mode.value,
+                mods           if ranking_type == LeaderboardType.SelectedMod else None,
+                friends        if ranking_type == LeaderboardType.Friends     else None,
+                player.country if ranking_type == LeaderboardType.Country     else None,
+                session
+            )
         )
 
         response.append(
@@ -291,48 +399,38 @@ def get_scores(
     else:
         response.append('')
 
-    top_scores = []
-
-    if ranking_type == LeaderboardType.Top:
-        top_scores = scores.fetch_range_scores(
-            beatmap.id,
-            mode=mode.value,
-            limit=config.SCORE_RESPONSE_LIMIT,
-            session=session
-        )
-
-    elif ranking_type == LeaderboardType.Country:
-        top_scores = scores.fetch_range_scores_country(
-            beatmap.id,
-            mode=mode.value,
-            country=player.country,
-            limit=config.SCORE_RESPONSE_LIMIT,
-            session=session
-        )
-
-    elif ranking_type == LeaderboardType.Friends:
-        top_scores = scores.fetch_range_scores_friends(
-            beatmap.id,
-            mode=mode.value,
-            friends=friends,
-            limit=config.SCORE_RESPONSE_LIMIT,
-            session=session
-        )
+    country = player.country if ranking_type == LeaderboardType.Country else ''
+    selected_mods = mods if ranking_type == LeaderboardType.SelectedMod else Mods(0)
 
-    elif ranking_type == LeaderboardType.SelectedMod:
-        top_scores = scores.fetch_range_scores_mods(
+    def render() -> List[str]:
+        top_scores = fetch_top_scores(
             beatmap.id,
-            mode=mode.value,
-            mods=mods,
-            limit=config.SCORE_RESPONSE_LIMIT,
-            session=session
+            mode,
+            ranking_type,
+            selected_mods,
+            country,
+            friends,
+            session
         )
-
-    for index, score in enumerate(top_scores):
-        response.append(
+        return [
             score_string(score, index+1, send_nc, request_version)
-        )
+            for index, score in enumerate(top_scores)
+        ]
+
+    if ranking_type == LeaderboardType.Friends:
+        # Friend leaderboards are different for every player
+        response.extend(render())
+        return "\n".join(response)
 
+    variant = leaderboard_variant(
+        mode,
+        ranking_type,
+        selected_mods,
+        country,
+        request_version,
+        send_nc
+    )
+    response.extend(leaderboard_cache.fetch(beatmap.id, variant, render))
     return "\n".join(response)
 
 @router.get('/osu-getscores6.php')
@@ -356,11 +454,7 @@ def legacy_scores(
     if beatmap.md5 != beatmap_hash:
         return "1" # Update Available
 
-    users.update(
-        player.id,
-        {'latest_activity': datetime.now()},
-        session=session
-    )
+    latest_activity.update(player.id)
 
     response = []
     submission_status = SubmissionStatus.from_database_legacy(beatmap.status)
@@ -387,12 +481,7 @@ def legacy_scores(
     )
 
     if personal_best:
-        index = scores.fetch_score_index(
-            player.id,
-            beatmap.id,
-            mode.value,
-            session=session
-        )
+        index = personal_best_index(player.id, beatmap.id, mode, session)
 
         response.append(
             score_string(personal_best, index, send_nc)
@@ -400,18 +489,10 @@ def legacy_scores(
     else:
         response.append('')
 
-    top_scores = scores.fetch_range_scores(
-        beatmap.id,
-        mode=mode.value,
-        limit=config.SCORE_RESPONSE_LIMIT,
-        session=session
+    response.extend(
+        top_score_lines(beatmap.id, mode, session, send_nc)
     )
 
-    for index, score in enumerate(top_scores):
-        response.append(
-            score_string(score, index+1, send_nc)
-        )
-
     return "\n".join(response)
 
 @router.get('/osu-getscores5.php')
@@ -446,11 +527,7 @@ def legacy_scores_no_ratings(
             mode=mode.value
         )
 
-    users.update(
-        player.id,
-        {'latest_activity': datetime.now()},
-        session=session
-    )
+    latest_activity.update(player.id)
 
     response = []
     submission_status = SubmissionStatus.from_database_legacy(beatmap.status)
@@ -472,12 +549,7 @@ def legacy_scores_no_ratings(
     )
 
     if personal_best:
-        index = scores.fetch_score_index(
-            player.id,
-            beatmap.id,
-            mode.value,
-            session=session
-        )
+        index = personal_best_index(player.id, beatmap.id, mode, session)
 
         response.append(
             score_string(personal_best, index, send_nc)
@@ -485,18 +557,10 @@ def legacy_scores_no_ratings(
     else:
         response.append("")
 
-    top_scores = scores.fetch_range_scores(
-        beatmap.id,
-        mode=mode.value,
-        limit=config.SCORE_RESPONSE_LIMIT,
-        session=session
+    response.extend(
+        top_score_lines(beatmap.id, mode, session, send_nc)
     )
 
-    for index, score in enumerate(top_scores):
-        response.append(
-            score_string(score, index+1, send_nc)
-        )
-
     return "\n".join(response)
 
 @router.get('/osu-getscores4.php')
@@ -531,11 +595,7 @@ def legacy_scores_no_beatmap_data(
             mode=mode.value
         )
 
-    users.update(
-        player.id,
-        {'latest_activity': datetime.now()},
-        session=session
-    )
+    latest_activity.update(player.id)
 
     response = []
     submission_status = SubmissionStatus.from_database_legacy(beatmap.status)
@@ -554,12 +614,7 @@ def legacy_scores_no_beatmap_data(
     )
 
     if personal_best:
-        index = scores.fetch_score_index(
-            player.id,
-            beatmap.id,
-            mode.value,
-            session=session
-        )
+        index = personal_best_index(player.id, beatmap.id, mode, session)
 
         response.append(
             score_string(personal_best, index, send_nc)
@@ -567,18 +622,10 @@ def legacy_scores_no_beatmap_data(
     else:
         response.append('')
 
-    top_scores = scores.fetch_range_scores(
-        beatmap.id,
-        mode=mode.value,
-        limit=config.SCORE_RESPONSE_LIMIT,
-        session=session
+    response.extend(
+        top_score_lines(beatmap.id, mode, session, send_nc)
     )
 
-    for index, score in enumerate(top_scores):
-        response.append(
-            score_string(score, index+1, send_nc)
-        )
-
     return Response("\n".join(response))
 
 @router.get('/osu-getscores3.php')
@@ -603,18 +650,10 @@ def legacy_scores_no_personal_best(
     if skip_scores or not beatmap.is_ranked:
         return Response("\n".join(response))
 
-    top_scores = scores.fetch_range_scores(
-        beatmap.id,
-        mode=GameMode.Osu.value,
-        limit=config.SCORE_RESPONSE_LIMIT,
-        session=session
+    response.extend(
+        top_score_lines_legacy(beatmap.id, session)
     )
 
-    for score in top_scores:
-        response.append(
-            score_string_legacy(score)
-        )
-
     return Response("\n".join(response))
 
 @router.get('/osu-getscores2.php')
@@ -640,18 +679,10 @@ def legacy_scores_status_change(
     if skip_scores or not beatmap.is_ranked:
         return Response("\n".join(response))
 
-    top_scores = scores.fetch_range_scores(
-        beatmap.id,
-        mode=GameMode.Osu.value,
-        limit=config.SCORE_RESPONSE_LIMIT,
-        session=session
+    response.extend(
+        top_score_lines_legacy(beatmap.id, session)
     )
 
-    for score in top_scores:
-        response.append(
-            score_string_legacy(score)
-        )
-
     return Response("\n".join(response))
 
 @router.get('/osu-getscores.php')
@@ -659,17 +690,9 @@ def legacy_scores_no_status(
     session: Session = Depends(app.session.database.yield_session),
     beatmap_hash: str = Query(..., alias='c')
 ) -> str:
-    if not (beatmap := beatmaps.fetch_by_checksum(beatmap_hash, session)):
+    if not (beatmap := beatmap_cache.fetch_by_checksum(beatmap_hash, session)):
         return "-1" # Not Submitted
 
-    top_scores = scores.fetch_range_scores(
-        beatmap.id,
-        mode=GameMode.Osu.value,
-        limit=config.SCORE_RESPONSE_LIMIT,
-        session=session
+    return "\n".join(
+        top_score_lines_legacy(beatmap.id, session, seperator=':')
     )
-
-    return "\n".join([
-        score_string_legacy(score, seperator=':')
-        for score in top_scores
-    ])
@@ -1,11 +1,11 @@
 
 from fastapi import APIRouter, Request, Query, Depends
 from sqlalchemy.orm import Session
-from datetime import datetime
 
 from app.common.database.repositories import users
 from app.common.helpers import ip
 from app import utils
+from app.helpers import latest_activity
 
 import app
 
@@ -27,11 +27,7 @@ def legacy_login(
     if player.restricted or not player.activated:
         return "0"
 
-    users.update(
-        player.id,
-        {'latest_activity': datetime.now()},
-        session=session
-    )
+    latest_activity.update(player.id)
 
     ip_address = ip.resolve_ip_address_fastapi(request)
 
@@ -1,7 +1,7 @@
 
 from fastapi import HTTPException, APIRouter, Response
 from app.common.database.objects import DBBeatmap
-from app.common.database import beatmaps
+from app.helpers import beatmap_cache
 from urllib.parse import quote
 
 import app
@@ -31,9 +31,9 @@ def resolve_beatmap(query: str) -> DBBeatmap | None:
     query = query.strip()
 
     if query.isdigit():
-        return beatmaps.fetch_by_id(int(query))
+        return beatmap_cache.fetch_by_id(int(query))
 
     if query.endswith('.osu'):
-        return beatmaps.fetch_by_file(query)
+        return beatmap_cache.fetch_by_file(query)
 
-    return beatmaps.fetch_by_checksum(query)
+    return beatmap_cache.fetch_by_checksum(query)
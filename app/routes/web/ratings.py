@@ -1,6 +1,5 @@
 
 from sqlalchemy.orm import Session
-from datetime import datetime
 from fastapi import (
     APIRouter,
     Depends,
@@ -11,15 +10,15 @@ from app.common.constants import UserActivity
 from app.common.helpers import activity
 from app.common.cache import status
 from app.common.database import (
-    beatmaps,
     ratings,
     users
 )
-
-router = APIRouter()
+from app.helpers import beatmap_cache, latest_activity
 
 import app
 
+router = APIRouter()
+
 @router.get('/osu-rate.php')
 def rate(
     session: Session = Depends(app.session.database.yield_session),
@@ -37,9 +36,9 @@ def rate(
     if not status.exists(player.id):
         return 'auth fail'
 
-    users.update(player.id, {'latest_activity': datetime.now()}, session)
+    latest_activity.update(player.id)
 
-    if not (beatmap := beatmaps.fetch_by_checksum(beatmap_md5, session)):
+    if not (beatmap := beatmap_cache.fetch_by_checksum(beatmap_md5, session)):
         return 'no exist'
 
     if beatmap.status <= 0:
@@ -11,7 +11,6 @@ from app.common.database.repositories import (
 )
 
 from sqlalchemy.orm import Session
-from datetime import datetime
 from fastapi import (
     HTTPException,
     APIRouter,
@@ -19,6 +18,7 @@ from fastapi import (
     Depends,
     Query
 )
+from app.helpers import latest_activity
 
 import app
 
@@ -45,7 +45,7 @@ def get_replay(
         if not status.exists(player.id):
             raise HTTPException(401)
 
-        users.update(player.id, {'latest_activity': datetime.now()}, session)
+        latest_activity.update(player.id)
         app.session.logger.info(f'{player} -> Requested replay for "{score_id}".')
 
     if not (score := scores.fetch_by_id(score_id, session)):
@@ -13,26 +13,24 @@ from fastapi import (
     Form
 )
 
-from py3rijndael import RijndaelCbc, Pkcs7Padding
-from concurrent.futures import Future
 from sqlalchemy.orm import Session
-from typing import Tuple, List
+from typing import Callable, Tuple, List
 from datetime import datetime
 from copy import copy
 
 from app.helpers import achievements as AchievementManager
-from app.helpers.score import Score, ScoreStatus
+from app.helpers.score import Score, ScoreStatus, resolve_pp_status
 from app.helpers.enums import BadFlags
 from app.helpers.chart import Chart
-from app.helpers import highlights, replays
+from app.helpers.timing import StageTimer
+from app.helpers import beatmap_cache, beatmap_counters, grade_counts, grade_map, highlights, idempotency, latest_activity, leaderboard_cache, performance_pool, permission_cache, rank_index, rankings, replay_checksums, replays, rijndael, tasks, top_scores, whitelist
 
 from app.common.constants import GameMode, ButtonState, NotificationType, Mods
 from app.common.helpers.ip import resolve_ip_address_fastapi
 from app.common.helpers.score import calculate_rx_score
 from app.common.database import DBStats, DBScore, DBUser
 from app.common.config import config_instance as config
-from app.common.helpers import clients as client_utils
-from app.common.helpers import performance, permissions
+from app.common.helpers import performance
 from app.common.cache import leaderboards, status
 from app.common.constants import regexes
 from app.common import officer
@@ -46,36 +44,21 @@ from app.common.database.repositories import (
     scores,
     logins,
     plays,
-    releases,
     users,
     stats
 )
 
-import hashlib
 import base64
 import app
 
 router = APIRouter()
 
-def decrypt_string(
-    b64: str | None,
-    iv: bytes,
-    key: str = "h89f2-890h2h89b34g-h80g134n90133"
-) -> str | None:
-    """Decrypt a rinjdael encrypted string"""
-    if b64 is None:
-        return None
-
-    rjn = RijndaelCbc(
-        key=key.encode(),
-        iv=iv,
-        padding=Pkcs7Padding(32),
-        block_size=32
-    )
-    return rjn.decrypt(base64.b64decode(b64)).decode()
+# Replays are staged in redis until the "upload_replay" task has stored them
+STAGED_REPLAY_EXPIRY = 60 * 60 * 24
 
 async def parse_score_data(request: Request) -> Score:
     """Parse the score submission request and return a score object"""
+    timings = StageTimer()
     user_agent = request.headers.get('user-agent', 'osu!')
     ip = resolve_ip_address_fastapi(request)
 
@@ -88,9 +71,12 @@ async def parse_score_data(request: Request) -> Score:
 
     if score_data := query.get('score'):
         # Legacy score was submitted via. query argument
-        return await parse_legacy_score_data(
+        score = await parse_legacy_score_data(
             score_data, query, form, ip
         )
+        score.timings = timings
+        score.timings.lap('parse')
+        return score
 
     # NOTE: The form data can contain two "score" sections, where one
     #       of them is the score data, and the other is the replay
@@ -148,7 +134,7 @@ async def parse_score_data(request: Request) -> Score:
         replay_data = await replay.read()
 
     # Default decryption key for old score submission endpoints
-    decryption_key = "h89f2-890h2h89b34g-h80g134n90133"
+    decryption_key = rijndael.DEFAULT_KEY
 
     if osu_version := form.get('osuver'):
         # New score submission endpoint uses a different encryption key
@@ -159,10 +145,10 @@ async def parse_score_data(request: Request) -> Score:
         try:
             assert isinstance(iv, str), "IV must be a string"
             iv = base64.b64decode(iv)
-            client_hash = decrypt_string(client_hash, iv, decryption_key)
-            fun_spoiler = decrypt_string(fun_spoiler, iv, decryption_key)
-            score_data = decrypt_string(score_data, iv, decryption_key)
-            processes = decrypt_string(processes, iv, decryption_key)
+            client_hash, fun_spoiler, score_data, processes = rijndael.decrypt_fields(
+                [client_hash, fun_spoiler, score_data, processes],
+                iv, decryption_key
+            )
         except Exception as e:
             # Most likely an invalid score encryption key
             officer.call(
@@ -189,6 +175,8 @@ async def parse_score_data(request: Request) -> Score:
     score.fun_spoiler = fun_spoiler
     score.client_hash = client_hash
     score.processes = processes
+    score.timings = timings
+    score.timings.lap('parse')
     return score
 
 async def parse_legacy_score_data(
@@ -313,9 +301,13 @@ def perform_score_validation(
             )
             return 'error: ban'
 
-        # Check for duplicate score
-        replay_hash = hashlib.md5(score.replay).hexdigest()
-        duplicate_score = scores.fetch_by_replay_checksum(replay_hash, session)
+        # Check for duplicate score, the database only
+        # needs to be queried if the replay could be known
+        duplicate_score = (
+            scores.fetch_by_replay_checksum(score.replay_checksum, session)
+            if replay_checksums.might_exist(score.replay_checksum)
+            else None
+        )
 
         if duplicate_score:
             if duplicate_score.user_id != player.id:
@@ -372,7 +364,6 @@ def perform_score_validation(
                     file=(score.replay_filename, score.serialize_replay() or b"")
                 )
                 score.touchscreen = True
-                score.pp = score.calculate_ppv2()
 
     if score.check_invalid_mods():
         officer.call(
@@ -389,10 +380,17 @@ def perform_score_validation(
             )
             return 'error: ban'
 
-    account_age = (datetime.now() - player.created_at)
-    pp_cutoff = min(1500, max(750, account_age.total_seconds() / 8))
+    if not score.passed:
+        # Failed scores can't award any pp
+        return None
+
+    # Calculate pp once the touchscreen detection has run,
+    # since touchscreen usage affects the performance result
+    score.timings.lap('validation')
+    score.pp = score.calculate_ppv2()
+    score.timings.lap('pp')
 
-    if score.beatmap.awards_pp and score.pp >= pp_cutoff:
+    if score.beatmap.awards_pp and exceeds_pp_limit(score.pp, player):
         officer.call(
             f'"{score.username}" exceeded the pp limit ({score.pp}).',
             file=(score.replay_filename, score.serialize_replay() or b"")
@@ -407,6 +405,12 @@ def perform_score_validation(
             )
             return 'error: ban'
 
+def exceeds_pp_limit(pp: float, player: DBUser) -> bool:
+    """Check if the pp of a score is unusually high for the age of the player's account"""
+    account_age = (datetime.now() - player.created_at)
+    pp_cutoff = min(1500, max(750, account_age.total_seconds() / 8))
+    return pp >= pp_cutoff
+
 def is_whitelisted_client(
     score: Score,
     player: DBUser,
@@ -426,7 +430,7 @@ def is_whitelisted_client(
         # Either the verification is completely disabled or ...
         config.DISABLE_CLIENT_VERIFICATION
         # a special permission exists to bypass verification, e.g. for TMG
-        or permissions.has_permission(
+        or permission_cache.has_permission(
             'clients.validation.bypass',
             player.id
         )
@@ -445,7 +449,7 @@ def is_whitelisted_client(
 
     executable_hash = client_hash.split(':', 1)[0]
 
-    if releases.official_file_exists(executable_hash, session=session):
+    if whitelist.is_official_file(executable_hash, session):
         return True
 
     identifier = (
@@ -460,173 +464,287 @@ def is_whitelisted_client(
     }
 
     if identifier in valid_identifiers:
-        return client_utils.is_valid_client_hash(
+        return whitelist.is_valid_client_hash(
             version,
             executable_hash,
-            session=session
+            session
         )
 
-    return client_utils.is_valid_mod(
+    return whitelist.is_valid_mod(
         identifier,
         executable_hash,
-        session=session
+        session
     )
 
-def upload_replay(score: Score, score_id: int) -> None:
+def should_upload_replay(score: Score) -> bool:
     if not score.passed or not score.replay:
-        return
+        return False
 
     if score.status_pp <= ScoreStatus.Exited:
-        return
-
-    app.session.logger.debug('Uploading replay...')
+        return False
 
     # Check replay size (10mb max)
     if len(score.replay) > 1e+7:
         app.session.logger.warning('Replay size exceeded maximum limit.')
-        return
+        return False
 
-    score_rank = scores.fetch_score_index_by_id(
-        mods=score.enabled_mods.value,
-        beatmap_id=score.beatmap.id,
-        mode=score.mode.value,
-        score_id=score_id
-    )
+    return True
 
-    # Replay will always be cached temporarily
-    app.session.storage.cache_replay(
-        score_id,
-        score.replay
+def staged_replay_key(score_id: int) -> str:
+    return f'deck:replays:{score_id}'
+
+def stage_replay(score_id: int, replay: bytes) -> None:
+    """Store a replay until it was uploaded, so that it doesn't need to be part of the task"""
+    app.session.redis.set(
+        staged_replay_key(score_id),
+        replay,
+        ex=STAGED_REPLAY_EXPIRY
     )
 
-    if not score.beatmap.is_ranked:
-        return
+@tasks.register('upload_replay')
+def upload_replay(data: dict) -> None:
+    app.session.logger.debug('Uploading replay...')
 
-    if score.status_pp < ScoreStatus.Submitted:
-        return
+    score_id = data['score_id']
+    replay = app.session.redis.get(staged_replay_key(score_id))
 
-    if score_rank > config.SCORE_RESPONSE_LIMIT * 10:
+    if replay is None:
+        app.session.logger.warning(f'Staged replay of score {score_id} has expired')
         return
 
-    # Replay met the requirement to be uploaded permanently
-    return app.session.storage.upload_replay(
-        score_id,
-        score.replay
-    )
+    # The staged replay is kept for retries, until the upload succeeded
+    store_replay(score_id, replay)
+    app.session.redis.delete(staged_replay_key(score_id))
 
-def calculate_weighted_pp(scores: List[DBScore]) -> float:
-    """Calculate the weighted pp for a list of scores"""
-    if not scores:
-        return 0
+def store_replay(score_id: int, replay: bytes) -> None:
+    with app.session.database.managed_session() as session:
+        if not (score := scores.fetch_by_id(score_id, session=session)):
+            return
 
-    weighted_pp = sum(score.pp * 0.95**index for index, score in enumerate(scores))
-    bonus_pp = 416.6667 * (1 - 0.9994 ** len(scores))
-    return weighted_pp + bonus_pp
+        score_rank = scores.fetch_score_index_by_id(
+            mods=score.mods,
+            beatmap_id=score.beatmap_id,
+            mode=score.mode,
+            score_id=score_id,
+            session=session
+        )
 
-def calculate_weighted_acc(scores: List[DBScore]) -> float:
-    """Calculate the weighted acc for a list of scores"""
-    if not scores:
-        return 0
+        # Replay will always be cached temporarily
+        app.session.storage.cache_replay(
+            score_id,
+            replay
+        )
 
-    weighted_acc = sum(score.acc * 0.95**index for index, score in enumerate(scores))
-    bonus_acc = 100.0 / (20 * (1 - 0.95 ** len(scores)))
-    return (weighted_acc * bonus_acc) / 100
+        if not score.beatmap.is_ranked:
+            return
 
-def update_stats(
-    score: Score,
-    player: DBUser,
-    session: Session
-) -> Tuple[DBStats, DBStats, dict]:
-    """Update the users and beatmaps stats. It will return the old & new stats for the user"""
-    app.session.logger.debug('Updating user stats...')
+        if score.status_pp < ScoreStatus.Submitted:
+            return
 
-    # Update beatmap stats
-    score.beatmap.playcount += 1
-    score.beatmap.passcount += 1 if score.passed else 0
-    session.flush()
+        if score_rank > config.SCORE_RESPONSE_LIMIT * 10:
+            return
 
-    # Find the matching user stats
-    user_stats = next(
-        (
-            mode_stats
-            for mode_stats in player.stats
-            if mode_stats.mode == score.mode.value
-        ),
-        None
-    )
-    assert user_stats is not None, f'Missing mode {score.mode.value} stats for user {player.id}'
+        # Replay met the requirement to be uploaded permanently
+        app.session.storage.upload_replay(
+            score_id,
+            replay
+        )
 
-    # Update user stats
-    old_stats = copy(user_stats)
-    old_rank, old_pp = resolve_preferred_ranking(player, score.mode.value)
-    new_rank, new_pp = old_rank, old_pp
+@tasks.register('update_plays')
+def update_plays(data: dict) -> None:
+    app.session.logger.debug('Updating plays...')
 
-    user_stats.playcount += 1
-    user_stats.playtime += score.elapsed_time
-    user_stats.tscore += score.total_score
-    user_stats.total_hits += score.total_hits
-    session.flush()
+    with app.session.database.managed_session() as session:
+        histories.update_plays(
+            data['user_id'],
+            data['mode'],
+            session
+        )
 
-    histories.update_plays(
-        user_stats.user_id,
-        user_stats.mode,
-        session
-    )
+        plays.update(
+            data['beatmap_filename'],
+            data['beatmap_id'],
+            data['user_id'],
+            data['beatmap_set_id'],
+            session=session
+        )
 
-    plays.update(
-        score.beatmap.filename,
-        score.beatmap.id,
-        score.user.id,
-        score.beatmap.set_id,
-        session=session
-    )
+@tasks.register('update_rank_history')
+def update_rank_history(data: dict) -> None:
+    with app.session.database.managed_session() as session:
+        player = users.fetch_by_id(
+            data['user_id'],
+            session=session
+        )
 
-    best_scores_by_score = scores.fetch_best_by_score(
-        user_id=score.user.id,
-        mode=score.mode.value,
-        session=session
-    )
+        user_stats = next(
+            (
+                mode_stats
+                for mode_stats in player.stats
+                if mode_stats.mode == data['mode']
+            ),
+            None
+        )
 
-    best_scores = scores.fetch_best(
-        user_id=score.user.id,
-        mode=score.mode.value,
-        exclude_approved=(not config.APPROVED_MAP_REWARDS),
-        session=session
-    )
+        if user_stats is None:
+            return
 
-    # Update max combo, if higher
-    if score.beatmap.is_ranked and score.has_pb:
-        if score.max_combo > user_stats.max_combo:
-            user_stats.max_combo = score.max_combo
+        histories.update_rank(
+            user_stats,
+            player.country
+        )
 
-    if best_scores:
-        # Update pp & acc
-        user_stats.pp = calculate_weighted_pp(best_scores)
-        user_stats.acc = calculate_weighted_acc(best_scores)
+@tasks.register('recalculate_pp')
+def recalculate_pp(data: dict) -> None:
+    resolved_best: DBScore | None = None
 
-        # Update rscore
-        user_stats.rscore = sum(
-            score.total_score
-            for score in best_scores_by_score
+    with app.session.database.managed_session() as session:
+        score = scores.fetch_by_id(
+            data['score_id'],
+            session=session
         )
 
-        # Update ppv1, if config allows for it
-        if not config.FROZEN_PPV1_UPDATES:
-            user_stats.ppv1 = performance.calculate_weighted_ppv1(best_scores)
+        if not score:
+            return
 
-        # Update score grades
-        grades = scores.fetch_grades(
-            user_stats.user_id,
-            user_stats.mode,
+        updates = {}
+
+        if 'ppv2' in data['recalculate']:
+            updates['pp'] = performance_pool.calculate_ppv2(
+                score,
+                score.beatmap.md5,
+                timeout=performance_pool.RECALCULATION_TIMEOUT
+            ) or 0.0
+
+        if 'ppv1' in data['recalculate']:
+            updates['ppv1'] = performance_pool.calculate_ppv1(
+                score,
+                timeout=performance_pool.RECALCULATION_TIMEOUT
+            ) or 0.0
+
+        scores.update(
+            score.id,
+            updates,
             session=session
         )
 
+        player = users.fetch_by_id(
+            data['user_id'],
+            session=session
+        )
+        previous_best: DBScore | None = None
+        pp = updates.get('pp', score.pp)
+
+        if 'status_pp' in data['recalculate']:
+            # The pp limit could not be checked during the submission
+            if score.beatmap.awards_pp and exceeds_pp_limit(pp, player):
+                officer.call(f'"{player.name}" exceeded the pp limit ({pp}).')
+
+                if not player.is_verified:
+                    app.session.events.submit(
+                        'restrict',
+                        user_id=player.id,
+                        autoban=True,
+                        reason=f'Exceeded pp limit ({round(pp)})'
+                    )
+                    after_commit(
+                        'remove restricted player from rank indexes',
+                        rank_index.remove_user,
+                        player.id,
+                        session
+                    )
+                    after_commit(
+                        'invalidate leaderboards of restricted player',
+                        leaderboard_cache.invalidate_user,
+                        player.id,
+                        session
+                    )
+                    return
+
+            ranking = rankings.fetch_score_ranking(
+                score.beatmap_id,
+                score.user_id,
+                score.mode,
+                score.mods,
+                score.total_score,
+                session=session
+            )
+            previous_best = ranking.personal_best_pp
+
+            status_pp = resolve_pp_status(
+                pp,
+                score.total_score,
+                score.mods,
+                ranking,
+                session
+            )
+            scores.update(
+                score.id,
+                {'status_pp': status_pp.value},
+                session=session
+            )
+
+            if status_pp != ScoreStatus.Best:
+                return
+
+            grade_counts.transition(
+                score.user_id,
+                score.mode,
+                score.grade,
+                previous_best.grade if previous_best else None,
+                session=session
+            )
+            resolved_best = score
+
+        elif score.status_pp != ScoreStatus.Best or not score.beatmap.awards_pp:
+            return
+
+        user_stats = next(
+            (
+                mode_stats
+                for mode_stats in player.stats
+                if mode_stats.mode == score.mode
+            ),
+            None
+        )
+
+        if user_stats is None:
+            return
+
+        # Reweight the top scores with the recalculated pp
+        best_scores = top_scores.update(
+            player.id,
+            score.mode,
+            session,
+            insert=(
+                (score.id, pp, score.acc)
+                if score.beatmap.awards_pp else None
+            ),
+            remove=(
+                score.id if resolved_best is None else
+                previous_best.id if previous_best else None
+            )
+        )
+        user_stats.pp = best_scores.weighted_pp
+        user_stats.acc = best_scores.weighted_acc
+
+        if 'ppv1' in updates and not config.FROZEN_PPV1_UPDATES:
+            user_stats.ppv1 = performance.calculate_weighted_ppv1(
+                scores.fetch_best(
+                    user_id=player.id,
+                    mode=score.mode,
+                    exclude_approved=(not config.APPROVED_MAP_REWARDS),
+                    session=session
+                )
+            )
+
         stats.update(
-            user_stats.user_id,
-            user_stats.mode,
+            player.id,
+            score.mode,
             {
-                f'{grade.lower()}_count': count
-                for grade, count in grades.items()
+                'pp': user_stats.pp,
+                'acc': user_stats.acc,
+                'ppv1': user_stats.ppv1
             },
             session=session
         )
@@ -636,17 +754,128 @@ def update_stats(
             player.country.lower()
         )
 
+    if resolved_best is not None:
+        grade_map.update(
+            resolved_best.user_id,
+            resolved_best.beatmap_id,
+            resolved_best.mode,
+            resolved_best.grade
+        )
+
+    app.session.events.submit(
+        'user_update',
+        user_id=data['user_id'],
+        mode=data['mode']
+    )
+
+@tasks.register('highlights')
+def check_highlights(data: dict) -> None:
+    with app.session.database.managed_session() as session:
+        player = users.fetch_by_id(
+            data['user_id'],
+            session=session
+        )
+
+        # Only the rank & playcount are required
+        # for checking the rank highlights
+        new_stats = DBStats(
+            user_id=data['user_id'],
+            mode=data['mode'],
+            **data['new_stats']
+        )
+        old_stats = DBStats(
+            user_id=data['user_id'],
+            mode=data['mode'],
+            **data['old_stats']
+        )
+
+        highlights.check(
+            data['score_id'], player,
+            new_stats, old_stats,
+            data['new_rank'], data['old_rank']
+        )
+
+def update_stats(
+    score: Score,
+    score_object: DBScore | None,
+    player: DBUser,
+    session: Session
+) -> Tuple[DBStats, DBStats, dict]:
+    """Update the users and beatmaps stats. It will return the old & new stats for the user"""
+    app.session.logger.debug('Updating user stats...')
+    user_stats, old_stats = update_play_stats(score, player, session)
+
+    old_rank, old_pp = resolve_preferred_ranking(player, score.mode.value)
+    new_rank, new_pp = old_rank, old_pp
+
+    if score_object is not None and score.is_performance_pb:
+        # Replace the previous personal best inside the top scores
+        best_scores = top_scores.update(
+            player.id,
+            score.mode.value,
+            session,
+            insert=(
+                (score_object.id, score_object.pp, score_object.acc)
+                if score.beatmap.awards_pp else None
+            ),
+            remove=(
+                score.personal_best_pp.id
+                if score.personal_best_pp else None
+            )
+        )
+    else:
+        best_scores = top_scores.fetch(
+            player.id,
+            score.mode.value,
+            session
+        )
+
+    # Update max combo, if higher
+    if score.beatmap.is_ranked and score.has_pb:
+        if score.max_combo > user_stats.max_combo:
+            user_stats.max_combo = score.max_combo
+
+    if score_object is not None and score.is_performance_pb:
+        # Update grade counts with the grade of the new personal best
+        grade_counts.update(
+            user_stats,
+            score_object,
+            score.personal_best_pp
+        )
+
+    if score_object is not None and score.is_score_pb:
+        # Update rscore with the difference to the previous personal best
+        user_stats.rscore += score.total_score - (
+            score.personal_best_score.total_score
+            if score.personal_best_score else 0
+        )
+
+    if best_scores.count:
+        # Update pp & acc
+        user_stats.pp = best_scores.weighted_pp
+        user_stats.acc = best_scores.weighted_acc
+
+        # Update ppv1, if config allows for it
+        if score.is_performance_pb and not config.FROZEN_PPV1_UPDATES:
+            user_stats.ppv1 = performance.calculate_weighted_ppv1(
+                scores.fetch_best(
+                    user_id=score.user.id,
+                    mode=score.mode.value,
+                    exclude_approved=(not config.APPROVED_MAP_REWARDS),
+                    session=session
+                )
+            )
+
+        leaderboards.update(
+            user_stats,
+            player.country.lower()
+        )
+
         user_stats.rank = leaderboards.global_rank(
             user_stats.user_id,
             user_stats.mode
         )
 
-        if not config.FROZEN_RANK_UPDATES:
-            histories.update_rank(
-                user_stats,
-                player.country
-            )
-
         session.flush()
 
         new_rank, new_pp = resolve_preferred_ranking(
@@ -665,6 +894,81 @@ def update_stats(
         }
     )
 
+def update_play_stats(
+    score: Score,
+    player: DBUser,
+    session: Session
+) -> Tuple[DBStats, DBStats]:
+    """Update the play counters of the user. It will return the new & old stats for the user"""
+    # Find the matching user stats
+    user_stats = next(
+        (
+            mode_stats
+            for mode_stats in player.stats
+            if mode_stats.mode == score.mode.value
+        ),
+        None
+    )
+    assert user_stats is not None, f'Missing mode {score.mode.value} stats for user {player.id}'
+
+    # Update user stats
+    old_stats = copy(user_stats)
+    user_stats.playcount += 1
+    user_stats.playtime += score.elapsed_time
+    user_stats.tscore += score.total_score
+    user_stats.total_hits += score.total_hits
+    session.flush()
+
+    return user_stats, old_stats
+
+def submit_failed_score(
+    score: Score,
+    player: DBUser,
+    session: Session
+) -> Tuple[DBStats, DBStats, DBScore | None]:
+    """Submit a failed or exited score, which can't award any pp or personal bests
+
+    This skips the pp calculations, personal best lookups & the recalculation of the
+    user's pp, and will only update the play counters. It will return the new & old
+    stats for the user, as well as the score object, if the beatmap is ranked.
+    """
+    score_object: DBScore | None = None
+
+    if score.beatmap.is_ranked:
+        # Failed scores are resolved without querying any personal bests
+        score.status_pp = score.calculate_pp_status(session)
+        score.status_score = score.calculate_score_status(session)
+        score_object = score.to_database()
+
+        if not config.ALLOW_RELAX and score.relaxing:
+            score_object.hidden = True
+
+        session.add(score_object)
+        session.flush()
+
+    score.timings.lap('failed_ranking')
+    app.session.logger.debug('Updating user stats...')
+    user_stats, old_stats = update_play_stats(score, player, session)
+
+    if user_stats.pp > 0:
+        # Total score & playcount rankings still change
+        leaderboards.update(
+            user_stats,
+            player.country.lower()
+        )
+
+    score.timings.lap('failed_update_stats')
+
+    commit_score_submission(
+        score,
+        player,
+        user_stats,
+        session,
+        score_object
+    )
+    score.timings.lap('failed_commit')
+    return user_stats, old_stats, score_object
+
 def unlock_achievements(
     score: Score,
     score_object: DBScore,
@@ -760,8 +1064,9 @@ def response_charts(
     beatmap_info = Chart()
     beatmap_info['beatmapId'] = score.beatmap.id
     beatmap_info['beatmapSetId'] = score.beatmap.set_id
-    beatmap_info['beatmapPlaycount'] = score.beatmap.playcount
-    beatmap_info['beatmapPasscount'] = score.beatmap.passcount
+    beatmap_info['beatmapPlaycount'], beatmap_info['beatmapPasscount'] = (
+        beatmap_counters.fetch(score.beatmap.id, session)
+    )
     beatmap_info['approvedDate'] = score.beatmap.beatmapset.approved_at
 
     # TODO: Implement monthly charts
@@ -832,12 +1137,7 @@ def response_charts(
         beatmap_ranking.entry('accuracy', None, round(new_score.acc, 4) * 100)
         beatmap_ranking.entry('pp', None, round(new_score.pp))
 
-    score_above = scores.fetch_score_above(
-        score.beatmap.id,
-        score.mode.value,
-        score.total_score,
-        session=session
-    )
+    score_above = score.ranking.score_above
 
     beatmap_ranking['toNextRank'] = '0'
     beatmap_ranking['toNextRankUser'] = ''
@@ -851,28 +1151,131 @@ def response_charts(
 def commit_score_submission(
     score: Score,
     player: DBUser,
+    user_stats: DBStats,
     session: Session,
     score_object: DBScore | None = None
 ) -> None:
     """Commit a score submission before notifying other services"""
     session.commit()
 
-    if score_object is not None:
-        # Replay upload uses a separate database session
-        # Score has to be committed before uploading the replay
-        app.session.score_executor.submit(
-            upload_replay,
-            score,
-            score_object.id
-        ).add_done_callback(thread_callback)
+    # The score is committed at this point, so none of the
+    # following side effects are allowed to fail the response
+
+    # Beatmap play counters are written to the database in batches
+    after_commit(
+        'increment beatmap counters',
+        beatmap_counters.increment,
+        score.beatmap.id, score.passed
+    )
+
+    if score_object is not None and score_object.replay_md5:
+        after_commit(
+            'add replay checksum',
+            replay_checksums.add,
+            score_object.replay_md5
+        )
+
+    if score_object is not None and score.passed:
+        # New score may appear on the leaderboards of this beatmap
+        after_commit(
+            'invalidate leaderboard cache',
+            leaderboard_cache.invalidate,
+            score_object.beatmap_id
+        )
+
+    if score_object is not None and score.status_score == ScoreStatus.Best:
+        after_commit(
+            'update rank index',
+            rank_index.update,
+            score_object.beatmap_id,
+            score_object.mode,
+            score_object.user_id,
+            score_object.total_score
+        )
+
+    if score_object is not None and score.status_pp == ScoreStatus.Best:
+        after_commit(
+            'update grade map',
+            grade_map.update,
+            score_object.user_id,
+            score_object.beatmap_id,
+            score_object.mode,
+            score_object.grade
+        )
 
     # Reload stats on bancho
-    app.session.events.submit(
+    after_commit(
+        'submit user update',
+        app.session.events.submit,
         'user_update',
         user_id=player.id,
         mode=score.mode.value
     )
 
+    # Everything that the client response doesn't depend on
+    # will be processed by the task consumers in the background
+    # Every stage is submitted as its own job, to retry them separately
+    stages = ['update_plays']
+
+    if user_stats.pp > 0 and not config.FROZEN_RANK_UPDATES:
+        stages.append('update_rank_history')
+
+    if score_object is not None and score.pending_calculations:
+        # pp calculation didn't finish in time, try again in the background
+        stages.append('recalculate_pp')
+
+    if score_object is not None and should_upload_replay(score):
+        # Replay upload uses a separate database session
+        # Score has to be committed before uploading the replay
+        after_commit(
+            'stage replay',
+            stage_replay,
+            score_object.id, score.replay
+        )
+        stages.append('upload_replay')
+
+    for stage in stages:
+        after_commit(
+            f'submit "{stage}" task',
+            tasks.submit,
+            stage,
+            user_id=player.id,
+            mode=score.mode.value,
+            beatmap_id=score.beatmap.id,
+            beatmap_set_id=score.beatmap.set_id,
+            beatmap_filename=score.beatmap.filename,
+            score_id=score_object.id if score_object else None,
+            recalculate=sorted(score.pending_calculations)
+        )
+
+def after_commit(description: str, callback: Callable, *args, **kwargs) -> None:
+    """Run a side effect of a committed score submission, and report failures instead of raising them"""
+    try:
+        callback(*args, **kwargs)
+    except Exception as e:
+        officer.call(f'Failed to {description}: "{e}"', exc_info=e)
+
+def submit_highlights(
+    score_object: DBScore,
+    new_stats: DBStats,
+    old_stats: DBStats,
+    new_rank: int,
+    old_rank: int
+) -> None:
+    """Send highlights on #announce"""
+    after_commit(
+        'submit highlights',
+        tasks.submit,
+        'highlights',
+        score_id=score_object.id,
+        user_id=score_object.user_id,
+        mode=score_object.mode,
+        new_stats={'rank': new_stats.rank, 'playcount': new_stats.playcount},
+        old_stats={'rank': old_stats.rank, 'playcount': old_stats.playcount},
+        new_rank=new_rank,
+        old_rank=old_rank
+    )
+
 @router.post("/osu-submit-modular-selector.php")
 @router.post('/osu-submit-modular.php')
 def score_submission(
@@ -887,6 +1290,8 @@ def score_submission(
 ) -> str:
     password = legacy_password or password
 
+    score.timings.activate()
+
     score.user = users.fetch_by_name(
         score.username,
         session
@@ -912,11 +1317,37 @@ def score_submission(
         app.session.logger.warning(f'Failed to submit score: Bot account')
         return 'error: no'
 
-    if not permissions.has_permission('scores.submit', player.id):
+    if not permission_cache.has_permission('scores.submit', player.id):
         app.session.logger.warning(f'Failed to submit score: No permission')
         return 'error: no'
 
-    score.beatmap = beatmaps.fetch_by_checksum(
+    score.timings.lap('authentication')
+    submission = idempotency.Submission(player.id, score.score_checksum)
+
+    if not submission.acquire():
+        # Submission is still being processed by another request
+        raise HTTPException(503)
+
+    score.timings.lap('lock')
+
+    try:
+        if submission.response is not None:
+            app.session.logger.info(f'"{score.username}" resent score submission ({score.score_checksum})')
+            return submission.response
+
+        response = process_score_submission(score, player, session)
+        submission.complete(response)
+        return response
+    finally:
+        submission.release()
+        score.timings.finish(
+            'score_submission',
+            f'"{score.username}" on {score.file_checksum} ({score.score_checksum})'
+        )
+
+def process_score_submission(score: Score, player: DBUser, session: Session) -> str:
+    """Process the score submission of an authenticated player"""
+    score.beatmap = beatmap_cache.fetch_by_checksum(
         score.file_checksum,
         session
     )
@@ -940,11 +1371,7 @@ def score_submission(
             score.client_hash.removesuffix(':')
         )
 
-    users.update(
-        player.id,
-        {'latest_activity': datetime.now()},
-        session
-    )
+    latest_activity.update(player.id)
 
     if score.version <= 0:
         # Client didn't provide a version
@@ -957,8 +1384,13 @@ def score_submission(
         or f"b{score.version}"
     )
 
-    score.pp = score.calculate_ppv2()
-    score.ppv1 = score.calculate_ppv1(session)
+    score.timings.lap('preparation')
+
+    if not score.passed:
+        return process_failed_score_submission(score, player, session)
+
+    score.ppv1 = score.calculate_ppv1()
+    score.timings.lap('ppv1')
 
     if (error := perform_score_validation(score, player, session)) != None:
         session.rollback()
@@ -971,31 +1403,24 @@ def score_submission(
             score.beatmap
         )
 
+    score.timings.lap('validation')
     score_object: DBScore | None = None
 
     if score.beatmap.is_ranked:
-        (
-            score.personal_best_pp,
-            score.personal_best_score
-        ) = scores.fetch_personal_bests(
+        # Resolve personal bests & beatmap ranks before submitting score
+        score.ranking = rankings.fetch_score_ranking(
             score.beatmap.id,
             score.user.id,
             score.mode.value,
+            score.enabled_mods.value,
+            score.total_score,
             session=session
         )
+        old_rank = score.ranking.old_rank
 
         score.status_pp = score.calculate_pp_status(session)
         score.status_score = score.calculate_score_status(session)
 
-        # Get old rank before submitting score
-        old_rank = scores.fetch_score_index_by_id(
-                score.personal_best_score.id,
-                score.beatmap.id,
-                mode=score.mode.value,
-                session=session
-            ) \
-            if score.personal_best_score else 0
-
         # Create the score object that will be committed to the database
         score_object = score.to_database()
 
@@ -1005,15 +1430,19 @@ def score_submission(
         session.add(score_object)
         session.flush()
 
-    new_stats, old_stats, ranking = update_stats(score, player, session)
+    score.timings.lap('ranking')
+    new_stats, old_stats, ranking = update_stats(score, score_object, player, session)
+    score.timings.lap('update_stats')
 
     # Commit score to the database, upload the replay & reload stats on bancho
     commit_score_submission(
         score,
         player,
+        new_stats,
         session,
         score_object
     )
+    score.timings.lap('commit')
 
     if not score.beatmap.is_ranked:
         return 'error: beatmap'
@@ -1033,12 +1462,8 @@ def score_submission(
             session
         )
 
-    new_rank = scores.fetch_score_index_by_tscore(
-        score_object.total_score,
-        score.beatmap.id,
-        mode=score.mode.value,
-        session=session
-    )
+    score.timings.lap('achievements')
+    new_rank = score.ranking.new_rank
 
     response = response_charts(
         score,
@@ -1051,6 +1476,7 @@ def score_submission(
         achievement_response,
         session
     )
+    score.timings.lap('response_charts')
 
     if achievement_response:
         # Commit achievements to the database
@@ -1061,14 +1487,58 @@ def score_submission(
         f' ({config.OSU_BASEURL}/scores/{score_object.id})'
     )
 
-    # Send highlights on #announce
     if score.passed:
-        app.session.score_executor.submit(
-            highlights.check,
-            score_object.id, score.user,
+        submit_highlights(
+            score_object,
             new_stats, old_stats,
             new_rank, old_rank
-        ).add_done_callback(thread_callback)
+        )
+
+    return "\n".join([chart.get() for chart in response])
+
+def process_failed_score_submission(score: Score, player: DBUser, session: Session) -> str:
+    """Process a failed or exited score submission, without calculating any pp"""
+    if (error := perform_score_validation(score, player, session)) != None:
+        session.rollback()
+        return error
+
+    if score.relaxing:
+        # Recalculate rx total score
+        score.total_score = calculate_rx_score(
+            score.to_database(),
+            score.beatmap
+        )
+
+    score.timings.lap('failed_validation')
+    new_stats, old_stats, score_object = submit_failed_score(score, player, session)
+
+    if not score.beatmap.is_ranked:
+        return 'error: beatmap'
+
+    assert score_object is not None
+
+    if not config.ALLOW_RELAX and score.relaxing:
+        return 'error: no'
+
+    # The ranking of the player can't change from a failed score
+    rank, pp = resolve_preferred_ranking(player, score.mode.value)
+    ranking = {"old_rank": rank, "old_pp": pp, "new_rank": rank, "new_pp": pp}
+
+    response = response_charts(
+        score,
+        score_object,
+        ranking,
+        old_stats,
+        new_stats,
+        0, 0, [],
+        session
+    )
+    score.timings.lap('failed_response_charts')
+
+    app.session.logger.info(
+        f'"{score.username}" submitted {"failed " if score.failtime else ""}score on {score.beatmap.full_name}'
+        f' ({config.OSU_BASEURL}/scores/{score_object.id})'
+    )
 
     return "\n".join([chart.get() for chart in response])
 
@@ -1080,6 +1550,8 @@ def legacy_score_submission(
     score: Score = Depends(parse_score_data),
     session: Session = Depends(app.session.database.yield_session),
 ) -> str:
+    score.timings.activate()
+
     score.user = users.fetch_by_name(
         score.username,
         session
@@ -1105,11 +1577,37 @@ def legacy_score_submission(
         app.session.logger.warning(f'Failed to submit score: Bot account')
         return ""
 
-    if not permissions.has_permission('scores.submit', player.id):
+    if not permission_cache.has_permission('scores.submit', player.id):
         app.session.logger.warning(f'Failed to submit score: No permission')
         return ""
 
-    score.beatmap = beatmaps.fetch_by_checksum(
+    score.timings.lap('authentication')
+    submission = idempotency.Submission(player.id, score.score_checksum)
+
+    if not submission.acquire():
+        # Submission is still being processed by another request
+        raise HTTPException(503)
+
+    score.timings.lap('lock')
+
+    try:
+        if submission.response is not None:
+            app.session.logger.info(f'"{score.username}" resent score submission ({score.score_checksum})')
+            return submission.response
+
+        response = process_legacy_score_submission(score, player, session)
+        submission.complete(response)
+        return response
+    finally:
+        submission.release()
+        score.timings.finish(
+            'legacy_score_submission',
+            f'"{score.username}" on {score.file_checksum} ({score.score_checksum})'
+        )
+
+def process_legacy_score_submission(score: Score, player: DBUser, session: Session) -> str:
+    """Process the legacy score submission of an authenticated player"""
+    score.beatmap = beatmap_cache.fetch_by_checksum(
         score.file_checksum,
         session
     )
@@ -1133,11 +1631,7 @@ def legacy_score_submission(
             score.client_hash.removesuffix(':')
         )
 
-    users.update(
-        player.id,
-        {'latest_activity': datetime.now()},
-        session
-    )
+    latest_activity.update(player.id)
 
     if score.version <= 0:
         # Client didn't provide a version
@@ -1150,8 +1644,13 @@ def legacy_score_submission(
         or f"b{score.version}"
     )
 
-    score.pp = score.calculate_ppv2()
-    score.ppv1 = score.calculate_ppv1(session)
+    score.timings.lap('preparation')
+
+    if not score.passed:
+        return process_failed_legacy_score_submission(score, player, session)
+
+    score.ppv1 = score.calculate_ppv1()
+    score.timings.lap('ppv1')
 
     if (error := perform_score_validation(score, player, session)) != None:
         raise HTTPException(400, detail=error)
@@ -1167,31 +1666,24 @@ def legacy_score_submission(
         # Prevent "Taiko" mod plays from being submitted
         raise HTTPException(400)
 
+    score.timings.lap('validation')
     score_object: DBScore | None = None
 
     if score.beatmap.is_ranked:
-        (
-            score.personal_best_pp,
-            score.personal_best_score
-        ) = scores.fetch_personal_bests(
+        # Resolve personal bests & beatmap ranks before submitting score
+        score.ranking = rankings.fetch_score_ranking(
             score.beatmap.id,
             score.user.id,
             score.mode.value,
+            score.enabled_mods.value,
+            score.total_score,
             session=session
         )
+        old_rank = score.ranking.old_rank
 
         score.status_pp = score.calculate_pp_status(session)
         score.status_score = score.calculate_score_status(session)
 
-        # Get old rank before submitting score
-        old_rank = scores.fetch_score_index_by_id(
-                score.personal_best_score.id,
-                score.beatmap.id,
-                mode=score.mode.value,
-                session=session
-            ) \
-            if score.personal_best_score else 0
-
         # Submit to database
         score_object = score.to_database()
 
@@ -1201,15 +1693,19 @@ def legacy_score_submission(
         session.add(score_object)
         session.flush()
 
-    new_stats, old_stats, ranking = update_stats(score, player, session)
+    score.timings.lap('ranking')
+    new_stats, old_stats, ranking = update_stats(score, score_object, player, session)
+    score.timings.lap('update_stats')
 
     # Commit score to the database, upload the replay & reload stats on bancho
     commit_score_submission(
         score,
         player,
+        new_stats,
         session,
         score_object
     )
+    score.timings.lap('commit')
 
     if not score.beatmap.is_ranked:
         return ""
@@ -1219,13 +1715,6 @@ def legacy_score_submission(
     if not config.ALLOW_RELAX and score.relaxing:
         return ""
 
-    if not score.passed:
-        app.session.logger.info(
-            f'"{score.username}" submitted {"failed " if score.failtime else ""}score on {score.beatmap.full_name}'
-            f' ({config.OSU_BASEURL}/scores/{score_object.id})'
-        )
-        return ""
-
     achievement_response: List[str] = []
     response: List[str] = []
 
@@ -1237,12 +1726,8 @@ def legacy_score_submission(
             session
         )
 
-    beatmap_rank = scores.fetch_score_index_by_id(
-        score_object.id,
-        score.beatmap.id,
-        mode=score.mode.value,
-        session=session
-    )
+    score.timings.lap('achievements')
+    beatmap_rank = score.ranking.new_rank
 
     if achievement_response:
         # Commit achievements to the database
@@ -1267,22 +1752,42 @@ def legacy_score_submission(
     if achievement_response:
         response.append(" ".join(achievement_response))
 
-    # Send highlights on #announce
     if score.passed:
-        app.session.score_executor.submit(
-            highlights.check,
-            score_object.id, score.user,
+        submit_highlights(
+            score_object,
             new_stats, old_stats,
             beatmap_rank, old_rank
-        ).add_done_callback(thread_callback)
+        )
 
     return "\n".join(response)
 
-def thread_callback(future: Future) -> None:
-    if not (exception := future.exception()):
-        return
+def process_failed_legacy_score_submission(score: Score, player: DBUser, session: Session) -> str:
+    """Process a failed or exited legacy score submission, without calculating any pp"""
+    if (error := perform_score_validation(score, player, session)) != None:
+        raise HTTPException(400, detail=error)
+
+    if score.relaxing:
+        # Recalculate rx total score
+        score.total_score = calculate_rx_score(
+            score.to_database(),
+            score.beatmap
+        )
 
-    officer.call(
-        f'Failed to execute score submission task.',
-        exc_info=exception
+    if score.version < 452 and Mods.Nightcore in score.enabled_mods:
+        # Prevent "Taiko" mod plays from being submitted
+        raise HTTPException(400)
+
+    score.timings.lap('failed_validation')
+    _, _, score_object = submit_failed_score(score, player, session)
+
+    if score_object is None:
+        return ""
+
+    if not config.ALLOW_RELAX and score.relaxing:
+        return ""
+
+    app.session.logger.info(
+        f'"{score.username}" submitted {"failed " if score.failtime else ""}score on {score.beatmap.full_name}'
+        f' ({config.OSU_BASEURL}/scores/{score_object.id})'
     )
+    return ""
@@ -4,7 +4,6 @@ from app.common.constants import UserActivity
 from app.common.helpers import activity
 from app.common.cache import status
 from sqlalchemy.orm import Session
-from datetime import datetime
 from fastapi import (
     HTTPException,
     APIRouter,
@@ -12,6 +11,7 @@ from fastapi import (
     Depends,
     Query
 )
+from app.helpers import latest_activity
 
 import app
 
@@ -79,11 +79,7 @@ def screenshot(
                 detail="Invalid file type"
             )
 
-        users.update(
-            player.id,
-            {'latest_activity': datetime.now()},
-            session=session
-        )
+        latest_activity.update(player.id)
 
         id = screenshots.create(
             player.id,
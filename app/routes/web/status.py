@@ -1,6 +1,9 @@
 
 from app.common.database import DBBeatmap, DBBeatmapset
+from app.helpers.beatmap_index import IndexedBeatmap
+from app.helpers import beatmap_index
 from sqlalchemy.orm import Session, load_only, selectinload
+from typing import Dict, List
 from fastapi import (
     HTTPException,
     APIRouter,
@@ -30,26 +33,12 @@ def get_beatmaps(
         f"Got beatmap status request for {len(checksums)} beatmaps."
     )
 
-    results = session.query(DBBeatmap) \
-        .options(
-            load_only(
-                DBBeatmap.id, \
-                DBBeatmap.set_id, \
-                DBBeatmap.md5, \
-                DBBeatmap.status \
-            ),
-            selectinload(DBBeatmap.beatmapset).load_only(
-                DBBeatmapset.id, \
-                DBBeatmapset.topic_id \
-            ) \
-        ) \
-        .filter(DBBeatmap.md5.in_(checksums)) \
-        .all()
-    
-    found_beatmaps = {
-        beatmap.md5: beatmap
-        for beatmap in results
-    }
+    found_beatmaps = beatmap_index.fetch_by_checksums(checksums)
+
+    if found_beatmaps is None:
+        # Index was not built yet
+        found_beatmaps = fetch_beatmaps(checksums, session)
+
     response = []
 
     for checksum in checksums:
@@ -64,7 +53,29 @@ def get_beatmaps(
             str(status),
             str(beatmap.id),
             str(beatmap.set_id),
-            str(beatmap.beatmapset.topic_id or "")
+            str(beatmap.topic_id or "")
         ]))
 
     return Response('\n'.join(response))
+
+def fetch_beatmaps(checksums: List[str], session: Session) -> Dict[str, IndexedBeatmap]:
+    results = session.query(DBBeatmap) \
+        .options(
+            load_only(
+                DBBeatmap.id, \
+                DBBeatmap.set_id, \
+                DBBeatmap.md5, \
+                DBBeatmap.status \
+            ),
+            selectinload(DBBeatmap.beatmapset).load_only(
+                DBBeatmapset.id, \
+                DBBeatmapset.topic_id \
+            ) \
+        ) \
+        .filter(DBBeatmap.md5.in_(checksums)) \
+        .all()
+
+    return {
+        beatmap.md5: IndexedBeatmap.from_beatmap(beatmap)
+        for beatmap in results
+    }
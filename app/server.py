@@ -1,6 +1,7 @@
 
 from contextlib import asynccontextmanager
 from app import session, utils, routes
+from app.helpers import beatmap_cache, beatmap_counters, beatmap_index, invalidation, latest_activity, performance_pool, replay_checksums, tasks, timing
 from app.common import profiling
 from fastapi import FastAPI
 
@@ -10,9 +11,24 @@ async def lifespan(app: FastAPI):
     session.redis.ping()
     profiling.setup()
     utils.setup()
+    timing.setup()
+    tasks.start()
+    replay_checksums.start()
+    invalidation.start()
+    latest_activity.start()
+    beatmap_counters.start()
+    beatmap_index.start()
+    beatmap_cache.start()
     yield
-    session.achievement_executor.shutdown(wait=True)
-    session.score_executor.shutdown(wait=True)
+    beatmap_cache.stop()
+    beatmap_index.stop()
+    invalidation.stop()
+    latest_activity.stop()
+    beatmap_counters.stop()
+    tasks.stop()
+    performance_pool.shutdown()
+    session.achievement_executor.drain()
+    session.score_executor.drain()
     session.database.engine.dispose()
     session.redis.close()
 
@@ -5,8 +5,8 @@ from .common.cache.events import EventQueue
 from .common.database import Postgres
 from .common.storage import Storage
 from .common.config import Config
+from .helpers.executors import BoundedExecutor
 
-from concurrent.futures import ThreadPoolExecutor
 from requests import Session
 from redis import Redis
 
@@ -35,10 +35,10 @@ storage = Storage(config)
 beatmaps = BeatmapResources(storage, redis)
 
 # Used for achievements checks
-achievement_executor = ThreadPoolExecutor(max_workers=5)
+achievement_executor = BoundedExecutor('achievements', max_workers=5, max_queue=250)
 
-# Used for uploading replays, and checking hightlights
-score_executor = ThreadPoolExecutor(max_workers=5)
+# Used for processing jobs from the task stream, e.g. replay uploads
+score_executor = BoundedExecutor('scores', max_workers=5, max_queue=25)
 
 # Initialize ppv2 calculator
 instance = ppv2_native.NativePerformanceCalculator(beatmaps)
@@ -1,12 +1,15 @@
 
 from app.common.config import config_instance as config
+from app.helpers.caching import LRUCache
 from pydub import AudioSegment
-from functools import cache
 from typing import Callable
 from functools import wraps
 from PIL import Image
 
+import hashlib
+import secrets
 import bcrypt
+import hmac
 import lzma
 import time
 import app
@@ -32,6 +35,25 @@ def setup() -> None:
         exist_ok=True
     )
 
+# Successful password checks are cached, to avoid running bcrypt on every request.
+# Entries are keyed by an HMAC of the bcrypt hash & the md5 of the password, so
+# they won't be used anymore once the bcrypt hash of a user changes.
+# If "PASSWORD_CACHE_SECRET" is set, it will be used as the HMAC key, and the
+# cache will be shared between all workers through redis.
+PASSWORD_CACHE_SECRET = os.environ.get('PASSWORD_CACHE_SECRET')
+PASSWORD_CACHE_EXPIRY = 60 * 60
+PASSWORD_CACHE_CAPACITY = 4096
+
+password_cache_secret = (
+    PASSWORD_CACHE_SECRET.encode()
+    if PASSWORD_CACHE_SECRET else
+    secrets.token_bytes(32)
+)
+password_cache: LRUCache[str, bool] = LRUCache(
+    PASSWORD_CACHE_CAPACITY,
+    PASSWORD_CACHE_EXPIRY
+)
+
 unsafe_characters_pattern = re.compile(r'[<>:"/\\|?*\x00-\x1F]')
 
 def sanitize_filename(filename: str) -> str:
@@ -40,17 +62,42 @@ def sanitize_filename(filename: str) -> str:
 def empty_zip_file() -> bytes:
     return b'PK\x05\x06\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
 
-@cache
 def check_password(password: str, bcrypt_hash: str) -> bool:
     if len(password) != 32:
         # We expect an md5 hash to be passed as password
         return False
 
-    return bcrypt.checkpw(
+    key = hmac.new(
+        password_cache_secret,
+        f'{bcrypt_hash}:{password}'.encode(),
+        hashlib.sha256
+    ).hexdigest()
+
+    if key in password_cache:
+        return True
+
+    if PASSWORD_CACHE_SECRET and app.session.redis.exists(f'deck:passwords:{key}'):
+        password_cache.set(key, True)
+        return True
+
+    is_valid = bcrypt.checkpw(
         password.encode(),
         bcrypt_hash.encode()
     )
 
+    if not is_valid:
+        return False
+
+    password_cache.set(key, True)
+
+    if PASSWORD_CACHE_SECRET:
+        app.session.redis.set(
+            f'deck:passwords:{key}', 1,
+            ex=PASSWORD_CACHE_EXPIRY
+        )
+
+    return True
+
 def has_jpeg_headers(data_view: memoryview) -> bool:
     return (
         data_view[:4] == b"\xff\xd8\xff\xe0"
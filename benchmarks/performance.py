@@ -0,0 +1,86 @@
+"""Compare the ppv2 of the calculation processes with the calculator of the common module
+
+Every score is calculated by the common calculator, by the worker with a cold
+difficulty calculation, and by the worker with the cached difficulty attributes.
+Scores with a difference above the tolerance are listed, and fail the check.
+
+Usage: python benchmarks/performance.py [amount of scores]
+"""
+
+from pathlib import Path
+
+import time
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.common.helpers import performance
+from app.common.database import DBScore
+from app.common.constants import ScoreStatus
+from app.helpers import performance_pool
+
+import performance_worker
+import app
+
+TOLERANCE = 0.01
+PASSED_STATUSES = (
+    ScoreStatus.Submitted.value,
+    ScoreStatus.Best.value,
+    ScoreStatus.Mods.value
+)
+
+def main() -> None:
+    amount = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    mismatches = []
+    timings = {'common': 0.0, 'cold': 0.0, 'cached': 0.0}
+    calculated = 0
+
+    with app.session.database.managed_session() as session:
+        scores = session.query(DBScore) \
+            .filter(DBScore.status_pp.in_(PASSED_STATUSES)) \
+            .filter(DBScore.hidden == False) \
+            .order_by(DBScore.id.desc()) \
+            .limit(amount) \
+            .all()
+
+        for score in scores:
+            if not (beatmap_file := app.session.storage.get_beatmap(score.beatmap_id)):
+                continue
+
+            columns = performance_pool.serialize_ppv2(score)
+
+            started_at = time.perf_counter()
+            expected = performance.calculate_ppv2(score) or 0.0
+            timings['common'] += time.perf_counter() - started_at
+
+            started_at = time.perf_counter()
+            cold, attributes = performance_worker.calculate_ppv2(columns, beatmap_file, None)
+            timings['cold'] += time.perf_counter() - started_at
+
+            started_at = time.perf_counter()
+            cached, _ = performance_worker.calculate_ppv2(columns, beatmap_file, attributes)
+            timings['cached'] += time.perf_counter() - started_at
+
+            calculated += 1
+
+            if abs(cold - expected) > TOLERANCE or abs(cached - expected) > TOLERANCE:
+                mismatches.append((score.id, score.mode, score.mods, expected, cold, cached))
+
+    if not calculated:
+        print('No scores to compare')
+        return
+
+    for name, duration in timings.items():
+        print(f'{name:>6}: {duration / calculated * 1e3:>8.2f}ms per score')
+
+    for score_id, mode, mods, expected, cold, cached in mismatches:
+        print(
+            f'Score {score_id} (mode {mode}, mods {mods}): '
+            f'common {expected:.3f}pp | cold {cold:.3f}pp | cached {cached:.3f}pp'
+        )
+
+    print(f'{calculated - len(mismatches)}/{calculated} scores match')
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Compare the columnar replay frame decoder with the previous per-frame dataclass decoder
+
+Usage: python benchmarks/replays.py
+"""
+
+from importlib.util import spec_from_file_location, module_from_spec
+from dataclasses import dataclass
+from pathlib import Path
+
+import logging
+import random
+import timeit
+import types
+import numpy
+import lzma
+import sys
+
+def load_module(name: str, path: Path):
+    # Load the module directly, to avoid initializing the whole app.
+    # Only the parsing functions are benchmarked, so the app-level
+    # imports of the replay helpers are replaced with placeholders.
+    placeholders = {
+        'app': types.ModuleType('app'),
+        'app.common': types.ModuleType('app.common'),
+        'app.utils': types.ModuleType('app.utils')
+    }
+    placeholders['app'].session = types.SimpleNamespace(logger=logging.getLogger('benchmark'))
+    placeholders['app'].utils = placeholders['app.utils']
+    placeholders['app.common'].officer = types.SimpleNamespace(call=lambda *args, **kwargs: None)
+    placeholders['app.utils'].lzma_decompress = lambda data, **kwargs: lzma.decompress(data)
+
+    for module_name, module in placeholders.items():
+        sys.modules.setdefault(module_name, module)
+
+    spec = spec_from_file_location(name, path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+replays = load_module(
+    'replays',
+    Path(__file__).parent.parent / 'app' / 'helpers' / 'replays.py'
+)
+
+@dataclass(frozen=True, slots=True)
+class ReplayFrame:
+    delta: int
+    time: int
+    x: float
+    y: float
+    button_state: int
+
+def parse_frames_python(replay: str) -> tuple[int, list[ReplayFrame]]:
+    # Previous implementation inside of "replays.validate"
+    frames: list[ReplayFrame] = []
+    current_time = 0
+    seed = 0
+
+    for frame in replay.split(','):
+        if not frame:
+            continue
+
+        frame_data = frame.split('|')
+
+        if len(frame_data) != 4:
+            raise ValueError(f'Invalid frame data ({frame_data})')
+
+        if frame_data[0] == "-12345":
+            seed = int(frame_data[3])
+            continue
+
+        delta = int(frame_data[0])
+        current_time += delta
+
+        frames.append(ReplayFrame(
+            delta=delta,
+            time=current_time,
+            x=float(frame_data[1]),
+            y=float(frame_data[2]),
+            button_state=int(frame_data[3])
+        ))
+
+    return seed, frames
+
+def parse_frames_numpy(replay: str) -> tuple[int, object]:
+    assert replays.find_invalid_frame(replay.encode()) is None
+    return replays.parse_frames(replay)
+
+def generate_replay(frame_count: int) -> str:
+    """Generate replay frame data in the format of the osu! client"""
+    frames = ['0|256|-500|0', '-1|256|-500|0']
+    x, y = 256.0, 192.0
+
+    for _ in range(frame_count):
+        x = min(max(x + random.gauss(0, 12), 0), 512)
+        y = min(max(y + random.gauss(0, 12), 0), 384)
+        frames.append(
+            f'{random.choice((16, 17, 16, 0))}|'
+            f'{round(x, 4)}|{round(y, 4)}|'
+            f'{random.choice((0, 0, 1, 2, 5, 10))}'
+        )
+
+    frames.append(f'-12345|0|0|{random.randint(0, 2**31 - 1)}')
+    return ','.join(frames) + ','
+
+def assert_equivalent(replay: str) -> None:
+    seed, frames = parse_frames_python(replay)
+    numpy_seed, numpy_frames = parse_frames_numpy(replay)
+
+    assert seed == numpy_seed
+    assert len(frames) == len(numpy_frames)
+    assert numpy.array_equal([frame.delta for frame in frames], numpy_frames.delta)
+    assert numpy.array_equal([frame.time for frame in frames], numpy_frames.time)
+    assert numpy.array_equal([frame.x for frame in frames], numpy_frames.x)
+    assert numpy.array_equal([frame.y for frame in frames], numpy_frames.y)
+    assert numpy.array_equal([frame.button_state for frame in frames], numpy_frames.button_state)
+
+def main() -> None:
+    for size in (1_000, 10_000, 100_000):
+        replay = generate_replay(size)
+        iterations = max(5, 50_000 // size)
+        assert_equivalent(replay)
+
+        python_time = timeit.timeit(
+            lambda: parse_frames_python(replay),
+            number=iterations
+        ) / iterations
+        numpy_time = timeit.timeit(
+            lambda: parse_frames_numpy(replay),
+            number=iterations
+        ) / iterations
+
+        print(
+            f'{size:>7} frames: '
+            f'python {python_time * 1e3:>8.2f}ms | '
+            f'numpy {numpy_time * 1e3:>8.2f}ms | '
+            f'{python_time / numpy_time:>5.1f}x'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Compare the batched rijndael decryption with decrypting every field through py3rijndael
+
+Usage: python benchmarks/rijndael.py
+"""
+
+from importlib.util import spec_from_file_location, module_from_spec
+from py3rijndael import RijndaelCbc, Pkcs7Padding
+from pathlib import Path
+
+import random
+import string
+import base64
+import timeit
+import os
+
+def load_module(name: str, path: Path):
+    # Load the module directly, to avoid initializing the whole app
+    spec = spec_from_file_location(name, path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+rijndael = load_module(
+    'rijndael',
+    Path(__file__).parent.parent / 'app' / 'helpers' / 'rijndael.py'
+)
+
+def random_text(size: int) -> str:
+    return ''.join(random.choices(string.ascii_letters + string.digits + ':|.', k=size))
+
+def encrypt(text: str, iv: bytes, key: str) -> str:
+    rjn = RijndaelCbc(key.encode(), iv, Pkcs7Padding(32), block_size=32)
+    return base64.b64encode(rjn.encrypt(text.encode())).decode()
+
+def decrypt_string(b64: str | None, iv: bytes, key: str) -> str | None:
+    # Previous implementation inside of scoring.py
+    if b64 is None:
+        return None
+
+    rjn = RijndaelCbc(
+        key=key.encode(),
+        iv=iv,
+        padding=Pkcs7Padding(32),
+        block_size=32
+    )
+    return rjn.decrypt(base64.b64decode(b64)).decode()
+
+def main() -> None:
+    key = 'osu!-scoreburgr---------20250101'
+    iv = os.urandom(32)
+
+    # Sizes of client_hash, fun_spoiler, score_data & processes
+    payloads = {
+        'minimal': (160, 40, 120, 0),
+        'typical': (180, 50, 160, 1_500),
+        'large': (200, 60, 200, 8_000)
+    }
+
+    for name, sizes in payloads.items():
+        plaintexts = [random_text(size) for size in sizes]
+        fields = [encrypt(text, iv, key) for text in plaintexts]
+        total_size = sum(len(base64.b64decode(field)) for field in fields)
+        iterations = 50
+
+        assert [decrypt_string(field, iv, key) for field in fields] == plaintexts
+        assert rijndael.decrypt_fields(fields, iv, key) == plaintexts
+
+        python_time = timeit.timeit(
+            lambda: [decrypt_string(field, iv, key) for field in fields],
+            number=iterations
+        ) / iterations
+        fallback_time = timeit.timeit(
+            lambda: rijndael.decrypt_blocks_python(
+                [base64.b64decode(field) for field in fields],
+                iv, key
+            ),
+            number=iterations
+        ) / iterations
+        numpy_time = timeit.timeit(
+            lambda: rijndael.decrypt_fields(fields, iv, key),
+            number=iterations
+        ) / iterations
+
+        print(
+            f'{name:>8} ({total_size:>5} bytes): '
+            f'py3rijndael {python_time * 1e3:>8.2f}ms | '
+            f'fallback {fallback_time * 1e3:>8.2f}ms | '
+            f'numpy {numpy_time * 1e3:>6.3f}ms | '
+            f'{python_time / numpy_time:>6.1f}x'
+        )
+
+if __name__ == '__main__':
+    main()
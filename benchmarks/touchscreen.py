@@ -0,0 +1,174 @@
+"""Compare the vectorized touchscreen detection with the previous per-frame implementation
+
+Every replay of the synthetic corpus has to produce the exact same result with both
+implementations, before any timings are reported.
+
+Usage: python benchmarks/touchscreen.py
+"""
+
+from importlib.util import spec_from_file_location, module_from_spec
+from math import hypot
+from pathlib import Path
+
+import itertools
+import logging
+import random
+import timeit
+import types
+import numpy
+import lzma
+import sys
+
+def load_module(name: str, path: Path):
+    # Load the module directly, to avoid initializing the whole app.
+    # Only the analysis functions are benchmarked, so the app-level
+    # imports of the replay helpers are replaced with placeholders.
+    placeholders = {
+        'app': types.ModuleType('app'),
+        'app.common': types.ModuleType('app.common'),
+        'app.utils': types.ModuleType('app.utils')
+    }
+    placeholders['app'].session = types.SimpleNamespace(logger=logging.getLogger('benchmark'))
+    placeholders['app'].utils = placeholders['app.utils']
+    placeholders['app.common'].officer = types.SimpleNamespace(call=lambda *args, **kwargs: None)
+    placeholders['app.utils'].lzma_decompress = lambda data, **kwargs: lzma.decompress(data)
+
+    for module_name, module in placeholders.items():
+        sys.modules.setdefault(module_name, module)
+
+    spec = spec_from_file_location(name, path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+replays = load_module(
+    'replays',
+    Path(__file__).parent.parent / 'app' / 'helpers' / 'replays.py'
+)
+
+def detect_touchscreen_usage_python(frames, decision_threshold: float = 0.8) -> tuple[bool, float]:
+    # Previous implementation inside of "app.helpers.replays"
+    speed_values: list[float] = []
+
+    teleport_count = 0
+    press_count = 0
+    presses_after_teleport = 0
+    last_teleport_time: int | None = None
+
+    for previous, current in itertools.pairwise(frames):
+        delta = current[1] - previous[1]
+
+        if delta > 0:
+            distance = hypot(current[2] - previous[2], current[3] - previous[3])
+            speed = distance / delta
+            speed_values.append(speed)
+
+            if distance >= 80.0 and speed >= 5.0:
+                teleport_count += 1
+                last_teleport_time = current[1]
+
+        previous_gameplay = previous[4] & replays.GAMEPLAY_BUTTONS
+        current_gameplay = current[4] & replays.GAMEPLAY_BUTTONS
+
+        if current_gameplay & ~previous_gameplay:
+            press_count += 1
+
+            if last_teleport_time is not None and 0 <= current[1] - last_teleport_time <= 50:
+                presses_after_teleport += 1
+
+    if not speed_values:
+        return False, 0.0
+
+    if press_count < 100:
+        return False, 0.0
+
+    teleport_ratio = teleport_count / len(speed_values)
+    press_teleport_ratio = presses_after_teleport / press_count
+    p95_speed = float(numpy.percentile(speed_values, 95))
+
+    score = replays.calculate_touchscreen_score(
+        teleport_ratio=teleport_ratio,
+        press_teleport_ratio=press_teleport_ratio,
+        p95_speed=p95_speed,
+    )
+    return score >= decision_threshold, score
+
+def generate_frames(frame_count: int, teleport_chance: float, press_delay: int) -> list[tuple]:
+    """Generate (delta, time, x, y, buttons) frames of a mouse or touchscreen player"""
+    frames = []
+    time = 0
+    x, y = 256.0, 192.0
+    buttons = 0
+    press_in = None
+
+    for _ in range(frame_count):
+        # Include zero & negative deltas, as they appear in real replays
+        delta = random.choice((16, 17, 16, 15, 0, 1, -1, 33))
+        time += delta
+
+        if random.random() < teleport_chance:
+            x, y = random.uniform(0, 512), random.uniform(0, 384)
+            press_in = press_delay
+        else:
+            x = min(max(x + random.gauss(0, 10), 0), 512)
+            y = min(max(y + random.gauss(0, 10), 0), 384)
+
+        if press_in is not None:
+            press_in -= delta
+
+            if press_in <= 0:
+                buttons = random.choice((1, 2, 5, 10))
+                press_in = None
+        elif random.random() < 0.08:
+            buttons = random.choice((0, 1, 2, 5, 10, 16))
+
+        frames.append((delta, time, x, y, buttons))
+
+    return frames
+
+def to_columns(frames: list[tuple]):
+    return replays.ReplayFrames(
+        delta=numpy.array([frame[0] for frame in frames], dtype=numpy.int64),
+        time=numpy.array([frame[1] for frame in frames], dtype=numpy.int64),
+        x=numpy.array([frame[2] for frame in frames], dtype=numpy.float64),
+        y=numpy.array([frame[3] for frame in frames], dtype=numpy.float64),
+        button_state=numpy.array([frame[4] for frame in frames], dtype=numpy.int64)
+    )
+
+def assert_equivalent(corpus_size: int = 500) -> None:
+    for index in range(corpus_size):
+        frames = generate_frames(
+            frame_count=random.choice((0, 1, 2, 50, 500, 3_000)),
+            teleport_chance=random.choice((0.0, 0.005, 0.05, 0.2)),
+            press_delay=random.choice((0, 20, 45, 200))
+        )
+        expected = detect_touchscreen_usage_python(frames)
+        result = replays.detect_touchscreen_usage(to_columns(frames))
+        assert result == expected, f'Replay #{index}: {result} != {expected}'
+
+def main() -> None:
+    assert_equivalent()
+
+    for size in (1_000, 10_000, 100_000):
+        frames = generate_frames(size, teleport_chance=0.05, press_delay=30)
+        columns = to_columns(frames)
+        iterations = max(5, 50_000 // size)
+
+        python_time = timeit.timeit(
+            lambda: detect_touchscreen_usage_python(frames),
+            number=iterations
+        ) / iterations
+        numpy_time = timeit.timeit(
+            lambda: replays.detect_touchscreen_usage(columns),
+            number=iterations
+        ) / iterations
+
+        print(
+            f'{size:>7} frames: '
+            f'python {python_time * 1e3:>8.2f}ms | '
+            f'numpy {numpy_time * 1e3:>8.2f}ms | '
+            f'{python_time / numpy_time:>5.1f}x'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Compare the numpy weighting engine with the previous pure python implementation
+
+Usage: python benchmarks/weighting.py
+"""
+
+from importlib.util import spec_from_file_location, module_from_spec
+from pathlib import Path
+
+import random
+import timeit
+
+def load_module(name: str, path: Path):
+    # Load the module directly, to avoid initializing the whole app
+    spec = spec_from_file_location(name, path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+weighting = load_module(
+    'weighting',
+    Path(__file__).parent.parent / 'app' / 'helpers' / 'weighting.py'
+)
+
+def calculate_weighted_pp(pp_values: list) -> float:
+    weighted_pp = sum(pp * 0.95**index for index, pp in enumerate(pp_values))
+    bonus_pp = 416.6667 * (1 - 0.9994 ** len(pp_values))
+    return weighted_pp + bonus_pp
+
+def calculate_weighted_acc(acc_values: list) -> float:
+    weighted_acc = sum(acc * 0.95**index for index, acc in enumerate(acc_values))
+    bonus_acc = 100.0 / (20 * (1 - 0.95 ** len(acc_values)))
+    return (weighted_acc * bonus_acc) / 100
+
+def main() -> None:
+    for size in (100, 1_000, 10_000):
+        pp_values = sorted((random.uniform(0, 700) for _ in range(size)), reverse=True)
+        acc_values = [random.uniform(0.7, 1.0) for _ in range(size)]
+        iterations = max(10, 100_000 // size)
+
+        assert abs(calculate_weighted_pp(pp_values) - weighting.weighted_pp(pp_values)) < 1e-6
+        assert abs(calculate_weighted_acc(acc_values) - weighting.weighted_acc(acc_values)) < 1e-9
+
+        python_time = timeit.timeit(
+            lambda: (calculate_weighted_pp(pp_values), calculate_weighted_acc(acc_values)),
+            number=iterations
+        ) / iterations
+        numpy_time = timeit.timeit(
+            lambda: (weighting.weighted_pp(pp_values), weighting.weighted_acc(acc_values)),
+            number=iterations
+        ) / iterations
+
+        print(
+            f'{size:>6} scores: '
+            f'python {python_time * 1e6:>10.1f}us | '
+            f'numpy {numpy_time * 1e6:>10.1f}us | '
+            f'{python_time / numpy_time:>5.1f}x'
+        )
+
+if __name__ == '__main__':
+    main()
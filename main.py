@@ -1,7 +1,46 @@
 
+from app.helpers import grade_counts, rank_index, ranked_score, whitelist
+
+import argparse
 import app
 
+def rebuild_rank_index() -> None:
+    with app.session.database.managed_session() as session:
+        count = rank_index.rebuild(session)
+
+    app.session.logger.info(f'Rebuilt rank index of {count} leaderboards.')
+
+def reconcile_grade_counts() -> None:
+    with app.session.database.managed_session() as session:
+        count = grade_counts.reconcile(session)
+
+    app.session.logger.info(f'Repaired grade counts of {count} players.')
+
+def reconcile_ranked_score() -> None:
+    with app.session.database.managed_session() as session:
+        count = ranked_score.reconcile(session)
+
+    app.session.logger.info(f'Repaired ranked score of {count} players.')
+
+def reload_whitelist() -> None:
+    whitelist.reload()
+    app.session.logger.info('Requested a whitelist reload from all workers.')
+
+commands = {
+    'rebuild-rank-index': rebuild_rank_index,
+    'reconcile-grade-counts': reconcile_grade_counts,
+    'reconcile-ranked-score': reconcile_ranked_score,
+    'reload-whitelist': reload_whitelist
+}
+
 def main():
+    parser = argparse.ArgumentParser(description='osu! client api')
+    parser.add_argument('command', nargs='?', choices=commands.keys())
+    args = parser.parse_args()
+
+    if args.command:
+        return commands[args.command]()
+
     app.run()
 
 if __name__ == "__main__":
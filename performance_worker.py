@@ -0,0 +1,167 @@
+"""Entry point of the pp calculation processes
+
+This module is imported by the calculation processes of every deck worker,
+and must not import the "app" package, since that would load the server,
+routes & database sessions into every one of them.
+"""
+
+from osu_native_py.wrapper.objects import Beatmap, Mod, ModsCollection, Ruleset, ScoreInfo
+from osu_native_py.wrapper.calculators import create_difficulty_calculator, create_performance_calculator
+from osu_native_py.wrapper.attributes.difficulty import (
+    DifficultyAttributes,
+    OsuDifficultyAttributes,
+    TaikoDifficultyAttributes,
+    CatchDifficultyAttributes,
+    ManiaDifficultyAttributes
+)
+from dataclasses import asdict
+from typing import Tuple
+
+import signal
+
+ATTRIBUTE_CLASSES = {
+    0: OsuDifficultyAttributes,
+    1: TaikoDifficultyAttributes,
+    2: CatchDifficultyAttributes,
+    3: ManiaDifficultyAttributes
+}
+
+# Acronyms of the legacy mod bits, inside of the mods collection of a calculation
+LEGACY_MODS = {
+    1 << 0: 'NF',
+    1 << 1: 'EZ',
+    1 << 3: 'HD',
+    1 << 4: 'HR',
+    1 << 5: 'SD',
+    1 << 6: 'DT',
+    1 << 7: 'RX',
+    1 << 8: 'HT',
+    1 << 9: 'NC',
+    1 << 10: 'FL',
+    1 << 12: 'SO',
+    1 << 13: 'AP',
+    1 << 14: 'PF',
+    1 << 15: '4K',
+    1 << 16: '5K',
+    1 << 17: '6K',
+    1 << 18: '7K',
+    1 << 19: '8K',
+    1 << 20: 'FI',
+    1 << 24: '9K',
+    1 << 26: '1K',
+    1 << 27: '3K',
+    1 << 28: '2K'
+}
+
+def initialize() -> None:
+    # Shutdown is handled by the parent process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def calculate_ppv2(
+    score: dict,
+    beatmap_file: bytes,
+    attributes: dict | None
+) -> Tuple[float, dict]:
+    """Calculate the ppv2 of a score, from the cached difficulty attributes if given"""
+    ruleset = Ruleset.from_id(score['mode'])
+    beatmap = Beatmap.from_text(beatmap_file.decode('utf-8', errors='ignore'))
+    mods = mods_collection(score['mods'], score['touchscreen'])
+
+    difficulty = (
+        difficulty_attributes(score['mode'], attributes)
+        if attributes is not None else
+        create_difficulty_calculator(ruleset, beatmap).calculate(mods)
+    )
+
+    result = create_performance_calculator(ruleset).calculate(
+        ruleset,
+        beatmap,
+        mods,
+        score_info(score),
+        difficulty
+    )
+
+    return result.total, asdict(difficulty)
+
+def mods_collection(mods: int, touchscreen: bool) -> ModsCollection:
+    acronyms = [
+        acronym for bit, acronym in LEGACY_MODS.items()
+        if mods & bit
+    ]
+
+    # Nightcore & perfect are sent together with the mods they extend
+    if 'NC' in acronyms and 'DT' in acronyms:
+        acronyms.remove('DT')
+
+    if 'PF' in acronyms and 'SD' in acronyms:
+        acronyms.remove('SD')
+
+    # Touch devices are flagged by the score, since old clients use this bit for "NoVideo"
+    if touchscreen:
+        acronyms.append('TD')
+
+    # Scores from stable are calculated with the "classic" mod
+    acronyms.append('CL')
+
+    collection = ModsCollection.create()
+
+    for acronym in acronyms:
+        collection.add(Mod.create(acronym))
+
+    return collection
+
+def score_info(score: dict) -> ScoreInfo:
+    statistics = {
+        0: dict(
+            count_great=score['n300'],
+            count_ok=score['n100'],
+            count_meh=score['n50']
+        ),
+        1: dict(
+            count_great=score['n300'],
+            count_ok=score['n100']
+        ),
+        2: dict(
+            count_great=score['n300'],
+            count_large_tick_hit=score['n100'],
+            count_small_tick_hit=score['n50'],
+            count_small_tick_miss=score['nKatu']
+        ),
+        3: dict(
+            count_perfect=score['nGeki'],
+            count_great=score['n300'],
+            count_good=score['nKatu'],
+            count_ok=score['n100'],
+            count_meh=score['n50']
+        )
+    }
+
+    return ScoreInfo(
+        max_combo=score['max_combo'],
+        accuracy=score['acc'],
+        count_miss=score['nMiss'],
+        legacy_total_score=score['total_score'],
+        **statistics[score['mode']]
+    )
+
+def difficulty_attributes(mode: int, attributes: dict) -> DifficultyAttributes:
+    return ATTRIBUTE_CLASSES[mode](**attributes)
+
+FUNCTIONS = {
+    'ppv2': calculate_ppv2
+}
+
+def serve(connection) -> None:
+    """Run the calculations that are sent by the parent, until the connection gets closed"""
+    initialize()
+
+    while True:
+        try:
+            function, args = connection.recv()
+        except (EOFError, OSError):
+            return
+
+        try:
+            connection.send((True, FUNCTIONS[function](*args)))
+        except Exception as e:
+            connection.send((False, f'{e.__class__.__name__}: {e}'))